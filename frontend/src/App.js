@@ -7,6 +7,8 @@ import './App.css';
 Chart.register(BarController, BarElement, LinearScale, CategoryScale, Tooltip, Legend);
 
 const API_URL = 'http://localhost:8000/api';
+// Изображения анализа приходят ссылками /api/artifacts/{id}
+const artifactUrl = (path) => `${API_URL.replace(/\/api$/, '')}${path}`;
 
 const DIAGNOSIS_TRANSLATIONS = {
   'MildDemented': 'Легкая степень',
@@ -437,7 +439,7 @@ const { getRootProps, getInputProps, isDragActive } = useDropzone({
                       style={{ width: '224px', height: '224px', objectFit: 'cover' }}
                     />
                     <img 
-                      src={`data:image/jpeg;base64,${results.interpretation.additional_info.heatmap_img}`} 
+                      src={artifactUrl(results.interpretation.additional_info.heatmap_url)} 
                       alt="Grad-CAM" 
                       className="heatmap-overlay"
                       style={{ 
@@ -467,12 +469,12 @@ const { getRootProps, getInputProps, isDragActive } = useDropzone({
               </div>
 
               {/* Блок LIME */}
-              {results.interpretation.additional_info.lime_img && (
+              {results.interpretation.additional_info.lime_url && (
                 <div className="lime-block">
                   <div className="lime-container">
-                    <div className="image-wrapper" onClick={() => handleImageClick(`data:image/jpeg;base64,${results.interpretation.additional_info.lime_img}`)}>
+                    <div className="image-wrapper" onClick={() => handleImageClick(artifactUrl(results.interpretation.additional_info.lime_url))}>
                       <img 
-                        src={`data:image/jpeg;base64,${results.interpretation.additional_info.lime_img}`} 
+                        src={artifactUrl(results.interpretation.additional_info.lime_url)} 
                         alt="LIME объяснение"
                         style={{ width: '224px', height: '224px', objectFit: 'cover' }}
                       />
@@ -53,8 +53,8 @@ describe('App Component', () => {
                     findings: ['Test finding'],
                     recommendations: ['Test recommendation'],
                     additional_info: {
-                        heatmap_img: 'base64_encoded_image',
-                        lime_img: 'base64_encoded_image'
+                        heatmap_url: '/api/artifacts/heatmap-0123456789abcdef0123456789abcdef',
+                        lime_url: '/api/artifacts/lime-0123456789abcdef0123456789abcdef'
                     }
                 }
             }
@@ -156,8 +156,8 @@ describe('App Component', () => {
                 findings: ['Test finding'],
                 recommendations: ['Test recommendation'],
                 additional_info: {
-                    heatmap_img: 'base64_encoded_image',
-                    lime_img: 'base64_encoded_image'
+                    heatmap_url: '/api/artifacts/heatmap-0123456789abcdef0123456789abcdef',
+                    lime_url: '/api/artifacts/lime-0123456789abcdef0123456789abcdef'
                 }
             }
         };
@@ -1,24 +1,36 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
-from fastapi_cache.decorator import cache
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
-import hashlib
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Path, Query, Request, Response
+import asyncio
 import logging
 import json
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
 from app.services.analysis_pipeline import AnalysisPipeline
-from app.schemas.predictions import PredictionResult, ClassificationResult
+from app.services.analysis_plan import AnalysisPlan, INCLUDE_OPTIONS
+from app.schemas.predictions import PredictionResult, ClassificationResult, AttributionMethod, ResultView
 from app.schemas.dicom import DicomExportData
+from app.schemas.jobs import JobInfo
+from app.core.config import settings
 from app.core.exceptions import (
     MRIAnalysisError,
     InvalidImageError,
     ModelProcessingError,
     ImageSizeError,
-    CacheError
+    CacheError,
+    ResultNotFoundError
 )
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 import os
 import tempfile
 from app.services.dicom_handler import DicomHandler
+from app.services.content_hash import read_upload, DIGEST_PATTERN
+from app.services.result_cache import result_cache
+from app.services.cache_namespace import current_namespace, result_cache_key
+from app.services.cache_metrics import cache_metrics, key_counts, redis_info, scan_key_counts, to_prometheus
+from app.services.single_flight import single_flight
+from app.services.job_queue import Job, job_manager
+from app.services.batch_classify import BatchClassifier, as_analysis_error, iter_batch_items
+from app.services.stage_cache import stage_cache
+from app.services.artifact_store import ArtifactStore, artifact_store, ARTIFACT_ID_PATTERN
 from datetime import datetime
 
 # Настройка логирования
@@ -28,44 +40,108 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 dicom_handler = DicomHandler()
 
-def get_file_hash(file: UploadFile) -> str:
-    """Получение хэша файла для кэширования"""
+async def get_file_hash(file: UploadFile) -> Tuple[bytes, str, str]:
+    """Чтение файла и получение ключа кэша по хэшу всего содержимого
+    
+    Returns:
+        Tuple[bytes, str, str]: Содержимое файла (переиспользуется без повторного чтения),
+            хэш содержимого и ключ кэша
+    """
     try:
-        # Читаем первые 1024 байта для хэширования
-        chunk = file.file.read(1024)
-        file.file.seek(0)  # Возвращаем указатель в начало
-        cache_key = f"mri:{hashlib.md5(chunk).hexdigest()}"
+        # Хэш считается по всему файлу во время чтения загрузки
+        contents, digest = await read_upload(file)
+        cache_key = result_cache_key(digest)
         logger.info(f"Generated cache key: {cache_key}")
-        return cache_key
+        return contents, digest, cache_key
     except Exception as e:
         logger.error(f"Error generating file hash: {str(e)}")
         raise CacheError(f"Failed to generate cache key: {str(e)}")
 
-@router.post("/analyze", response_model=PredictionResult)
-async def analyze_mri(file: UploadFile = File(...)):
-    """Полный анализ МРТ (классификация + интерпретация)"""
+def format_stream_event(event: Dict[str, Any], ndjson: bool) -> str:
+    """Событие потокового анализа в формате SSE или NDJSON"""
+    payload = json.dumps(event, ensure_ascii=False)
+    if ndjson:
+        return payload + "\n"
+    return f"event: {event['event']}\ndata: {payload}\n\n"
+
+async def fetch_analysis(digest: str, attribution: AttributionMethod,
+                         plan: AnalysisPlan) -> Optional[Dict[str, Any]]:
+    """Готовый результат анализа из кэша (None при промахе)"""
+    # Запись только с классификацией (после /classify) не считается полным анализом
+    cached = await result_cache.get(result_cache_key(digest, attribution, plan))
+    if (cached is None or "classification" not in cached) and not plan.is_full:
+        # Частичный ответ можно вырезать из уже готового полного анализа
+        cached = await result_cache.get(result_cache_key(digest, attribution))
+        if cached is not None and "classification" in cached:
+            cached = plan.project(cached)
+    # Вытесненные из хранилища изображения пересоздаются из кэша этапов (проверка файлов - в потоке)
+    if cached is not None and "classification" in cached and not await asyncio.to_thread(artifact_store.missing, cached):
+        return cached
+    return None
+
+async def compute_analysis(contents: bytes, digest: str, attribution: AttributionMethod,
+                           plan: AnalysisPlan, scope: str = "endpoint:analyze") -> Dict[str, Any]:
+    """Анализ с записью в кэш; одинаковые одновременные запросы ждут одно вычисление"""
+    cache_key = result_cache_key(digest, attribution, plan)
+    
+    async def compute():
+        # Уже вычисленные этапы (например, классификация) возьмутся из кэша этапов
+        result = await AnalysisPipeline.process_image(contents, attribution.value, digest, plan)
+        
+        # Преобразуем результат в словарь для корректной сериализации
+        result_dict = dict(result)
+        
+        # Сохраняем в кэш
+        cache_metrics.write(scope, await result_cache.set(cache_key, result_dict))
+        logger.info(f"Result cached for key: {cache_key}")
+        return result_dict
+    
+    # Ожидающие (в том числе в других воркерах) опрашивают кэш
+    return await single_flight.do(cache_key, compute, lambda: fetch_analysis(digest, attribution, plan))
+
+def parse_plan(include: Optional[str], attribution: Optional[AttributionMethod]) -> Tuple[AnalysisPlan, AttributionMethod]:
+    """План анализа по include= и attribution=; ошибки параметров - 422"""
+    try:
+        plan = AnalysisPlan.parse(include, attribution.value if attribution else None)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return plan, AttributionMethod(plan.attribution) if plan.attribution else AttributionMethod.LIME
+
+@router.post("/analyze", response_model=PredictionResult, response_model_exclude_none=True)
+async def analyze_mri(
+    file: UploadFile = File(...),
+    attribution: Optional[AttributionMethod] = None,
+    include: Optional[str] = Query(
+        None, description="Части ответа через запятую: " + ",".join(INCLUDE_OPTIONS)
+    )
+):
+    """Полный анализ МРТ (классификация + интерпретация)
+    
+    Args:
+        file: Загруженный файл (JPG)
+        attribution: Метод попиксельного объяснения: lime (по умолчанию) или более
+            быстрые градиентные integrated_gradients / smoothgrad
+        include: Только нужные части ответа, например gradcam или gradcam,lime,lime_img;
+            невостребованные этапы (прежде всего LIME) не вычисляются. Классификация
+            возвращается всегда
+    """
+    plan, attribution = parse_plan(include, attribution)
+    
     try:
         if not file.content_type == 'image/jpeg':
             raise InvalidImageError("Загруженный файл должен быть в формате JPG")
 
         try:
             # Проверяем кэш перед обработкой
-            cache_key = get_file_hash(file)
+            contents, digest, _ = await get_file_hash(file)
+            cache_key = result_cache_key(digest, attribution, plan)
             logger.info(f"Checking cache for key: {cache_key}")
             
-            # Пытаемся получить результат из кэша
-            backend = FastAPICache.get_backend()
-            cached_result = await backend.get(cache_key)
-            if cached_result:
+            # Пытаемся получить результат из кэша (локальный LRU, затем Redis)
+            cached_data = await fetch_analysis(digest, attribution, plan)
+            cache_metrics.record("endpoint:analyze", cached_data is not None)
+            if cached_data is not None:
                 logger.info(f"Cache hit for key: {cache_key}")
-                cached_data = json.loads(cached_result)
-                # Если в кэше только классификация, делаем полный анализ
-                if "classification" not in cached_data:
-                    logger.info("Cache contains only classification, performing full analysis...")
-                    result = await AnalysisPipeline.process_image(file)
-                    result_dict = dict(result)
-                    await backend.set(cache_key, json.dumps(result_dict), expire=3600)
-                    return result_dict
                 return cached_data
             
             logger.info(f"Cache miss for key: {cache_key}, processing image...")
@@ -73,29 +149,18 @@ async def analyze_mri(file: UploadFile = File(...)):
             
             # Сохраняем временную копию для отладки
             temp_path = f"/tmp/debug_analyze_{file.filename}"
-            contents = await file.read()
             with open(temp_path, 'wb') as f:
                 f.write(contents)
             logger.info(f"Saved debug copy to {temp_path}")
             
-            # Возвращаем указатель в начало файла
-            await file.seek(0)
-            
-            result = await AnalysisPipeline.process_image(file)
-            
-            # Преобразуем результат в словарь для корректной сериализации
-            result_dict = dict(result)
-            
-            # Сохраняем в кэш
-            await backend.set(cache_key, json.dumps(result_dict), expire=3600)
-            logger.info(f"Result cached for key: {cache_key}")
-            
-            return result_dict
+            return await compute_analysis(contents, digest, attribution, plan)
             
         except ValueError as ve:
             if "size" in str(ve).lower():
                 raise ImageSizeError(str(ve))
             raise InvalidImageError(str(ve))
+        except MRIAnalysisError:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при обработке изображения: {str(e)}", exc_info=True)
             raise ModelProcessingError(f"Ошибка при обработке изображения: {str(e)}")
@@ -112,7 +177,7 @@ async def analyze_mri(file: UploadFile = File(...)):
             detail=f"Произошла непредвиденная ошибка: {str(e)}"
         )
 
-@router.post("/classify", response_model=ClassificationResult)
+@router.post("/classify", response_model=ClassificationResult, response_model_exclude_none=True)
 async def classify_mri(file: UploadFile = File(...)):
     """Только классификация МРТ без интерпретации"""
     try:
@@ -121,22 +186,24 @@ async def classify_mri(file: UploadFile = File(...)):
 
         try:
             # Проверяем кэш перед обработкой
-            cache_key = get_file_hash(file)
+            contents, digest, cache_key = await get_file_hash(file)
             logger.info(f"Checking cache for key: {cache_key}")
             
-            # Пытаемся получить результат из кэша
-            backend = FastAPICache.get_backend()
-            cached_result = await backend.get(cache_key)
-            if cached_result:
+            # Пытаемся получить результат из кэша (локальный LRU, затем Redis)
+            cached_data = await result_cache.get(cache_key)
+            cache_metrics.record("endpoint:classify", cached_data is not None)
+            if cached_data is not None:
                 logger.info(f"Cache hit for key: {cache_key}")
-                cached_data = json.loads(cached_result)
                 # Если в кэше полный анализ, берем только часть с классификацией
                 if "classification" in cached_data:
                     return cached_data["classification"]
                 return cached_data
             
             logger.info(f"Cache miss for key: {cache_key}, processing image...")
-            result = await AnalysisPipeline.classify_image(file)
+            result = await AnalysisPipeline.classify_image(contents, digest, near_duplicates=True)
+            if "near_duplicate_of" in result:
+                # Ответ другого снимка не кэшируется как результат этого
+                return result
             
             # Преобразуем результат в словарь для корректной сериализации
             result_dict = {
@@ -147,7 +214,7 @@ async def classify_mri(file: UploadFile = File(...)):
             }
             
             # Сохраняем в кэш
-            await backend.set(cache_key, json.dumps(result_dict), expire=3600)
+            cache_metrics.write("endpoint:classify", await result_cache.set(cache_key, result_dict))
             logger.info(f"Result cached for key: {cache_key}")
             
             return result_dict
@@ -156,6 +223,8 @@ async def classify_mri(file: UploadFile = File(...)):
             if "size" in str(ve).lower():
                 raise ImageSizeError(str(ve))
             raise InvalidImageError(str(ve))
+        except MRIAnalysisError:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при классификации: {str(e)}", exc_info=True)
             raise ModelProcessingError(f"Ошибка при классификации: {str(e)}")
@@ -172,6 +241,383 @@ async def classify_mri(file: UploadFile = File(...)):
             detail=f"Произошла непредвиденная ошибка: {str(e)}"
         )
 
+@router.post("/classify/batch")
+async def classify_mri_batch(request: Request, files: List[UploadFile] = File(...)):
+    """Классификация многих МРТ за один запрос
+    
+    Принимает несколько изображений (JPG/PNG) и/или архивов zip и tar
+    (в т.ч. .tar.gz). Результаты выдаются потоком, как в /analyze/stream
+    (SSE или NDJSON по Accept): событие item на каждый файл (classification
+    или error), затем study - агрегат по исследованию (каталогу в архиве) и
+    summary. Уже классифицированные изображения берутся из кэша.
+    """
+    ndjson = "application/x-ndjson" in request.headers.get("accept", "")
+    items = iter_batch_items((file.filename, file.content_type, file.file) for file in files)
+    
+    async def events():
+        try:
+            async for event in BatchClassifier().classify(items):
+                yield format_stream_event(event, ndjson)
+        except Exception as e:
+            # Ошибка всего пакета (например, слишком много файлов) - последним событием
+            error = as_analysis_error(e)
+            data = {"status_code": error.status_code, "detail": error.detail, "error_code": error.error_code}
+            yield format_stream_event({"event": "error", "data": data}, ndjson)
+    
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson" if ndjson else "text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def find_cached_result(digest: str, view: ResultView,
+                             attribution: AttributionMethod) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Результат из кэша без загрузки файла
+    
+    Returns:
+        Tuple[Optional[Dict[str, Any]], str]: Результат (None при промахе) и ключ кэша, по которому он найден
+    """
+    cache_key = result_cache_key(digest, attribution)
+    if view == ResultView.ANALYSIS:
+        cached = await result_cache.get(cache_key)
+        if cached is not None and "classification" in cached and not await asyncio.to_thread(artifact_store.missing, cached):
+            return cached, cache_key
+        return None, cache_key
+    
+    # Классификация: запись /classify, часть полного анализа или вероятности из кэша этапов
+    cache_key = result_cache_key(digest)
+    cached = await result_cache.get(cache_key)
+    if cached is not None:
+        return cached.get("classification", cached), cache_key
+    predictions = await stage_cache.get_array("probabilities", digest)
+    if predictions is not None:
+        return AnalysisPipeline.build_classification(predictions), cache_key
+    return None, cache_key
+
+def matches_etag(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка заголовка If-None-Match (список ETag или *)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Слабое сравнение: W/"x" совпадает с "x"
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+@router.api_route("/results/{digest}", methods=["GET", "HEAD"])
+async def get_result(
+    request: Request,
+    digest: str = Path(..., pattern=DIGEST_PATTERN),
+    view: ResultView = ResultView.ANALYSIS,
+    attribution: AttributionMethod = AttributionMethod.LIME
+):
+    """Результат анализа по хэшу содержимого без загрузки файла
+    
+    Клиент вычисляет digest локально (hex(blake2b(data, digest_size=16)) + "-" + len(data))
+    и загружает файл в /analyze или /classify только при 404. HEAD проверяет наличие
+    результата без тела ответа; If-None-Match с прежним ETag возвращает 304.
+    
+    Args:
+        digest: Идентификатор содержимого файла
+        view: analysis (полный анализ) или classification
+        attribution: Метод объяснения, с которым выполнялся анализ
+    """
+    result, _ = await find_cached_result(digest, view, attribution)
+    cache_metrics.record("endpoint:results", result is not None)
+    if result is None:
+        raise ResultNotFoundError()
+    
+    # ETag - хэш самого тела: запись под тем же ключом может быть пересчитана
+    # (истек TTL, вытеснение, новые URL артефактов), и тело изменится
+    body = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if matches_etag(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if request.method == "HEAD":
+        # Те же заголовки, что у GET: клиенты проверяют по HEAD размер и ETag
+        return Response(status_code=200, headers={**headers, "Content-Length": str(len(body))},
+                        media_type="application/json")
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.post("/analyze/stream")
+async def analyze_mri_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    attribution: Optional[AttributionMethod] = None,
+    include: Optional[str] = Query(
+        None, description="Части ответа через запятую: " + ",".join(INCLUDE_OPTIONS)
+    )
+):
+    """Анализ МРТ с выдачей каждого этапа по мере готовности
+    
+    События: classification, heatmap, lime (признаки), lime_img или attribution
+    и итоговое result с тем же телом, что у /analyze. Каждое событие содержит
+    stage_ms (время этапа) и elapsed_ms (время с начала анализа). Формат -
+    Server-Sent Events (text/event-stream), с Accept: application/x-ndjson -
+    NDJSON. Ошибка после начала потока передается событием error.
+    Одинаковые одновременные запросы считаются один раз: остальные получают
+    события готового результата, как при попадании в кэш.
+    Параметры attribution и include - как в /analyze.
+    """
+    plan, attribution = parse_plan(include, attribution)
+    if not file.content_type == 'image/jpeg':
+        raise InvalidImageError("Загруженный файл должен быть в формате JPG")
+    
+    contents, digest, _ = await get_file_hash(file)
+    cache_key = result_cache_key(digest, attribution, plan)
+    cached = await fetch_analysis(digest, attribution, plan)
+    cache_metrics.record("endpoint:analyze_stream", cached is not None)
+    ndjson = "application/x-ndjson" in request.headers.get("accept", "")
+    
+    async def events():
+        try:
+            if cached is not None:
+                for event in AnalysisPipeline.result_events(cached):
+                    yield format_stream_event(event, ndjson)
+                return
+            
+            # События этапов получает только запрос, который ведет вычисление;
+            # одновременные одинаковые запросы ждут его результат (single-flight)
+            queue: asyncio.Queue = asyncio.Queue()
+            leader = False
+            
+            async def compute():
+                nonlocal leader
+                leader = True
+                result = None
+                async for event in AnalysisPipeline.stream_analysis(contents, attribution.value, digest, plan):
+                    if event["event"] == "result":
+                        result = event["data"]
+                        try:
+                            size = await result_cache.set(cache_key, result)
+                            cache_metrics.write("endpoint:analyze_stream", size)
+                        except Exception as e:
+                            logger.warning(f"Failed to cache streamed result {cache_key}: {str(e)}")
+                    queue.put_nowait(event)
+                return result
+            
+            flight = asyncio.ensure_future(
+                single_flight.do(cache_key, compute, lambda: fetch_analysis(digest, attribution, plan))
+            )
+            try:
+                while True:
+                    getter = asyncio.ensure_future(queue.get())
+                    await asyncio.wait({getter, flight}, return_when=asyncio.FIRST_COMPLETED)
+                    if not getter.done():
+                        getter.cancel()
+                        break
+                    yield format_stream_event(getter.result(), ndjson)
+                while not queue.empty():
+                    yield format_stream_event(queue.get_nowait(), ndjson)
+                result = flight.result()
+                if not leader:
+                    for event in AnalysisPipeline.result_events(result):
+                        yield format_stream_event(event, ndjson)
+            finally:
+                # Вычисление идет в задаче single-flight и доводится до кэша без этого клиента
+                flight.cancel()
+        except Exception as e:
+            # Статус ответа уже отправлен: ошибка передается последним событием
+            error = e
+            if isinstance(e, ValueError):
+                error = ImageSizeError(str(e)) if "size" in str(e).lower() else InvalidImageError(str(e))
+            elif not isinstance(e, MRIAnalysisError):
+                logger.error(f"Ошибка при потоковом анализе: {str(e)}", exc_info=True)
+                error = ModelProcessingError(f"Ошибка при обработке изображения: {str(e)}")
+            data = {"status_code": error.status_code, "detail": error.detail, "error_code": error.error_code}
+            yield format_stream_event({"event": "error", "data": data}, ndjson)
+    
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson" if ndjson else "text/event-stream",
+        # Прокси не должен буферизовать поток
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def run_analysis_job(job: Job, contents: bytes) -> Dict[str, Any]:
+    """Выполнение задачи /jobs тем же путем, что /analyze"""
+    plan, attribution = parse_plan(job.include, AttributionMethod(job.attribution) if job.attribution else None)
+    cached = await fetch_analysis(job.digest, attribution, plan)
+    cache_metrics.record("endpoint:jobs", cached is not None)
+    if cached is not None:
+        return cached
+    try:
+        return await compute_analysis(contents, job.digest, attribution, plan, scope="endpoint:jobs")
+    except ValueError as ve:
+        if "size" in str(ve).lower():
+            raise ImageSizeError(str(ve))
+        raise InvalidImageError(str(ve))
+
+@router.post("/jobs", status_code=202, response_model=JobInfo, response_model_exclude_none=True)
+async def submit_job(
+    response: Response,
+    file: UploadFile = File(...),
+    attribution: Optional[AttributionMethod] = None,
+    include: Optional[str] = Query(
+        None, description="Части ответа через запятую: " + ",".join(INCLUDE_OPTIONS)
+    ),
+    priority: int = Query(0, ge=-10, le=10, description="Задачи с большим приоритетом выполняются раньше"),
+    deadline: Optional[float] = Query(None, gt=0, description="Сколько секунд результат нужен клиенту")
+):
+    """Асинхронный анализ МРТ: задача ставится в очередь, ответ - сразу
+    
+    Статус и результат - GET /jobs/{id}, отмена - DELETE /jobs/{id}.
+    Параметры attribution и include - как в /analyze.
+    """
+    plan, attribution = parse_plan(include, attribution)
+    if not file.content_type == 'image/jpeg':
+        raise InvalidImageError("Загруженный файл должен быть в формате JPG")
+    
+    contents, digest, _ = await get_file_hash(file)
+    job = await job_manager.submit(
+        contents, digest, attribution=plan.attribution, include=include,
+        priority=priority, deadline=deadline
+    )
+    response.headers["Location"] = f"/api/jobs/{job.id}"
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}", response_model=JobInfo, response_model_exclude_none=True)
+async def get_job(job_id: str):
+    """Статус задачи анализа и результат после выполнения"""
+    return (await job_manager.get(job_id)).to_dict()
+
+@router.delete("/jobs/{job_id}", response_model=JobInfo, response_model_exclude_none=True)
+async def cancel_job(job_id: str):
+    """Отмена задачи; для завершенной задачи возвращается ее итоговый статус"""
+    return (await job_manager.cancel(job_id)).to_dict()
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Границы [start, end] из заголовка Range (один диапазон байтов)
+    
+    Returns:
+        Optional[Tuple[int, int]]: Границы включительно; None, если заголовок не поддерживается
+            и нужно вернуть файл целиком
+    
+    Raises:
+        ValueError: Диапазон не пересекается с файлом (416)
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+    start_text, sep, end_text = ranges.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # bytes=-N: последние N байт
+            start, end = max(size - int(end_text), 0), size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise ValueError(f"Range {range_header} not satisfiable for {size} bytes")
+    return start, min(end, size - 1)
+
+@router.api_route("/artifacts/{artifact_id}", methods=["GET", "HEAD"])
+async def get_artifact(
+    request: Request,
+    artifact_id: str = Path(..., pattern=ARTIFACT_ID_PATTERN)
+):
+    """Изображение анализа (heatmap, LIME, градиентное объяснение) по идентификатору
+    
+    Содержимое артефакта определяется его идентификатором и не меняется,
+    поэтому ответ кэшируется браузером надолго. Поддерживаются If-None-Match
+    и Range с одним диапазоном.
+    """
+    # Файловые операции (и первое чтение индекса с диска) - вне event loop
+    path = await asyncio.to_thread(artifact_store.path, artifact_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    
+    etag = '"' + artifact_id.partition("-")[2] + '"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={settings.ARTIFACT_MAX_AGE}, immutable",
+        "Accept-Ranges": "bytes"
+    }
+    if matches_etag(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    try:
+        data = await asyncio.to_thread(path.read_bytes)
+    except FileNotFoundError:
+        # Вытеснен между проверкой и чтением
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    media_type = ArtifactStore.media_type(artifact_id)
+    
+    status_code = 200
+    range_header = request.headers.get("range")
+    # If-Range с другим ETag - отдаем файл целиком
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            bounds = parse_range(range_header, len(data))
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+        if bounds is not None:
+            start, end = bounds
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+            data = data[start:end + 1]
+            status_code = 206
+    
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(len(data))
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return Response(content=data, status_code=status_code, headers=headers, media_type=media_type)
+
+async def collect_cache_stats(scan_keys: bool = True) -> Dict[str, Any]:
+    """Состояние кэша: попадания по областям, локальный LRU, INFO Redis и число ключей
+    
+    Args:
+        scan_keys: Посчитать ключи полным SCAN; иначе - последний фоновый подсчет
+    """
+    redis = result_cache.redis
+    if redis is None:
+        raise CacheError("Result cache is not initialized")
+    namespace = current_namespace()
+    try:
+        info = await redis_info(redis)
+        if scan_keys:
+            keys = await scan_key_counts(redis, namespace)
+            key_counts.update(keys)
+        else:
+            keys = key_counts.get(redis, namespace)
+    except Exception as e:
+        logger.error(f"Error collecting cache stats: {str(e)}")
+        raise CacheError(f"Failed to collect cache stats: {str(e)}")
+    return {
+        "namespace": namespace,
+        "worker_id": result_cache.worker_id,
+        "scopes": cache_metrics.snapshot(),
+        "local": {
+            "entries": len(result_cache.local),
+            "bytes": result_cache.local.size,
+            "max_bytes": result_cache.local.max_bytes,
+            "evictions": result_cache.local.evictions
+        },
+        "redis": info,
+        "keys": keys
+    }
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Статистика кэша для подбора его размера
+    
+    Счетчики попаданий ведутся в каждом воркере отдельно; число ключей
+    считается инкрементальным SCAN и не блокирует Redis.
+    """
+    return await collect_cache_stats()
+
+@router.get("/cache/metrics")
+async def cache_metrics_endpoint():
+    """Те же данные, что /cache/stats, в формате Prometheus
+    
+    Число ключей не пересчитывается на каждый скрейп: отдается последний
+    подсчет, обновляемый в фоне раз в CACHE_KEY_COUNT_INTERVAL секунд.
+    """
+    stats = await collect_cache_stats(scan_keys=False)
+    return PlainTextResponse(to_prometheus(stats), media_type="text/plain; version=0.0.4")
+
 @router.post("/export/dicom")
 async def export_to_dicom(
     file: UploadFile = File(...),
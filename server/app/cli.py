@@ -0,0 +1,209 @@
+"""Командная строка сервиса
+
+Прогрев кэша результатов для исследований, которые будут просматриваться:
+    python -m app.cli warm /data/studies
+    python -m app.cli warm studies.zip --mode classify --rate 5
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from redis import asyncio as aioredis
+from app.core.config import settings
+from app.schemas.predictions import AttributionMethod
+from app.services.analysis_pipeline import AnalysisPipeline
+from app.services.artifact_store import artifact_store
+from app.services.cache_namespace import result_cache_key
+from app.services.content_hash import content_digest
+from app.services.inference_executor import shutdown_inference_executor
+from app.services.result_cache import result_cache
+from app.services.single_flight import single_flight
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+@dataclass
+class WarmStats:
+    """Итоги прогрева"""
+    processed: int = 0
+    cached: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f"processed {self.processed}, already cached {self.cached}, failed {self.failed} "
+                f"in {self.elapsed:.1f} s ({self.throughput:.2f} images/s)")
+
+
+def iter_images(path: str) -> Iterator[Tuple[str, bytes]]:
+    """Изображения из каталога (рекурсивно) или zip-архива по одному, без загрузки всех в память"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield info.filename, archive.read(info)
+        return
+
+    if not os.path.isdir(path):
+        raise ValueError(f"{path} is neither a directory nor a zip archive")
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                file_path = os.path.join(root, name)
+                with open(file_path, "rb") as f:
+                    yield file_path, f.read()
+
+
+class RateLimiter:
+    """Не больше rate запусков в секунду (равномерно), чтобы не вытеснять живой трафик"""
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+            self._next = max(now, self._next) + self.interval
+
+
+async def warm(path: str, mode: str = "analyze", attribution: AttributionMethod = AttributionMethod.LIME,
+               workers: Optional[int] = None, rate: Optional[float] = None) -> WarmStats:
+    """Вычисление и запись в кэш результатов для всех изображений из path
+
+    Результаты пишутся под теми же ключами, что читают /analyze и /classify.
+    Уже закэшированные изображения пропускаются, поэтому прерванный прогрев
+    можно просто запустить заново. Прогрев идет в отдельном процессе со своим
+    пулом инференса и не видит нагрузку API: ее ограничивает только rate.
+
+    Args:
+        path: Каталог или zip-архив с JPG/PNG
+        mode: analyze (полный анализ) или classify
+        attribution: Метод объяснения для analyze
+        workers: Число одновременно обрабатываемых изображений
+        rate: Ограничение изображений в секунду (None - без ограничения)
+    """
+    workers = workers or settings.INFERENCE_WORKERS
+    limiter = RateLimiter(rate)
+    stats = WarmStats()
+    # Очередь ограничена: изображения читаются по мере обработки
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+
+    async def process(name: str, contents: bytes):
+        digest = content_digest(contents)
+        cache_key = result_cache_key(digest, attribution if mode == "analyze" else AttributionMethod.LIME)
+        cached = await result_cache.get(cache_key)
+        complete = cached is not None and (mode == "classify" or "classification" in cached)
+        if complete and (mode == "classify" or not await asyncio.to_thread(artifact_store.missing, cached)):
+            stats.cached += 1
+            return
+
+        await limiter.wait()
+        if mode == "classify":
+            # Одиночные запросы воркеров собираются в батчи BatchScheduler
+            result = await AnalysisPipeline.classify_image(contents, digest)
+            await result_cache.set(cache_key, result)
+        else:
+            async def compute():
+                result = dict(await AnalysisPipeline.process_image(contents, attribution.value, digest))
+                await result_cache.set(cache_key, result)
+                return result
+
+            async def fetch():
+                cached = await result_cache.get(cache_key)
+                if cached is not None and "classification" in cached and not await asyncio.to_thread(artifact_store.missing, cached):
+                    return cached
+                return None
+
+            # Не дублируем анализ, который уже идет в живом запросе
+            await single_flight.do(cache_key, compute, fetch)
+        stats.processed += 1
+        logger.info(f"Warmed {name} ({digest})")
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                try:
+                    await process(*item)
+                except Exception as e:
+                    stats.failed += 1
+                    logger.error(f"Failed to warm {item[0]}: {str(e)}")
+            finally:
+                queue.task_done()
+
+    start = time.perf_counter()
+    tasks = [asyncio.ensure_future(worker()) for _ in range(workers)]
+    try:
+        for item in iter_images(path):
+            await queue.put(item)
+    finally:
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+        stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+async def init_cache():
+    """Подключение к Redis так же, как при старте API"""
+    redis = aioredis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True, socket_timeout=5)
+    await redis.ping()
+    FastAPICache.init(RedisBackend(redis), prefix="alzheimer-cache", expire=settings.CACHE_TTL)
+    result_cache.init(aioredis.from_url(settings.REDIS_URL, socket_timeout=5))
+
+
+async def run_warm(args) -> WarmStats:
+    await init_cache()
+    try:
+        return await warm(
+            args.path, mode=args.mode, attribution=AttributionMethod(args.attribution),
+            workers=args.workers, rate=args.rate
+        )
+    finally:
+        shutdown_inference_executor()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="MRI analyzer maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    warm_parser = commands.add_parser("warm", help="precompute cached results for a directory or zip archive")
+    warm_parser.add_argument("path", help="directory or zip archive with JPG/PNG images")
+    warm_parser.add_argument("--mode", choices=("analyze", "classify"), default="analyze")
+    warm_parser.add_argument("--attribution", choices=[m.value for m in AttributionMethod],
+                             default=AttributionMethod.LIME.value)
+    warm_parser.add_argument("--workers", type=int, default=None, help="images processed concurrently")
+    warm_parser.add_argument("--rate", type=float, default=None, help="max images per second")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    stats = asyncio.run(run_warm(args))
+    print(stats.summary())
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,84 @@
+import os
 from pathlib import Path
 
 class Settings:
     MODEL_PATH = Path("app/models/best_custom_cnn.h5")
     IMAGE_SIZE = (224, 224)  # Размер изображения для модели
+    MODEL_VERSION = os.getenv("MODEL_VERSION", "1.0.0")  # Входит в ответы и ключи кэша
+    GRADCAM_LAYER = os.getenv("GRADCAM_LAYER", "conv2d_5")  # Сверточный слой для Grad-CAM
 
-settings = Settings()
\ No newline at end of file
+    # Micro-batching запросов к модели
+    BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))  # Максимальный размер батча
+    BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))  # Время ожидания добора батча
+
+    # Скомпилированный инференс (tf.function)
+    INFERENCE_JIT = os.getenv("INFERENCE_JIT", "0") == "1"  # XLA-компиляция
+    INFERENCE_BATCH_BUCKETS = (1, 4, 8, 16, 32, 64, 128)  # Батчи дополняются до ближайшего размера
+
+    # LIME
+    LIME_NUM_SAMPLES = int(os.getenv("LIME_NUM_SAMPLES", "1000"))  # Возмущений на объяснение (максимум)
+    LIME_BATCH_SIZE = int(os.getenv("LIME_BATCH_SIZE", "128"))  # Возмущений за один проход модели
+    LIME_SEGMENTER = os.getenv("LIME_SEGMENTER", "quickshift")  # quickshift, slic, felzenszwalb, grid
+    SEGMENTATION_CACHE_SIZE = int(os.getenv("SEGMENTATION_CACHE_SIZE", "128"))  # Карт сегментов в памяти
+    LIME_ADAPTIVE = os.getenv("LIME_ADAPTIVE", "0") == "1"  # Остановка выборки по сходимости
+    LIME_MIN_SAMPLES = int(os.getenv("LIME_MIN_SAMPLES", "256"))
+    LIME_TOLERANCE = float(os.getenv("LIME_TOLERANCE", "0.05"))  # Допустимое изменение весов между раундами
+    LIME_TOP_K = int(os.getenv("LIME_TOP_K", "5"))  # Признаков, порядок которых должен стабилизироваться
+
+    # Градиентные объяснения (Integrated Gradients / SmoothGrad)
+    ATTRIBUTION_STEPS = int(os.getenv("ATTRIBUTION_STEPS", "32"))  # Шагов интеграла / зашумленных копий
+    SMOOTHGRAD_NOISE = float(os.getenv("SMOOTHGRAD_NOISE", "0.15"))  # Шум относительно диапазона яркости
+
+    # Пул потоков для TensorFlow вне event loop
+    INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+    INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "32"))  # Задачи сверх воркеров
+    INFERENCE_PREDICT_WORKERS = int(os.getenv("INFERENCE_PREDICT_WORKERS", "1"))  # Отдельный пул для predict
+    STAGE_TIMEOUTS = {  # Таймауты этапов анализа, секунды
+        "predict": float(os.getenv("PREDICT_TIMEOUT", "10")),
+        "gradcam": float(os.getenv("GRADCAM_TIMEOUT", "30")),
+        "lime": float(os.getenv("LIME_TIMEOUT", "120")),
+        "attribution": float(os.getenv("ATTRIBUTION_TIMEOUT", "30")),
+    }
+
+    REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+
+    # Кэш результатов: локальный LRU в процессе перед Redis
+    CACHE_TTL = int(os.getenv("CACHE_TTL", "3600"))  # Время жизни записи в Redis, секунды
+    CACHE_SWEEP_BATCH = int(os.getenv("CACHE_SWEEP_BATCH", "500"))  # Ключей за один SCAN при очистке
+    CACHE_SWEEP_PAUSE = float(os.getenv("CACHE_SWEEP_PAUSE", "0.05"))  # Пауза между пакетами, секунды
+    CACHE_KEY_COUNT_INTERVAL = float(os.getenv("CACHE_KEY_COUNT_INTERVAL", "300"))  # Пересчет ключей для /cache/metrics
+
+    # Поиск почти одинаковых снимков по перцептивному хэшу (пересжатые JPEG, DICOM → JPEG)
+    NEAR_DUPLICATE_INDEX = os.getenv("NEAR_DUPLICATE_INDEX", "0") == "1"  # Выключен: похожие срезы разных пациентов
+    NEAR_DUPLICATE_ALGORITHM = os.getenv("NEAR_DUPLICATE_ALGORITHM", "phash")  # phash или dhash
+    NEAR_DUPLICATE_THRESHOLD = int(os.getenv("NEAR_DUPLICATE_THRESHOLD", "6"))  # Максимум различающихся бит из 64
+    LOCAL_CACHE_MAX_BYTES = int(os.getenv("LOCAL_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # Лимит LRU
+    LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", "300"))  # Время жизни локальной копии
+    CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "lz4")  # none, zlib или lz4 (без пакета lz4 - none)
+    CACHE_COMPRESSION_LEVEL = int(os.getenv("CACHE_COMPRESSION_LEVEL", "1"))  # Уровень zlib
+
+    # Хранилище артефактов (heatmap, изображения объяснений), отдаваемых по /api/artifacts/{id}
+    ARTIFACT_DIR = Path(os.getenv("ARTIFACT_DIR", "static/artifacts"))
+    ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(512 * 1024 * 1024)))  # Лимит на диске, LRU
+    ARTIFACT_MAX_AGE = int(os.getenv("ARTIFACT_MAX_AGE", str(365 * 24 * 3600)))  # max-age ответа, секунды
+    ARTIFACT_RESCAN_INTERVAL = float(os.getenv("ARTIFACT_RESCAN_INTERVAL", "60"))  # Перечитывание диска при вытеснении
+
+    # Асинхронные задачи анализа (/jobs)
+    JOB_BACKEND = os.getenv("JOB_BACKEND", "local")  # local (в памяти процесса) или redis (несколько воркеров)
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # Одновременно выполняемых задач в процессе
+    JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))  # Задач в очереди, сверх - 503
+    JOB_TTL = int(os.getenv("JOB_TTL", "3600"))  # Хранение задачи и ее результата, секунды
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))  # Ожидание очереди и проверка отмены
+    JOB_BUSY_RETRY_DELAY = float(os.getenv("JOB_BUSY_RETRY_DELAY", "1.0"))  # Пауза при занятом пуле инференса
+    JOB_BUSY_TIMEOUT = float(os.getenv("JOB_BUSY_TIMEOUT", "300"))  # Сколько ждать пул инференса, затем failed
+
+    # Пакетная классификация (/classify/batch)
+    CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "64"))  # Изображений за один проход модели
+    CLASSIFY_BATCH_MAX_FILES = int(os.getenv("CLASSIFY_BATCH_MAX_FILES", "5000"))  # Изображений в запросе
+    CLASSIFY_BATCH_MAX_FILE_BYTES = int(os.getenv("CLASSIFY_BATCH_MAX_FILE_BYTES", str(16 * 1024 * 1024)))
+
+    # Объединение одинаковых одновременных запросов
+    SINGLE_FLIGHT_LEASE_TTL = float(os.getenv("SINGLE_FLIGHT_LEASE_TTL", "150"))  # Не меньше таймаута LIME
+    SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", "0.2"))  # Опрос кэша, секунды
+
+settings = Settings()
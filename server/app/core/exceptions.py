@@ -46,4 +46,40 @@ class CacheError(MRIAnalysisError):
             status_code=500,
             detail=detail,
             error_code="CACHE_ERROR"
-        ) 
\ No newline at end of file
+        ) 
+
+class ServiceBusyError(MRIAnalysisError):
+    """Ошибка при переполнении очереди инференса"""
+    def __init__(self, detail: str = "Сервис перегружен, повторите запрос позже"):
+        super().__init__(
+            status_code=503,
+            detail=detail,
+            error_code="SERVICE_BUSY"
+        )
+
+class StageTimeoutError(MRIAnalysisError):
+    """Ошибка при превышении времени выполнения этапа анализа"""
+    def __init__(self, detail: str = "Превышено время выполнения этапа анализа"):
+        super().__init__(
+            status_code=504,
+            detail=detail,
+            error_code="STAGE_TIMEOUT"
+        )
+
+class ResultNotFoundError(MRIAnalysisError):
+    """Ошибка при отсутствии результата анализа в кэше"""
+    def __init__(self, detail: str = "Результат не найден, загрузите изображение"):
+        super().__init__(
+            status_code=404,
+            detail=detail,
+            error_code="RESULT_NOT_FOUND"
+        )
+
+class JobNotFoundError(MRIAnalysisError):
+    """Ошибка при отсутствии задачи анализа"""
+    def __init__(self, detail: str = "Задача не найдена или устарела"):
+        super().__init__(
+            status_code=404,
+            detail=detail,
+            error_code="JOB_NOT_FOUND"
+        )
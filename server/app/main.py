@@ -1,6 +1,11 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.endpoints import router as api_router
+from app.api.endpoints import router as api_router, run_analysis_job
+from app.core.config import settings
+from app.services.inference_executor import shutdown_inference_executor
+from app.services.result_cache import result_cache
+from app.services.cache_namespace import cache_sweeper, current_namespace
+from app.services.job_queue import RedisJobBackend, job_manager
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
 from redis import asyncio as aioredis
@@ -38,7 +43,7 @@ async def startup():
     try:
         logger.info("Initializing Redis connection...")
         redis = aioredis.from_url(
-            "redis://redis:6379",
+            settings.REDIS_URL,
             encoding="utf-8",
             decode_responses=True,
             socket_timeout=5,
@@ -57,6 +62,26 @@ async def startup():
         )
         logger.info("FastAPI cache initialized successfully")
         
+        # Кэш результатов хранит бинарные значения: отдельный клиент без decode_responses
+        result_cache_redis = aioredis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=5,
+            retry_on_timeout=True
+        )
+        result_cache.init(result_cache_redis)
+        
+        # Подписка на инвалидации локального кэша от других воркеров
+        await result_cache.start_listener(result_cache_redis)
+        
+        # Ключи прежних версий модели/настроек удаляются в фоне, без FLUSHALL
+        logger.info(f"Cache namespace: {current_namespace()}")
+        cache_sweeper.start(result_cache_redis)
+        
+        # Воркеры асинхронных задач /jobs; очередь в Redis нужна при нескольких процессах
+        job_backend = RedisJobBackend(result_cache_redis) if settings.JOB_BACKEND == "redis" else None
+        job_manager.start(run_analysis_job, job_backend)
+        logger.info(f"Job workers started: {job_manager.workers}, backend {settings.JOB_BACKEND}")
+        
         # Проверяем работу кэша
         await redis.set("test_key", "test_value", ex=10)
         test_value = await redis.get("test_key")
@@ -66,6 +91,14 @@ async def startup():
         logger.error(f"Failed to initialize Redis cache: {str(e)}", exc_info=True)
         raise
 
+@app.on_event("shutdown")
+async def shutdown():
+    await job_manager.stop()
+    await cache_sweeper.stop()
+    await result_cache.stop_listener()
+    # Останавливаем пул инференса
+    shutdown_inference_executor()
+
 @app.get("/redis_test")
 async def test():
     try:
@@ -84,11 +117,11 @@ async def test():
         val = await redis.get("test")
         logger.info(f"Test value read from Redis: {val}")
         
-        # Проверяем все ключи
-        keys = await redis.keys("*")
-        logger.info(f"All Redis keys: {keys}")
+        # Число ключей за O(1); подробности по ключам - /api/cache/stats
+        key_count = await redis.dbsize()
+        logger.info(f"Redis key count: {key_count}")
         
-        return {"status": bool(val), "keys": keys}
+        return {"status": bool(val), "key_count": key_count}
     except Exception as e:
         logger.error(f"Redis test failed: {str(e)}", exc_info=True)
         return {"error": str(e)}
\ No newline at end of file
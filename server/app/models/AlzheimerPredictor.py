@@ -1,5 +1,5 @@
 import numpy as np
-from app.models.model_loader import get_model
+from app.models.model_loader import get_inference_fn
   
 class AlzheimerPredictor:
     """Классификатор болезни Альцгеймера"""
@@ -7,8 +7,8 @@ class AlzheimerPredictor:
     @staticmethod
     def predict(img_array):
         """Выполнение предсказания"""
-        model = get_model()
-        return model.predict(img_array)[0].tolist()
+        inference_fn = get_inference_fn()
+        return inference_fn(img_array)[0].tolist()
     
     @staticmethod
     def get_class_name(predictions):
@@ -0,0 +1,117 @@
+import threading
+import numpy as np
+import tensorflow as tf
+import cv2
+from PIL import Image
+from app.core.config import settings
+
+class GradientExplainer:
+    """Градиентные объяснения: Integrated Gradients и SmoothGrad
+
+    Все интерполированные (или зашумленные) копии изображения проходят через
+    модель одним батчем, градиенты считаются за один обратный проход.
+    Дешевая альтернатива LIME: десятки проходов модели вместо тысячи.
+    """
+
+    METHODS = ('integrated_gradients', 'smoothgrad')
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, model, batch_size=64):
+        self.model = model
+        self.batch_size = batch_size
+        self.input_shape = tuple(model.inputs[0].shape)
+        self._gradient_step = tf.function(
+            self._compute_gradients,
+            input_signature=[
+                tf.TensorSpec(shape=self.input_shape, dtype=tf.float32),
+                tf.TensorSpec(shape=(), dtype=tf.int32)
+            ]
+        )
+
+    @staticmethod
+    def get_instance(model):
+        """Общий экземпляр для текущей модели; пересоздается при ее смене"""
+        with GradientExplainer._instance_lock:
+            instance = GradientExplainer._instance
+            if instance is None or instance.model is not model:
+                instance = GradientExplainer(model)
+                GradientExplainer._instance = instance
+            return instance
+
+    def _compute_gradients(self, images, class_idx):
+        with tf.GradientTape() as tape:
+            tape.watch(images)
+            predictions = self.model(images, training=False)
+            loss = predictions[:, class_idx]
+        return tape.gradient(loss, images)
+
+    def _gradients(self, images, class_idx):
+        """Градиенты по входу для батча изображений (частями по batch_size)"""
+        grads = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = tf.constant(images[start:start + self.batch_size], dtype=tf.float32)
+            grads.append(self._gradient_step(chunk, tf.constant(class_idx, dtype=tf.int32)).numpy())
+        return np.concatenate(grads, axis=0)
+
+    def _prepare(self, img_array, class_idx):
+        image = np.asarray(img_array, dtype=np.float32)
+        if image.ndim == 4:
+            image = image[0]
+        if image.shape != self.input_shape[1:]:
+            raise ValueError(f"Ожидается изображение формы {self.input_shape[1:]}, получено {image.shape}")
+        if class_idx is None:
+            class_idx = int(np.argmax(self.model(image[np.newaxis], training=False)[0]))
+        return image, int(class_idx)
+
+    def integrated_gradients(self, img_array, class_idx=None, steps=None, baseline=None):
+        """Integrated Gradients относительно baseline (по умолчанию черное изображение)
+
+        Returns:
+            np.ndarray: Атрибуции формы (H, W, 3)
+        """
+        image, class_idx = self._prepare(img_array, class_idx)
+        steps = steps or settings.ATTRIBUTION_STEPS
+        baseline = np.zeros_like(image) if baseline is None else np.asarray(baseline, dtype=np.float32)
+
+        # Интеграл по прямой baseline → image методом средних прямоугольников
+        alphas = ((np.arange(steps) + 0.5) / steps).astype(np.float32)
+        path = baseline + alphas[:, np.newaxis, np.newaxis, np.newaxis] * (image - baseline)
+        grads = self._gradients(path, class_idx)
+        return (image - baseline) * grads.mean(axis=0)
+
+    def smoothgrad(self, img_array, class_idx=None, samples=None, noise_level=None, random_state=None):
+        """SmoothGrad: градиенты, усредненные по зашумленным копиям изображения
+
+        Returns:
+            np.ndarray: Атрибуции формы (H, W, 3)
+        """
+        image, class_idx = self._prepare(img_array, class_idx)
+        samples = samples or settings.ATTRIBUTION_STEPS
+        noise_level = settings.SMOOTHGRAD_NOISE if noise_level is None else noise_level
+
+        rng = np.random.default_rng(random_state)
+        sigma = noise_level * (float(image.max()) - float(image.min()))
+        noisy = image + rng.normal(0, sigma, size=(samples, *image.shape)).astype(np.float32)
+        return self._gradients(noisy, class_idx).mean(axis=0)
+
+    def explain(self, img_array, method='integrated_gradients', class_idx=None):
+        """Карта значимости пикселей (H, W), нормированная в [0, 1]"""
+        if method == 'integrated_gradients':
+            attributions = self.integrated_gradients(img_array, class_idx)
+        elif method == 'smoothgrad':
+            attributions = self.smoothgrad(img_array, class_idx)
+        else:
+            raise ValueError(f"Unknown attribution method '{method}', expected one of {self.METHODS}")
+
+        saliency = np.abs(attributions).sum(axis=-1)
+        return saliency / (saliency.max() + 1e-10)
+
+    @staticmethod
+    def prepare_attribution_image(saliency):
+        """Подготовка карты значимости для отображения"""
+        saliency = cv2.resize(saliency, (224, 224))
+        saliency = np.uint8(255 * saliency)
+        saliency = cv2.applyColorMap(saliency, cv2.COLORMAP_JET)
+        return Image.fromarray(cv2.cvtColor(saliency, cv2.COLOR_BGR2RGB))
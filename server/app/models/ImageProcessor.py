@@ -1,4 +1,5 @@
 import numpy as np
+import cv2
 from tensorflow.keras.preprocessing import image
 from app.core.config import settings
 
@@ -14,4 +15,33 @@ class ImageProcessor:
         img = img.resize(settings.IMAGE_SIZE)
         img_array = image.img_to_array(img)
         img_array = np.expand_dims(img_array, axis=0) / 255.0
-        return img_array
\ No newline at end of file
+        return img_array
+    
+    @staticmethod
+    def perceptual_hash(img_array, algorithm='phash'):
+        """64-битный перцептивный хэш предобработанного изображения
+        
+        Считается по уменьшенной полутоновой копии, поэтому устойчив к
+        пересжатию JPEG и небольшим изменениям яркости.
+        
+        Args:
+            img_array: результат preprocess, форма (1, H, W, 3) или (H, W, 3)
+            algorithm: 'phash' (DCT) или 'dhash' (градиенты)
+        """
+        image = np.asarray(img_array, dtype=np.float32)
+        if image.ndim == 4:
+            image = image[0]
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        
+        if algorithm == 'phash':
+            small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+            low = cv2.dct(small)[:8, :8].flatten()
+            # Постоянная составляющая не входит в медиану
+            bits = low > np.median(low[1:])
+        elif algorithm == 'dhash':
+            small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+            bits = (small[:, 1:] > small[:, :-1]).flatten()
+        else:
+            raise ValueError(f"Unknown perceptual hash algorithm '{algorithm}', expected 'phash' or 'dhash'")
+        
+        return int(np.packbits(bits).view('>u8')[0])
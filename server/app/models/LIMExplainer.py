@@ -1,16 +1,52 @@
+import threading
 import numpy as np
+import sklearn.metrics
+from sklearn.utils import check_random_state
 from lime import lime_image
 from skimage.segmentation import mark_boundaries
 from PIL import Image
+from app.core.config import settings
 from app.core.exceptions import ModelProcessingError
+from app.models.Segmenter import Segmenter
 
 class LIMExplainer:
-    """Класс для работы с LIME объяснениями"""
+    """Класс для работы с LIME объяснениями
+
+    Возмущенные изображения строятся векторизованно в float32 прямо из
+    uint8-масок суперпикселей и подаются в модель большими батчами.
+    Результат совпадает по формату с lime_image.explain_instance.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
     
-    def __init__(self, model, num_samples=1000):
+    def __init__(self, model, num_samples=None, batch_size=None, predict_fn=None, random_state=None,
+                 segmenter=None, adaptive=None, min_samples=None, tolerance=None, top_k=None):
         self.explainer = lime_image.LimeImageExplainer()
         self.model = model
-        self.num_samples = num_samples
+        self.num_samples = num_samples or settings.LIME_NUM_SAMPLES
+        self.batch_size = batch_size or settings.LIME_BATCH_SIZE
+        self.predict_fn = predict_fn or model.predict
+        self.random_state = random_state
+        # Сегментатор: название алгоритма Segmenter или произвольная функция image -> segments
+        segmenter = segmenter or settings.LIME_SEGMENTER
+        self.segmentation_fn = Segmenter(segmenter) if isinstance(segmenter, str) else segmenter
+        # Адаптивный режим: num_samples - верхняя граница числа возмущений
+        self.adaptive = settings.LIME_ADAPTIVE if adaptive is None else adaptive
+        self.min_samples = min_samples or settings.LIME_MIN_SAMPLES
+        self.tolerance = settings.LIME_TOLERANCE if tolerance is None else tolerance
+        self.top_k = top_k or settings.LIME_TOP_K
+
+    @staticmethod
+    def get_instance(model, predict_fn=None):
+        """Общий экземпляр объяснителя; пересоздается при смене модели или функции инференса"""
+        with LIMExplainer._instance_lock:
+            instance = LIMExplainer._instance
+            if (instance is None or instance.model is not model
+                    or instance.predict_fn != (predict_fn or model.predict)):
+                instance = LIMExplainer(model, predict_fn=predict_fn)
+                LIMExplainer._instance = instance
+            return instance
     
     def explain(self, image_array):
         """Генерация объяснения для одного изображения"""
@@ -20,36 +56,128 @@ class LIMExplainer:
         # Проверка и нормализация входных данных
         if image_array.max() > 1.0:
             image_array = image_array / 255.0
-            
-        def predict_fn(images):
-            try:
-                # Подготовка входных данных для модели
-                if images.ndim == 3:
-                    images = np.expand_dims(images, axis=0)
-                
-                # Получаем предсказания от модели
-                predictions = self.model.predict(images)
-                
-                # Нормализуем форму предсказаний
-                if len(predictions.shape) == 1:
-                    predictions = np.expand_dims(predictions, axis=0)
-                
-                # Если предсказания имеют форму (1, n_classes), повторяем их для каждого изображения
-                if predictions.shape[0] == 1 and len(images) > 1:
-                    predictions = np.tile(predictions, (len(images), 1))
-                
-                return predictions
-            except Exception as e:
-                raise ModelProcessingError(f"Error in model prediction: {str(e)}")
-        
-        return self.explainer.explain_instance(
-            image_array.astype('double'),
-            predict_fn,
-            top_labels=1,
-            hide_color=0,
-            num_samples=self.num_samples,
-            batch_size=10
-        )
+
+        image = np.asarray(image_array, dtype=np.float64)
+        segments = self.segmentation_fn(image)
+        n_features = np.unique(segments).shape[0]
+
+        # Случайные маски суперпикселей; первая строка - исходное изображение
+        random_state = check_random_state(self.random_state)
+        if self.adaptive:
+            data, labels, stability = self._adaptive_samples(
+                image.astype(np.float32), segments, n_features, random_state
+            )
+        else:
+            data = random_state.randint(0, 2, self.num_samples * n_features)\
+                .reshape((self.num_samples, n_features)).astype(np.uint8)
+            data[0, :] = 1
+            labels = self._predict_perturbations(image.astype(np.float32), segments, data)
+            stability = None
+
+        distances = sklearn.metrics.pairwise_distances(
+            data, data[0].reshape(1, -1), metric='cosine'
+        ).ravel()
+
+        explanation = lime_image.ImageExplanation(image, segments)
+        top = np.argsort(labels[0])[-1:]
+        explanation.top_labels = list(top)
+        explanation.top_labels.reverse()
+        for label in top:
+            (explanation.intercept[label],
+             explanation.local_exp[label],
+             explanation.score, explanation.local_pred) = self.explainer.base.explain_instance_with_data(
+                data, labels, distances, label, 100000,
+                feature_selection=self.explainer.feature_selection
+            )
+        explanation.samples_used = len(data)
+        explanation.stability = stability
+        return explanation
+
+    def _adaptive_samples(self, image, segments, n_features, random_state):
+        """Возмущения раундами до стабилизации весов суррогатной модели
+
+        После каждого раунда (batch_size возмущений) ridge-суррогат для
+        предсказанного класса переобучается инкрементально через накопленные
+        взвешенные нормальные уравнения. Выборка останавливается, когда top_k
+        признаков не меняют порядок, а веса меняются не более чем на tolerance
+        (относительно), но не раньше min_samples и не позже num_samples.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, float]: маски, предсказания и оценка стабильности
+        """
+        kernel_fn = self.explainer.base.kernel_fn
+        # Ridge(alpha=1) со свободным членом без регуляризации, как в LimeBase
+        penalty = np.eye(n_features + 1)
+        penalty[0, 0] = 0
+        gram = np.zeros((n_features + 1, n_features + 1))
+        moment = np.zeros(n_features + 1)
+
+        data, labels = [], []
+        label = None
+        previous_coef = None
+        stability = 0.0
+        total = 0
+        while total < self.num_samples:
+            rows = random_state.randint(0, 2, (min(self.batch_size, self.num_samples - total), n_features))\
+                .astype(np.uint8)
+            if total == 0:
+                rows[0, :] = 1
+            predictions = self._predict_perturbations(image, segments, rows)
+            if label is None:
+                label = int(np.argmax(predictions[0]))
+            data.append(rows)
+            labels.append(predictions)
+            total += len(rows)
+
+            # Косинусное расстояние до исходного изображения (строка из единиц)
+            active = rows.sum(axis=1)
+            distances = 1 - np.sqrt(active / n_features)
+            weights = kernel_fn(distances)
+            design = np.hstack([np.ones((len(rows), 1)), rows])
+            gram += design.T @ (design * weights[:, np.newaxis])
+            moment += design.T @ (weights * predictions[:, label])
+            coef = np.linalg.solve(gram + penalty, moment)[1:]
+
+            if previous_coef is not None:
+                change = np.linalg.norm(coef - previous_coef) / (np.linalg.norm(coef) + 1e-10)
+                stability = float(np.clip(1 - change, 0, 1))
+                same_ranking = np.array_equal(
+                    np.argsort(-np.abs(coef))[:self.top_k],
+                    np.argsort(-np.abs(previous_coef))[:self.top_k]
+                )
+                if total >= self.min_samples and same_ranking and change <= self.tolerance:
+                    break
+            previous_coef = coef
+
+        return np.concatenate(data, axis=0), np.concatenate(labels, axis=0), stability
+
+    def _predict_perturbations(self, image, segments, data):
+        """Предсказания модели для всех возмущений, батчами по batch_size"""
+        labels = []
+        for start in range(0, len(data), self.batch_size):
+            rows = data[start:start + self.batch_size]
+            # (B, H, W) маска сохраняемых пикселей; скрытые суперпиксели = 0 (hide_color)
+            keep = rows[:, segments]
+            images = image[np.newaxis] * keep[..., np.newaxis]
+            labels.append(self._predict(images))
+        return np.concatenate(labels, axis=0)
+
+    def _predict(self, images):
+        try:
+            # Получаем предсказания от модели
+            predictions = np.asarray(self.predict_fn(images))
+
+            # Нормализуем форму предсказаний
+            if len(predictions.shape) == 1:
+                predictions = np.expand_dims(predictions, axis=0)
+
+            # Если предсказания имеют форму (1, n_classes), повторяем их для каждого изображения
+            if predictions.shape[0] == 1 and len(images) > 1:
+                predictions = np.tile(predictions, (len(images), 1))
+
+            return predictions
+        except Exception as e:
+            raise ModelProcessingError(f"Error in model prediction: {str(e)}")
     
     @staticmethod
     def get_visualization(explanation, positive_only=True, num_features=5):
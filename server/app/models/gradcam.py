@@ -2,58 +2,183 @@ import numpy as np
 import tensorflow as tf
 from tensorflow.keras.models import Model
 import os
-from datetime import datetime
+import hashlib
+import tempfile
+import threading
 import cv2
 import base64
 from PIL import Image
 
+class GradCAMEngine:
+    """Grad-CAM с однократно построенной градиентной моделью
+
+    Подмодель (вход → сверточный слой + выход) строится один раз на пару
+    (модель, слой), шаг вычисления heatmap скомпилирован в tf.function.
+    """
+
+    def __init__(self, model, layer_name='conv2d_5'):
+        self.model = model
+        self.layer_name = layer_name
+        self.grad_model = Model(
+            inputs=model.inputs,
+            outputs=[model.get_layer(layer_name).output, model.outputs[0]]
+        )
+        self.input_shape = tuple(self.grad_model.inputs[0].shape)
+        self._heatmap_step = tf.function(
+            self._forward_with_heatmaps,
+            input_signature=[
+                tf.TensorSpec(shape=self.input_shape, dtype=tf.float32),
+                tf.TensorSpec(shape=(None,), dtype=tf.int32)
+            ]
+        )
+
+    def _forward_with_heatmaps(self, images, class_indices):
+        # Один проход модели под GradientTape: и вероятности, и градиенты.
+        # Отрицательный индекс класса означает предсказанный класс образца
+        with tf.GradientTape() as tape:
+            conv_outputs, predictions = self.grad_model(images, training=False)
+            predicted = tf.argmax(predictions, axis=-1, output_type=tf.int32)
+            targets = tf.where(class_indices >= 0, class_indices, predicted)
+            loss = tf.gather(predictions, targets, axis=1, batch_dims=1)
+
+        # Образцы независимы (inference-режим), поэтому градиент суммы
+        # дает градиенты каждого образца за один обратный проход
+        grads = tape.gradient(loss, conv_outputs)
+
+        # Усредняем градиенты по пространственным осям каждого образца
+        pooled_grads = tf.reduce_mean(grads, axis=(1, 2))
+
+        # Создаем heatmap для каждого образца
+        heatmaps = tf.einsum('nhwk,nk->nhw', conv_outputs, pooled_grads)
+        max_values = tf.reduce_max(heatmaps, axis=(1, 2), keepdims=True)
+        heatmaps = tf.maximum(heatmaps, 0) / (max_values + 1e-10)
+        return predictions, heatmaps
+
+    def predict_with_heatmaps(self, images, class_indices=None, batch_size=32):
+        """Вероятности классов и heatmap для батча изображений
+
+        Args:
+            images: массив формы (N, 224, 224, 3)
+            class_indices: целевые классы образцов (N,); по умолчанию предсказанные
+            batch_size: размер части батча за один проход (ограничивает память)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: вероятности (N, n_classes) и heatmap (N, h, w)
+        """
+        images = tf.convert_to_tensor(images, dtype=tf.float32)
+        if images.shape.rank != len(self.input_shape):
+            raise ValueError(
+                f"Ожидается массив формы {self.input_shape}, получено {tuple(images.shape)}"
+            )
+        n = images.shape[0]
+        if class_indices is None:
+            class_indices = np.full(n, -1, dtype=np.int32)
+        class_indices = np.asarray(class_indices, dtype=np.int32).reshape(-1)
+        if len(class_indices) != n:
+            raise ValueError(f"Ожидается {n} индексов классов, получено {len(class_indices)}")
+
+        predictions, heatmaps = [], []
+        for start in range(0, n, batch_size):
+            batch_predictions, batch_heatmaps = self._heatmap_step(
+                images[start:start + batch_size],
+                tf.constant(class_indices[start:start + batch_size])
+            )
+            predictions.append(batch_predictions.numpy())
+            heatmaps.append(batch_heatmaps.numpy())
+        return np.concatenate(predictions, axis=0), np.concatenate(heatmaps, axis=0)
+
+    def predict_with_heatmap(self, img_array):
+        """Вероятности классов и heatmap за один проход модели
+
+        Args:
+            img_array: массив формы (1, 224, 224, 3)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: вероятности (1, n_classes) и heatmap
+        """
+        predictions, heatmaps = self.predict_with_heatmaps(img_array)
+        return predictions, heatmaps[0]
+
+    def generate_heatmap(self, img_array):
+        """Генерация heatmap для массива формы (1, 224, 224, 3)"""
+        return self.predict_with_heatmap(img_array)[1]
+
+
 class GradCAM:
     """Работа с Grad-CAM heatmap"""
-    
+
+    _engines = {}
+    _engines_lock = threading.Lock()
+
+    @staticmethod
+    def get_engine(model, layer_name='conv2d_5'):
+        """Grad-CAM движок для пары (модель, слой); пересоздается при смене модели"""
+        key = (id(model), layer_name)
+        with GradCAM._engines_lock:
+            engine = GradCAM._engines.get(key)
+            if engine is None or engine.model is not model:
+                # Движки предыдущей (перезагруженной) модели больше не нужны
+                GradCAM._engines = {
+                    k: e for k, e in GradCAM._engines.items() if e.model is model
+                }
+                engine = GradCAMEngine(model, layer_name)
+                GradCAM._engines[key] = engine
+            return engine
+
+    @staticmethod
+    def clear_cache():
+        """Сброс кэша Grad-CAM движков"""
+        with GradCAM._engines_lock:
+            GradCAM._engines = {}
+
     @staticmethod
     def generate_heatmap(model, img_array, layer_name='conv2d_5'):
         """Генерация heatmap"""
-        # Создаем подмодель: вход → выбранный слой + выход модели
-        grad_model = Model(
-            inputs=model.inputs,
-            outputs=[model.get_layer(layer_name).output, model.outputs[0]]
-        )
+        return GradCAM.get_engine(model, layer_name).generate_heatmap(img_array)
 
-        img_array = tf.convert_to_tensor(img_array, dtype=tf.float32)
+    @staticmethod
+    def predict_with_heatmap(model, img_array, layer_name='conv2d_5'):
+        """Классификация и heatmap за один проход модели"""
+        return GradCAM.get_engine(model, layer_name).predict_with_heatmap(img_array)
 
-        # Вычисляем градиенты
-        with tf.GradientTape() as tape:
-            tape.watch(img_array)
-            conv_outputs, predictions = grad_model(img_array)            
-            class_idx = tf.argmax(predictions[0])
-            loss = predictions[:, class_idx]
-        
-        grads = tape.gradient(loss, conv_outputs)
+    @staticmethod
+    def predict_with_heatmaps(model, images, class_indices=None, layer_name='conv2d_5', batch_size=32):
+        """Классификация и heatmap для батча (N, 224, 224, 3) за один проход"""
+        return GradCAM.get_engine(model, layer_name).predict_with_heatmaps(
+            images, class_indices=class_indices, batch_size=batch_size
+        )
 
-        # Усредняем градиенты по пространственным осям
-        pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
-        
-        # Создаем heatmap
-        conv_outputs = conv_outputs[0]
-        heatmap = conv_outputs @ pooled_grads[..., tf.newaxis]
-        heatmap = tf.squeeze(heatmap)
-        heatmap = tf.maximum(heatmap, 0) / (tf.reduce_max(heatmap) + 1e-10)
-        
-        return heatmap.numpy()  
+    @staticmethod
+    def generate_heatmaps(model, images, class_indices=None, layer_name='conv2d_5', batch_size=32):
+        """Генерация N heatmap для батча (N, 224, 224, 3)"""
+        return GradCAM.predict_with_heatmaps(
+            model, images, class_indices=class_indices, layer_name=layer_name, batch_size=batch_size
+        )[1]
 
     @staticmethod
     def save_heatmap(heatmap, save_dir=os.path.join("static","gradcam")):
-        """Сохранение heatmap"""
+        """Сохранение heatmap
+        
+        Имя файла - хэш PNG, поэтому одновременные сохранения разных heatmap
+        не перезаписывают друг друга, а одинаковые пишутся в один файл.
+        """
         os.makedirs(save_dir, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        save_path = os.path.join(save_dir, f"heatmap_{timestamp}.png")
 
         heatmap = cv2.resize(heatmap, (224, 224))
         heatmap = np.uint8(255 * heatmap)
         heatmap = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
         
-        # Сохраняем как grayscale
-        cv2.imwrite(save_path, heatmap)
+        ok, png = cv2.imencode(".png", heatmap)
+        if not ok:
+            raise ValueError("Не удалось закодировать heatmap в PNG")
+        data = png.tobytes()
+        save_path = os.path.join(save_dir, f"heatmap_{hashlib.blake2b(data, digest_size=16).hexdigest()}.png")
+        if not os.path.exists(save_path):
+            # Атомарная запись: временный файл + переименование
+            fd, tmp_path = tempfile.mkstemp(dir=save_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, save_path)
         return save_path
 
     @staticmethod
@@ -1,3 +1,6 @@
+import hashlib
+import numpy as np
+import tensorflow as tf
 from tensorflow.keras.models import Model
 from app.core.config import settings
 from .model import build_cnn_model
@@ -5,6 +8,7 @@ import logging
 import os
 
 _model = None
+_inference_fn = None
 
 def get_model():
     global _model
@@ -17,6 +21,10 @@ def get_model():
             if not os.path.exists(settings.MODEL_PATH):
                 raise FileNotFoundError(f"Weights file not found at {settings.MODEL_PATH}")
             
+            # Отпечаток фиксируется вместе с загрузкой: пространство имен кэша
+            # соответствует весам в памяти, даже если файл потом заменят
+            _set_weights_fingerprint(_hash_weights_file())
+            
             # Загрузка весов
             _model.load_weights(settings.MODEL_PATH)
             logging.info("Веса модели успешно загружены!")
@@ -24,4 +32,103 @@ def get_model():
         except Exception as e:
             logging.error(f"Ошибка загрузки весов модели: {str(e)}")
             raise
-    return _model
\ No newline at end of file
+    return _model
+
+
+class InferenceFunction:
+    """Скомпилированный инференс модели вместо Keras model.predict
+
+    tf.function с фиксированной сигнатурой (None, 224, 224, 3) трассируется один
+    раз; батч дополняется нулями до ближайшего размера из batch_buckets, поэтому
+    при XLA-компиляции число скомпилированных форм ограничено.
+    """
+
+    def __init__(self, model, jit_compile=None, batch_buckets=None):
+        self.model = model
+        self.batch_buckets = sorted(batch_buckets or settings.INFERENCE_BATCH_BUCKETS)
+        if jit_compile is None:
+            jit_compile = settings.INFERENCE_JIT
+        self.jit_compile = jit_compile
+        self._fn = tf.function(
+            self._forward,
+            input_signature=[tf.TensorSpec(shape=(None, *settings.IMAGE_SIZE, 3), dtype=tf.float32)],
+            jit_compile=jit_compile
+        )
+
+    def _forward(self, images):
+        return self.model(images, training=False)
+
+    def bucket_size(self, n):
+        """Размер батча, до которого дополняется батч из n изображений"""
+        for bucket in self.batch_buckets:
+            if bucket >= n:
+                return bucket
+        return self.batch_buckets[-1]
+
+    def __call__(self, img_array):
+        """Предсказание для массива формы (n, 224, 224, 3)
+
+        Returns:
+            np.ndarray: Вероятности классов формы (n, n_classes)
+        """
+        img_array = np.asarray(img_array, dtype=np.float32)
+        if img_array.ndim == 3:
+            img_array = np.expand_dims(img_array, axis=0)
+
+        max_bucket = self.batch_buckets[-1]
+        outputs = []
+        for start in range(0, len(img_array), max_bucket):
+            chunk = img_array[start:start + max_bucket]
+            n = len(chunk)
+            bucket = self.bucket_size(n)
+            if bucket > n:
+                padding = np.zeros((bucket - n, *chunk.shape[1:]), dtype=np.float32)
+                chunk = np.concatenate([chunk, padding], axis=0)
+            outputs.append(self._fn(tf.constant(chunk)).numpy()[:n])
+        return np.concatenate(outputs, axis=0)
+
+    def warmup(self):
+        """Прогрев: трассировка и компиляция для всех размеров батчей"""
+        for bucket in self.batch_buckets:
+            self(np.zeros((bucket, *settings.IMAGE_SIZE, 3), dtype=np.float32))
+
+
+def get_inference_fn():
+    """Скомпилированная функция инференса для текущей модели"""
+    global _inference_fn
+    model = get_model()
+    if _inference_fn is None or _inference_fn.model is not model:
+        _inference_fn = InferenceFunction(model)
+    return _inference_fn
+
+
+_weights_fingerprint = None
+
+def _hash_weights_file():
+    """BLAKE2b файла весов (hex)"""
+    hasher = hashlib.blake2b(digest_size=8)
+    with open(settings.MODEL_PATH, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def _set_weights_fingerprint(fingerprint):
+    global _weights_fingerprint
+    _weights_fingerprint = fingerprint
+
+def get_weights_fingerprint():
+    """Отпечаток весов загруженной модели (BLAKE2b файла на момент загрузки)
+
+    До загрузки модели файл хэшируется один раз; get_model() перезаписывает
+    отпечаток при загрузке весов. Замена файла во время работы не меняет
+    отпечаток, пока в памяти старая модель.
+
+    Returns:
+        str: hex-дайджест или "unknown", если файла весов нет
+    """
+    if _weights_fingerprint is None:
+        try:
+            _set_weights_fingerprint(_hash_weights_file())
+        except OSError:
+            return "unknown"
+    return _weights_fingerprint
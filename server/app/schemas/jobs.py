@@ -0,0 +1,27 @@
+from enum import Enum
+from pydantic import BaseModel
+from typing import Optional, Dict, Any
+
+class JobStatus(str, Enum):
+    """Состояние задачи анализа"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    EXPIRED = "expired"  # Не успела выполниться до deadline
+
+class JobInfo(BaseModel):
+    """Задача анализа в /jobs"""
+    id: str
+    status: JobStatus
+    priority: int
+    digest: str
+    attribution: Optional[str] = None
+    include: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    deadline: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
@@ -1,19 +1,42 @@
-from pydantic import BaseModel
+from enum import Enum
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional, Dict, Any
 
+class AttributionMethod(str, Enum):
+    """Метод попиксельного объяснения в /analyze"""
+    LIME = "lime"
+    INTEGRATED_GRADIENTS = "integrated_gradients"
+    SMOOTHGRAD = "smoothgrad"
+
+class ResultView(str, Enum):
+    """Представление результата в /results/{digest}"""
+    ANALYSIS = "analysis"
+    CLASSIFICATION = "classification"
+
 class ClassificationResult(BaseModel):
     """Результат классификации МРТ"""
     class_name: str
     confidence: float
     class_id: int
     probabilities: Dict[str, float]
+    near_duplicate_of: Optional[str] = None  # Хэш почти одинакового снимка, чья классификация взята
+
+class AdditionalInfo(BaseModel):
+    """Визуализации и объяснения; с include= в ответе только запрошенные поля"""
+    model_config = ConfigDict(extra="allow")
+
+    heatmap_url: Optional[str] = None
+    lime_explanation: Optional[Dict[str, Any]] = None
+    lime_url: Optional[str] = None
+    attribution: Optional[Dict[str, Any]] = None
+    attribution_url: Optional[str] = None
 
 class InterpretationResult(BaseModel):
     """Результат интерпретации МРТ"""
     findings: List[str]
     recommendations: List[str]
     severity: str
-    additional_info: Optional[Dict[str, Any]] = None
+    additional_info: Optional[AdditionalInfo] = None
 
 class PredictionResult(BaseModel):
     """Полный результат анализа МРТ"""
@@ -1,77 +1,171 @@
 import io
+import asyncio
 import base64
+import logging
 import numpy as np
 import time
-from typing import Dict, Any
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, List, Optional, Tuple, Union
 from fastapi import UploadFile
 from PIL import Image
 from app.models.AlzheimerPredictor import AlzheimerPredictor
 from app.models.ImageProcessor import ImageProcessor
 from app.models.GradCAM import GradCAM
 from app.models.LIMExplainer import LIMExplainer
-from app.models.model_loader import get_model
-from app.core.exceptions import InvalidImageError, ImageSizeError, ModelProcessingError
+from app.models.GradientExplainer import GradientExplainer
+from app.models.model_loader import get_model, get_inference_fn
+from app.services.batch_scheduler import get_batch_scheduler
+from app.services.inference_executor import get_inference_executor
+from app.services.analysis_plan import AnalysisPlan
+from app.services.stage_cache import StageCache, stage_cache
+from app.services.artifact_store import artifact_store
+from app.services.near_duplicate import near_duplicate_index
+from app.core.config import settings
+from app.core.exceptions import MRIAnalysisError, InvalidImageError, ImageSizeError, ModelProcessingError
 import PIL
 
+logger = logging.getLogger(__name__)
+
 
 class AnalysisPipeline:
     @staticmethod
-    async def process_image(file: UploadFile) -> Dict[str, Any]:
+    async def process_image(file: Union[UploadFile, bytes], attribution: str = "lime",
+                            digest: Optional[str] = None, plan: Optional[AnalysisPlan] = None) -> Dict[str, Any]:
         """Основной метод обработки изображения
         
         Args:
-            file: UploadFile - загруженный файл изображения
+            file: UploadFile | bytes - загруженный файл изображения или его содержимое
+            attribution: str - метод попиксельного объяснения (lime, integrated_gradients, smoothgrad)
+            digest: str - хэш содержимого; если задан, этапы берутся из кэша и досчитываются только недостающие
+            plan: AnalysisPlan - нужные части ответа (include=); по умолчанию полный анализ с attribution
             
         Returns:
-            Dict[str, Any]: Результаты анализа с предсказаниями и визуализациями
+            Dict[str, Any]: Результаты анализа с предсказаниями и ссылками на визуализации
         """
         start_time = time.time()
-        contents = await file.read()
-        try:
-            img = Image.open(io.BytesIO(contents))
-        except PIL.UnidentifiedImageError:
-            raise InvalidImageError("Невозможно открыть изображение. Проверьте формат файла.")
+        plan = plan or AnalysisPlan.full(attribution)
+        contents = await AnalysisPipeline._read_contents(file)
+        predictions, heatmap, attribution_info = await AnalysisPipeline._run_stages(
+            contents, plan.attribution, digest, gradcam=plan.gradcam
+        )
+        return AnalysisPipeline._build_response(
+            AnalysisPipeline.build_classification(predictions),
+            await AnalysisPipeline._publish_images(heatmap, attribution_info, plan),
+            start_time
+        )
+
+    @staticmethod
+    async def stream_analysis(file: Union[UploadFile, bytes], attribution: str = "lime",
+                              digest: Optional[str] = None,
+                              plan: Optional[AnalysisPlan] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Анализ с выдачей результата каждого этапа сразу после его завершения
         
-        # Предобработка
-        img_array = ImageProcessor.preprocess(img)
-        try:
-            model = get_model()
-        except Exception as e:
-            raise ModelProcessingError(f"Ошибка загрузки модели: {str(e)}")
+        Сначала классификация (обычным предсказанием, без ожидания Grad-CAM),
+        затем heatmap и объяснение в порядке готовности; они считаются
+        параллельно для уже известного класса. Последнее событие result -
+        тот же ответ, что у process_image.
         
-        # Предсказание
-        predictions = model.predict(img_array)
-        confidence = float(np.max(predictions))
-        predicted_class = AlzheimerPredictor.get_class_name(predictions)
-        class_id = np.argmax(predictions)
+        Yields:
+            Dict[str, Any]: Событие {"event": этап, "data": поля ответа, "stage_ms": время этапа,
+                "elapsed_ms": время с начала анализа}
+        """
+        start_time = time.time()
+        started = time.perf_counter()
+        plan = plan or AnalysisPlan.full(attribution)
+        attribution = plan.attribution
         
-        # Grad-CAM
-        try:
-            heatmap = GradCAM.generate_heatmap(model, img_array)
-            heatmap_img = GradCAM.prepare_heatmap_image(heatmap)
-        except Exception as e:
-            raise ModelProcessingError(f"Ошибка GradCAM: {str(e)}")
+        def event(name: str, data: Dict[str, Any], stage_start: float) -> Dict[str, Any]:
+            now = time.perf_counter()
+            return {
+                "event": name,
+                "data": data,
+                "stage_ms": round((now - stage_start) * 1000, 1),
+                "elapsed_ms": round((now - started) * 1000, 1)
+            }
         
-        # LIME
-        lime_explainer = LIMExplainer(model)
+        contents = await AnalysisPipeline._read_contents(file)
+        stage_start = time.perf_counter()
+        classification = await AnalysisPipeline.classify_image(contents, digest)
+        yield event("classification", classification, stage_start)
+        
+        model, inference_fn = AnalysisPipeline._load_model()
+        class_id = classification["class_id"]
+        load_tensor = AnalysisPipeline._tensor_loader(contents, digest)
+        
+        async def heatmap_stage() -> Dict[str, Any]:
+            heatmap = await AnalysisPipeline._heatmap_stage(model, class_id, load_tensor, digest)
+            return await AnalysisPipeline._publish_images(heatmap, {}, plan)
+        
+        stages = {}
+        stage_start = time.perf_counter()
+        if plan.gradcam:
+            stages["heatmap"] = asyncio.ensure_future(heatmap_stage())
+        if attribution:
+            stages[attribution] = asyncio.ensure_future(AnalysisPipeline._explanation_stage(
+                model, inference_fn, attribution, class_id, load_tensor, digest
+            ))
+        
+        additional_info = {}
         try:
-            lime_explanation = lime_explainer.explain(img_array[0])
-        except Exception as e:
-            raise ModelProcessingError(f"Ошибка LIME: {str(e)}")
+            pending = set(stages.values())
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for name, task in stages.items():
+                    if task not in done:
+                        continue
+                    info = task.result()
+                    if name == "heatmap":
+                        additional_info.update(info)
+                        yield event("heatmap", info, stage_start)
+                    elif name == "lime":
+                        # Признаки LIME отдаются до кодирования и сохранения изображения
+                        features = plan.select({"lime_explanation": info.get("lime_explanation")})
+                        if features:
+                            additional_info.update(features)
+                            yield event("lime", features, stage_start)
+                        if plan.image and "lime_img" in info:
+                            image_start = time.perf_counter()
+                            image = await AnalysisPipeline._publish_images(None, {"lime_img": info["lime_img"]}, plan)
+                            additional_info.update(image)
+                            yield event("lime_img", image, image_start)
+                    else:
+                        published = await AnalysisPipeline._publish_images(None, info, plan)
+                        additional_info.update(published)
+                        yield event("attribution", published, stage_start)
+        finally:
+            # Клиент отключился или этап упал: остальные этапы не нужны
+            for task in stages.values():
+                task.cancel()
+        
+        result = AnalysisPipeline._build_response(classification, additional_info, start_time)
+        yield event("result", result, started)
+
+    @staticmethod
+    def result_events(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """События stream_analysis для готового (закэшированного) результата"""
+        info = result["interpretation"].get("additional_info") or {}
+        parts = [
+            ("classification", result["classification"]),
+            ("heatmap", {k: info[k] for k in ("heatmap_url",) if k in info}),
+            ("lime", {k: info[k] for k in ("lime_explanation",) if k in info}),
+            ("lime_img", {k: info[k] for k in ("lime_url",) if k in info}),
+            ("attribution", {k: info[k] for k in ("attribution", "attribution_url") if k in info}),
+            ("result", result)
+        ]
+        return [
+            {"event": name, "data": data, "stage_ms": 0.0, "elapsed_ms": 0.0, "cached": True}
+            for name, data in parts if data
+        ]
+
+    @staticmethod
+    def _build_response(classification: Dict[str, Any], additional_info: Dict[str, Any],
+                        start_time: float) -> Dict[str, Any]:
+        """Ответ /analyze по классификации и полям additional_info"""
+        confidence = classification["confidence"]
+        predicted_class = classification["class_name"]
         
         # Формирование ответа в новом формате
-        response = {
-            "classification": {
-                "class_name": predicted_class,
-                "confidence": confidence,
-                "class_id": int(class_id),
-                "probabilities": {
-                    "MildDemented": float(predictions[0][0]),
-                    "ModerateDemented": float(predictions[0][1]),
-                    "NonDemented": float(predictions[0][2]),
-                    "VeryMildDemented": float(predictions[0][3])
-                }
-            },
+        return {
+            "classification": classification,
             "interpretation": {
                 "findings": [
                     f"Обнаружена {predicted_class} степень деменции",
@@ -82,104 +176,70 @@ class AnalysisPipeline:
                     "Провести дополнительные исследования"
                 ],
                 "severity": "moderate" if confidence > 0.8 else "low",
-                "additional_info": {
-                    "heatmap_img": AnalysisPipeline._image_to_base64(heatmap_img),
-                    "lime_explanation": {
-                        "top_features": [
-                            {"feature": int(f[0]), "weight": float(f[1])} 
-                            for f in lime_explanation.local_exp[lime_explanation.top_labels[0]][:5]
-                        ]
-                    }
-                }
+                "additional_info": additional_info
             },
             "processing_time": time.time() - start_time,
-            "model_version": "1.0.0"
+            "model_version": settings.MODEL_VERSION
         }
-        
-        if hasattr(lime_explainer, 'get_visualization'):
-            lime_img = lime_explainer.explanation_to_image(
-                lime_explainer.get_visualization(lime_explanation)
-            )
-            response["interpretation"]["additional_info"]["lime_img"] = AnalysisPipeline._image_to_base64(lime_img)
-            
-        return response
 
     @staticmethod
-    async def classify_image(file: UploadFile) -> Dict[str, Any]:
+    async def classify_image(file: Union[UploadFile, bytes], digest: Optional[str] = None,
+                             near_duplicates: bool = False) -> Dict[str, Any]:
         """Только классификация изображения
         
         Args:
-            file: UploadFile - загруженный файл изображения
+            file: UploadFile | bytes - загруженный файл изображения или его содержимое
+            digest: str - хэш содержимого для кэша этапов (необязательно)
+            near_duplicates: bool - можно ответить классификацией почти одинакового
+                снимка (только для ответа /classify: она не сохраняется как этап
+                этого снимка, в ответе есть near_duplicate_of)
             
         Returns:
             Dict[str, Any]: Результаты классификации
         """
-        start_time = time.time()
-        contents = await file.read()
-        img = Image.open(io.BytesIO(contents))
-        
-        # Предобработка
-        img_array = ImageProcessor.preprocess(img)
-        model = get_model()
-        
-        # Предсказание
-        predictions = model.predict(img_array)
-        confidence = float(np.max(predictions))
-        predicted_class = AlzheimerPredictor.get_class_name(predictions)
-        class_id = np.argmax(predictions)
+        contents = await AnalysisPipeline._read_contents(file)
+        predictions = None
+        if digest:
+            predictions = await stage_cache.get_array("probabilities", digest)
+        if predictions is None:
+            img_array = await AnalysisPipeline._load_tensor(contents, digest)
+            if digest and near_duplicates and settings.NEAR_DUPLICATE_INDEX:
+                # Тот же снимок, пересохраненный с другим сжатием, уже мог быть классифицирован
+                match = await AnalysisPipeline._near_duplicate_predictions(img_array, digest)
+                if match is not None:
+                    predictions, match_digest = match
+                    return {**AnalysisPipeline.build_classification(predictions), "near_duplicate_of": match_digest}
+        if predictions is None:
+            inference_fn = get_inference_fn()
+            
+            # Предсказание
+            predictions = np.asarray(await get_batch_scheduler(inference_fn).predict(img_array))
+            if digest:
+                await stage_cache.set_array("probabilities", digest, predictions)
+                await AnalysisPipeline._index_near_duplicate(img_array, digest)
         
-        return {
-            "class_name": predicted_class,
-            "confidence": confidence,
-            "class_id": int(class_id),
-            "probabilities": {
-                "MildDemented": float(predictions[0][0]),
-                "ModerateDemented": float(predictions[0][1]),
-                "NonDemented": float(predictions[0][2]),
-                "VeryMildDemented": float(predictions[0][3])
-            }
-        }
+        return AnalysisPipeline.build_classification(predictions)
 
     @staticmethod
-    async def interpret_image(file: UploadFile) -> Dict[str, Any]:
+    async def interpret_image(file: Union[UploadFile, bytes], attribution: str = "lime",
+                              digest: Optional[str] = None) -> Dict[str, Any]:
         """Только интерпретация изображения
         
         Args:
-            file: UploadFile - загруженный файл изображения
+            file: UploadFile | bytes - загруженный файл изображения или его содержимое
+            attribution: str - метод попиксельного объяснения (lime, integrated_gradients, smoothgrad)
+            digest: str - хэш содержимого для кэша этапов (необязательно)
             
         Returns:
             Dict[str, Any]: Результаты интерпретации
         """
-        start_time = time.time()
-        contents = await file.read()
-        img = Image.open(io.BytesIO(contents))
-        
-        # Предобработка
-        img_array = ImageProcessor.preprocess(img)
-        try:
-            model = get_model()
-        except Exception as e:
-            raise ModelProcessingError(f"Ошибка загрузки модели: {str(e)}")
-        
-        # Предсказание
-        predictions = model.predict(img_array)
+        contents = await AnalysisPipeline._read_contents(file)
+        predictions, heatmap, attribution_info = await AnalysisPipeline._run_stages(
+            contents, attribution, digest
+        )
         confidence = float(np.max(predictions))
         predicted_class = AlzheimerPredictor.get_class_name(predictions)
         
-        # Grad-CAM
-        try:
-            heatmap = GradCAM.generate_heatmap(model, img_array)
-            heatmap_img = GradCAM.prepare_heatmap_image(heatmap)
-        except Exception as e:
-            raise ModelProcessingError(f"Ошибка GradCAM: {str(e)}")
-        
-        # LIME
-        lime_explainer = LIMExplainer(model)
-        try:
-            lime_explanation = lime_explainer.explain(img_array[0])
-        except Exception as e:
-            raise ModelProcessingError(f"Ошибка LIME: {str(e)}")
-        
         response = {
             "findings": [
                 f"Обнаружена {predicted_class} степень деменции",
@@ -190,24 +250,283 @@ class AnalysisPipeline:
                 "Провести дополнительные исследования"
             ],
             "severity": "moderate" if confidence > 0.8 else "low",
-            "additional_info": {
-                "heatmap_img": AnalysisPipeline._image_to_base64(heatmap_img),
+            "additional_info": await AnalysisPipeline._publish_images(heatmap, attribution_info)
+        }
+
+        return response
+
+    @staticmethod
+    async def _run_stages(contents: bytes, attribution: Optional[str], digest: Optional[str],
+                          gradcam: bool = True) -> Tuple[np.ndarray, Optional[np.ndarray], Dict[str, Any]]:
+        """Вероятности, heatmap Grad-CAM и попиксельное объяснение
+        
+        С digest каждый этап сначала ищется в кэше этапов; вычисляются только
+        недостающие. Если вероятности уже известны (например, после /classify),
+        Grad-CAM и объяснение запускаются параллельно. Без gradcam (и с
+        attribution=None) соответствующий этап пропускается.
+        
+        Returns:
+            Tuple[np.ndarray, Optional[np.ndarray], Dict[str, Any]]: Вероятности (1, 4), heatmap
+                (None без gradcam) и поля объяснения (пустые без attribution)
+        """
+        model, inference_fn = AnalysisPipeline._load_model()
+        load_tensor = AnalysisPipeline._tensor_loader(contents, digest)
+        layer = settings.GRADCAM_LAYER
+        predictions = heatmap = None
+        if digest:
+            predictions = await stage_cache.get_array("probabilities", digest)
+        
+        if predictions is None:
+            img_array = await load_tensor()
+            if gradcam and digest:
+                heatmap = await stage_cache.get_array("gradcam", digest, layer=layer)
+            if heatmap is None and gradcam:
+                # Предсказание и Grad-CAM за один проход модели
+                try:
+                    predictions, heatmap = await get_inference_executor().run(
+                        "gradcam", GradCAM.predict_with_heatmap, model, img_array, layer
+                    )
+                except MRIAnalysisError:
+                    raise
+                except Exception as e:
+                    raise ModelProcessingError(f"Ошибка GradCAM: {str(e)}")
+                heatmap = np.asarray(heatmap, dtype=np.float32)
+                if digest:
+                    await stage_cache.set_array("gradcam", digest, heatmap, layer=layer)
+            else:
+                predictions = await get_batch_scheduler(inference_fn).predict(img_array)
+            predictions = np.asarray(predictions)
+            if digest:
+                await stage_cache.set_array("probabilities", digest, predictions)
+                await AnalysisPipeline._index_near_duplicate(img_array, digest)
+        class_id = int(np.argmax(predictions))
+        
+        # Этапы, которым уже известен класс, - параллельно (тензор загружается не более одного раза)
+        stages = {}
+        if heatmap is None and gradcam:
+            stages["gradcam"] = AnalysisPipeline._heatmap_stage(model, class_id, load_tensor, digest)
+        if attribution:
+            stages[attribution] = AnalysisPipeline._explanation_stage(
+                model, inference_fn, attribution, class_id, load_tensor, digest
+            )
+        results = dict(zip(stages, await asyncio.gather(*stages.values())))
+        heatmap = results.get("gradcam", heatmap)
+        
+        return predictions, heatmap, results.get(attribution) or {}
+
+    @staticmethod
+    def _load_model():
+        """Модель и скомпилированная функция инференса"""
+        try:
+            return get_model(), get_inference_fn()
+        except Exception as e:
+            raise ModelProcessingError(f"Ошибка загрузки модели: {str(e)}")
+
+    @staticmethod
+    def _tensor_loader(contents: bytes, digest: Optional[str]) -> Callable[[], Awaitable[np.ndarray]]:
+        """Ленивая загрузка тензора: один раз на все этапы, которым он нужен"""
+        task = None
+        
+        async def load() -> np.ndarray:
+            nonlocal task
+            if task is None:
+                task = asyncio.ensure_future(AnalysisPipeline._load_tensor(contents, digest))
+            return await asyncio.shield(task)
+        return load
+
+    @staticmethod
+    async def _heatmap_stage(model, class_id: int, load_tensor: Callable[[], Awaitable[np.ndarray]],
+                             digest: Optional[str]) -> np.ndarray:
+        """Heatmap Grad-CAM для известного класса из кэша этапов или вычисленная"""
+        layer = settings.GRADCAM_LAYER
+        heatmap = await stage_cache.get_array("gradcam", digest, layer=layer) if digest else None
+        if heatmap is None:
+            heatmap = await AnalysisPipeline._gradcam_stage(model, class_id, layer)(await load_tensor())
+            if digest:
+                await stage_cache.set_array("gradcam", digest, heatmap, layer=layer)
+        return heatmap
+
+    @staticmethod
+    async def _explanation_stage(model, inference_fn, attribution: str, class_id: int,
+                                 load_tensor: Callable[[], Awaitable[np.ndarray]],
+                                 digest: Optional[str]) -> Dict[str, Any]:
+        """Попиксельное объяснение из кэша этапов или вычисленное (поля additional_info)"""
+        explain_params = AnalysisPipeline._explanation_params(model, inference_fn, attribution, class_id)
+        info = await stage_cache.get(attribution, digest, **explain_params) if digest else None
+        if info is None:
+            info = await AnalysisPipeline._explain_pixels(
+                model, inference_fn, await load_tensor(), class_id, attribution
+            )
+            if digest:
+                await stage_cache.set(attribution, digest, info, **explain_params)
+        return info
+
+    @staticmethod
+    async def _near_duplicate_predictions(img_array: np.ndarray, digest: str) -> Optional[Tuple[np.ndarray, str]]:
+        """Вероятности и хэш ближайшего по перцептивному хэшу уже классифицированного снимка
+
+        Результат не сохраняется под digest: это ответ для другого снимка.
+        """
+        phash = near_duplicate_index.compute_hash(img_array)
+        for distance, match in await near_duplicate_index.find(phash, exclude=digest):
+            predictions = await stage_cache.get_array("probabilities", match)
+            if predictions is not None:
+                logger.info(f"Near-duplicate hit: {digest} ~ {match} (distance {distance})")
+                return predictions, match
+        return None
+
+    @staticmethod
+    async def _index_near_duplicate(img_array: np.ndarray, digest: str):
+        """Добавление классифицированного снимка в индекс почти одинаковых снимков"""
+        if settings.NEAR_DUPLICATE_INDEX:
+            await near_duplicate_index.add(near_duplicate_index.compute_hash(img_array), digest)
+
+    @staticmethod
+    def _gradcam_stage(model, class_id: int, layer: str):
+        """Этап Grad-CAM для уже известного класса"""
+        async def run(img_array: np.ndarray) -> np.ndarray:
+            executor = get_inference_executor()
+            try:
+                _, heatmaps = await executor.run(
+                    "gradcam", GradCAM.predict_with_heatmaps, model, img_array, [class_id], layer
+                )
+            except MRIAnalysisError:
+                raise
+            except Exception as e:
+                raise ModelProcessingError(f"Ошибка GradCAM: {str(e)}")
+            return np.asarray(heatmaps[0], dtype=np.float32)
+        return run
+
+    @staticmethod
+    def _explanation_params(model, inference_fn, attribution: str, class_id: int) -> Dict[str, Any]:
+        """Параметры объяснения, от которых зависит его результат (часть ключа кэша этапа)"""
+        if attribution == "lime":
+            explainer = LIMExplainer.get_instance(model, predict_fn=inference_fn)
+            segmenter = explainer.segmentation_fn
+            return {
+                "num_samples": explainer.num_samples,
+                "segmenter": getattr(segmenter, "algorithm", getattr(segmenter, "__name__", "custom")),
+                "adaptive": int(explainer.adaptive)
+            }
+        params = {"class_id": class_id, "steps": settings.ATTRIBUTION_STEPS}
+        if attribution == "smoothgrad":
+            params["noise"] = settings.SMOOTHGRAD_NOISE
+        return params
+
+    @staticmethod
+    async def _load_tensor(contents: bytes, digest: Optional[str] = None) -> np.ndarray:
+        """Предобработанный тензор изображения (1, 224, 224, 3), из кэша этапов при наличии digest"""
+        if digest:
+            cached = await stage_cache.get("tensor", digest)
+            if cached is not None:
+                return StageCache.decode_tensor(cached)
+        img_array = AnalysisPipeline._decode_tensor(contents)
+        if digest:
+            await stage_cache.set("tensor", digest, StageCache.encode_tensor(img_array))
+        return img_array
+
+    @staticmethod
+    def _decode_tensor(contents: bytes) -> np.ndarray:
+        """Декодирование и предобработка изображения в тензор (1, 224, 224, 3)"""
+        try:
+            img = Image.open(io.BytesIO(contents))
+        except PIL.UnidentifiedImageError:
+            raise InvalidImageError("Невозможно открыть изображение. Проверьте формат файла.")
+        
+        # Предобработка
+        return ImageProcessor.preprocess(img)
+
+    @staticmethod
+    def build_classification(predictions: np.ndarray) -> Dict[str, Any]:
+        """Поля ClassificationResult по вероятностям классов (1, 4)"""
+        return {
+            "class_name": AlzheimerPredictor.get_class_name(predictions),
+            "confidence": float(np.max(predictions)),
+            "class_id": int(np.argmax(predictions)),
+            "probabilities": {
+                "MildDemented": float(predictions[0][0]),
+                "ModerateDemented": float(predictions[0][1]),
+                "NonDemented": float(predictions[0][2]),
+                "VeryMildDemented": float(predictions[0][3])
+            }
+        }
+
+    @staticmethod
+    async def _explain_pixels(model, inference_fn, img_array: np.ndarray, class_id: int,
+                              attribution: str = "lime") -> Dict[str, Any]:
+        """Попиксельное объяснение предсказания
+        
+        Args:
+            img_array: np.ndarray - предобработанное изображение (1, 224, 224, 3)
+            class_id: int - объясняемый класс
+            attribution: str - lime, integrated_gradients или smoothgrad
+            
+        Returns:
+            Dict[str, Any]: Поля additional_info с объяснением и его визуализацией
+        """
+        executor = get_inference_executor()
+        if attribution == "lime":
+            lime_explainer = LIMExplainer.get_instance(model, predict_fn=inference_fn)
+            try:
+                lime_explanation = await executor.run("lime", lime_explainer.explain, img_array[0])
+            except MRIAnalysisError:
+                raise
+            except Exception as e:
+                raise ModelProcessingError(f"Ошибка LIME: {str(e)}")
+            
+            info = {
                 "lime_explanation": {
                     "top_features": [
                         {"feature": int(f[0]), "weight": float(f[1])} 
                         for f in lime_explanation.local_exp[lime_explanation.top_labels[0]][:5]
-                    ]
+                    ],
+                    "samples_used": lime_explanation.samples_used,
+                    "stability": lime_explanation.stability
                 }
             }
+            if hasattr(lime_explainer, 'get_visualization'):
+                lime_img = lime_explainer.explanation_to_image(
+                    lime_explainer.get_visualization(lime_explanation)
+                )
+                info["lime_img"] = AnalysisPipeline._image_to_base64(lime_img)
+            return info
+        
+        explainer = GradientExplainer.get_instance(model)
+        try:
+            saliency = await executor.run("attribution", explainer.explain, img_array, attribution, class_id)
+            attribution_img = GradientExplainer.prepare_attribution_image(saliency)
+        except MRIAnalysisError:
+            raise
+        except Exception as e:
+            raise ModelProcessingError(f"Ошибка {attribution}: {str(e)}")
+        return {
+            "attribution": {"method": attribution},
+            "attribution_img": AnalysisPipeline._image_to_base64(attribution_img)
         }
+
+    @staticmethod
+    async def _publish_images(heatmap: Optional[np.ndarray], attribution_info: Dict[str, Any],
+                              plan: Optional[AnalysisPlan] = None) -> Dict[str, Any]:
+        """Поля additional_info со ссылками на изображения в хранилище артефактов
         
-        if hasattr(lime_explainer, 'get_visualization'):
-            lime_img = lime_explainer.explanation_to_image(
-                lime_explainer.get_visualization(lime_explanation)
-            )
-            response["additional_info"]["lime_img"] = AnalysisPipeline._image_to_base64(lime_img)
-            
-        return response
+        В кэше этапов изображения объяснений хранятся в base64; в ответ идут
+        только URL (/api/artifacts/{id}), которые браузер кэширует. С plan
+        остаются только запрошенные поля, и лишние PNG не пишутся.
+        """
+        info = dict(attribution_info)
+        if heatmap is not None:
+            info["heatmap_img"] = AnalysisPipeline._image_to_base64(GradCAM.prepare_heatmap_image(heatmap))
+        if plan is not None:
+            info = plan.select(info)
+        # Запись на диск - вне event loop
+        return await asyncio.to_thread(artifact_store.publish_images, info)
+
+    @staticmethod
+    async def _read_contents(file: Union[UploadFile, bytes]) -> bytes:
+        """Содержимое файла; уже прочитанные байты используются без повторного чтения"""
+        if isinstance(file, (bytes, bytearray)):
+            return bytes(file)
+        return await file.read()
 
     @staticmethod
     def _image_to_base64(img: Image.Image) -> str:
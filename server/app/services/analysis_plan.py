@@ -0,0 +1,108 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+# Значения include=: heatmap, признаки и изображение LIME, градиентные объяснения (только изображение)
+INCLUDE_OPTIONS = ("gradcam", "lime", "lime_img", "integrated_gradients", "smoothgrad")
+GRADIENT_METHODS = ("integrated_gradients", "smoothgrad")
+
+
+@dataclass(frozen=True)
+class AnalysisPlan:
+    """Какие этапы анализа нужны для ответа
+
+    Классификация выполняется всегда: по ней выбирается класс для Grad-CAM
+    и объяснений. Этапы, не попавшие в план, не вычисляются.
+    """
+    gradcam: bool = True
+    attribution: Optional[str] = "lime"  # Метод попиксельного объяснения или None
+    features: bool = True  # Признаки LIME (lime_explanation)
+    image: bool = True  # Изображение объяснения (lime_url / attribution_url)
+
+    @classmethod
+    def full(cls, attribution: str = "lime") -> "AnalysisPlan":
+        """План без include=: все этапы, как раньше"""
+        return cls(gradcam=True, attribution=attribution, features=attribution == "lime", image=True)
+
+    @classmethod
+    def parse(cls, include: Optional[str], attribution: Optional[str] = None) -> "AnalysisPlan":
+        """План по значению include= (например, "gradcam,lime,lime_img")
+
+        Args:
+            include: Список частей ответа через запятую; None или пустая строка - полный анализ
+            attribution: Метод из параметра attribution=; должен совпадать с методом из include
+
+        Raises:
+            ValueError: Неизвестное значение, несколько методов объяснения или конфликт с attribution
+        """
+        if include is None or not include.strip():
+            return cls.full(attribution or "lime")
+
+        tokens = {token.strip().lower() for token in include.split(",") if token.strip()}
+        unknown = tokens.difference(INCLUDE_OPTIONS)
+        if unknown:
+            raise ValueError(
+                f"Unknown include values: {', '.join(sorted(unknown))}; "
+                f"expected any of {', '.join(INCLUDE_OPTIONS)}"
+            )
+
+        methods = {"lime"} if tokens & {"lime", "lime_img"} else set()
+        methods.update(tokens.intersection(GRADIENT_METHODS))
+        if len(methods) > 1:
+            raise ValueError(f"Only one explanation method can be included, got {', '.join(sorted(methods))}")
+        method = methods.pop() if methods else None
+        # attribution= без метода в include тоже конфликт: иначе он молча игнорировался бы
+        if attribution and attribution != method:
+            raise ValueError(f"include={include} conflicts with attribution={attribution}")
+
+        return cls(
+            gradcam="gradcam" in tokens,
+            attribution=method,
+            features="lime" in tokens,
+            image="lime_img" in tokens or method in GRADIENT_METHODS
+        )
+
+    @property
+    def is_full(self) -> bool:
+        return self.attribution is not None and self == AnalysisPlan.full(self.attribution)
+
+    @property
+    def tokens(self) -> Tuple[str, ...]:
+        """Нормализованный include= (часть ключа кэша)"""
+        tokens = []
+        if self.gradcam:
+            tokens.append("gradcam")
+        if self.attribution == "lime":
+            if self.features:
+                tokens.append("lime")
+            if self.image:
+                tokens.append("lime_img")
+        elif self.attribution:
+            tokens.append(self.attribution)
+        return tuple(tokens)
+
+    def select(self, additional_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Только запрошенные поля additional_info"""
+        selected = dict(additional_info)
+        if not self.gradcam:
+            selected.pop("heatmap_img", None)
+            selected.pop("heatmap_url", None)
+        if self.attribution != "lime" or not self.features:
+            selected.pop("lime_explanation", None)
+        if self.attribution != "lime" or not self.image:
+            selected.pop("lime_img", None)
+            selected.pop("lime_url", None)
+        if self.attribution not in GRADIENT_METHODS:
+            for field in ("attribution", "attribution_img", "attribution_url"):
+                selected.pop(field, None)
+        return selected
+
+    def project(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Результат полного анализа, сокращенный до плана"""
+        interpretation = result["interpretation"]
+        return {
+            **result,
+            "interpretation": {
+                **interpretation,
+                "additional_info": self.select(interpretation.get("additional_info") or {})
+            }
+        }
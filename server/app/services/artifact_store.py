@@ -0,0 +1,212 @@
+import base64
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Типы артефактов и их MIME-типы
+ARTIFACT_TYPES = {
+    "heatmap": "image/png",
+    "lime": "image/png",
+    "attribution": "image/png",
+}
+ARTIFACT_ID_PATTERN = r"^(" + "|".join(ARTIFACT_TYPES) + r")-[0-9a-f]{32}$"
+ARTIFACT_URL_PREFIX = "/api/artifacts/"
+
+# Поля additional_info с изображениями (base64) и тип артефакта для каждого
+IMAGE_FIELDS = {
+    "heatmap_img": "heatmap",
+    "lime_img": "lime",
+    "attribution_img": "attribution",
+}
+# Вытеснение освобождает место с запасом (до 90% лимита), а не на каждой записи
+EVICT_TARGET = 0.9
+
+
+class ArtifactStore:
+    """Хранилище артефактов анализа (heatmap, изображения объяснений) по хэшу содержимого
+
+    Идентификатор артефакта - "{тип}-{blake2b содержимого}", поэтому
+    одинаковые изображения хранятся один раз, а записанный файл никогда не
+    меняется. Файлы лежат на диске (root/{2 символа хэша}/{id}.png), их
+    суммарный размер ограничен max_bytes: при переполнении удаляются давно не
+    запрашивавшиеся (LRU по времени изменения файла, которое обновляется при
+    чтении). Индекс размеров ведется в процессе; перед вытеснением он
+    перечитывается с диска, чтобы учитывать файлы других воркеров, но не чаще
+    раза в rescan_interval секунд.
+    """
+
+    def __init__(self, root: Optional[Union[str, Path]] = None, max_bytes: Optional[int] = None,
+                 rescan_interval: Optional[float] = None):
+        self.root = Path(root or settings.ARTIFACT_DIR)
+        self.max_bytes = max_bytes or settings.ARTIFACT_MAX_BYTES
+        if rescan_interval is None:
+            rescan_interval = settings.ARTIFACT_RESCAN_INTERVAL
+        self.rescan_interval = rescan_interval
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index: Optional["OrderedDict[str, int]"] = None
+        self._size = 0
+        self._scanned_at: Optional[float] = None
+
+    @staticmethod
+    def artifact_id(kind: str, data: bytes) -> str:
+        if kind not in ARTIFACT_TYPES:
+            raise ValueError(f"Unknown artifact type: {kind}")
+        return f"{kind}-{hashlib.blake2b(data, digest_size=16).hexdigest()}"
+
+    @staticmethod
+    def media_type(artifact_id: str) -> str:
+        return ARTIFACT_TYPES[artifact_id.partition("-")[0]]
+
+    @staticmethod
+    def url(artifact_id: str) -> str:
+        return ARTIFACT_URL_PREFIX + artifact_id
+
+    def _path(self, artifact_id: str) -> Path:
+        digest = artifact_id.partition("-")[2]
+        return self.root / digest[:2] / f"{artifact_id}.png"
+
+    def _scan(self) -> "OrderedDict[str, int]":
+        """Индекс файлов на диске от давно не использовавшихся к недавним"""
+        entries = []
+        if self.root.is_dir():
+            for path in self.root.glob("*/*.png"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path.stem, stat.st_size))
+        entries.sort()
+        return OrderedDict((artifact_id, size) for _, artifact_id, size in entries)
+
+    def _load_index(self):
+        if self._index is None:
+            self._rescan()
+
+    def _rescan(self):
+        self._index = self._scan()
+        self._size = sum(self._index.values())
+        self._scanned_at = time.monotonic()
+
+    def put(self, kind: str, data: bytes) -> str:
+        """Сохранение артефакта; возвращает его идентификатор
+
+        Запись атомарна (временный файл + переименование), поэтому
+        одновременные записи одного артефакта не портят файл.
+        """
+        artifact_id = ArtifactStore.artifact_id(kind, data)
+        path = self._path(artifact_id)
+        with self._lock:
+            self._load_index()
+            if artifact_id in self._index and path.exists():
+                self._touch(artifact_id, path)
+                return artifact_id
+
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            self._size += len(data) - self._index.pop(artifact_id, 0)
+            self._index[artifact_id] = len(data)
+            if self._size > self.max_bytes:
+                self._evict(keep=artifact_id)
+        return artifact_id
+
+    def path(self, artifact_id: str) -> Optional[Path]:
+        """Путь к файлу артефакта (None, если его нет); отмечает артефакт как использованный"""
+        path = self._path(artifact_id)
+        with self._lock:
+            if not path.exists():
+                if self._index is not None and artifact_id in self._index:
+                    self._size -= self._index.pop(artifact_id)
+                return None
+            self._load_index()
+            self._touch(artifact_id, path)
+        return path
+
+    def exists(self, artifact_id: str) -> bool:
+        return self._path(artifact_id).exists()
+
+    def _touch(self, artifact_id: str, path: Path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return
+        if artifact_id in self._index:
+            self._index.move_to_end(artifact_id)
+
+    def _evict(self, keep: str):
+        """Удаление давно не использовавшихся артефактов до EVICT_TARGET от max_bytes"""
+        if self._scanned_at is None or time.monotonic() - self._scanned_at >= self.rescan_interval:
+            # Перечитываем диск: другие воркеры могли добавить или удалить файлы
+            self._rescan()
+            if self._size <= self.max_bytes:
+                return
+        self._index.move_to_end(keep)
+        target = int(self.max_bytes * EVICT_TARGET)
+        while self._size > target and len(self._index) > 1:
+            artifact_id, size = self._index.popitem(last=False)
+            try:
+                self._path(artifact_id).unlink()
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            self.evictions += 1
+            logger.info(f"Evicted artifact {artifact_id} ({size} bytes)")
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            self._load_index()
+            return self._size
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load_index()
+            return len(self._index)
+
+    def missing(self, value: Any) -> bool:
+        """Есть ли в результате ссылки на артефакты, которых уже нет на диске (вытеснены)
+
+        Обращается к диску: из async-кода вызывается через asyncio.to_thread.
+        """
+        if isinstance(value, dict):
+            return any(self.missing(item) for item in value.values())
+        if isinstance(value, list):
+            return any(self.missing(item) for item in value)
+        if isinstance(value, str) and value.startswith(ARTIFACT_URL_PREFIX):
+            return not self.exists(value[len(ARTIFACT_URL_PREFIX):])
+        return False
+
+    def publish_images(self, info: Dict[str, Any]) -> Dict[str, Any]:
+        """Замена изображений base64 в additional_info на ссылки на артефакты
+
+        Поле heatmap_img превращается в heatmap_url и т.д.
+        """
+        published = {}
+        for field, value in info.items():
+            kind = IMAGE_FIELDS.get(field)
+            if kind is None or not isinstance(value, str):
+                published[field] = value
+                continue
+            artifact_id = self.put(kind, base64.b64decode(value))
+            published[field[:-len("_img")] + "_url"] = ArtifactStore.url(artifact_id)
+        return published
+
+
+artifact_store = ArtifactStore()
@@ -0,0 +1,371 @@
+import asyncio
+import logging
+import lzma
+import posixpath
+import tarfile
+import time
+import zipfile
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import numpy as np
+from app.core.config import settings
+from app.core.exceptions import ImageSizeError, InvalidImageError, MRIAnalysisError, ModelProcessingError, ServiceBusyError
+from app.models.model_loader import get_inference_fn
+from app.services.analysis_pipeline import AnalysisPipeline
+from app.services.cache_metrics import cache_metrics
+from app.services.cache_namespace import result_cache_key
+from app.services.content_hash import content_digest
+from app.services.inference_executor import get_inference_executor
+from app.services.result_cache import result_cache
+from app.services.stage_cache import stage_cache
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+ARCHIVE_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed", "application/x-tar",
+                         "application/gzip", "application/x-gzip", "application/x-compressed-tar")
+UPLOADS_STUDY = "uploads"  # Исследование для отдельно загруженных файлов без каталога
+# Ошибки чтения поврежденного архива или его сжатого содержимого
+ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, zlib.error, lzma.LZMAError, EOFError, OSError,
+                  NotImplementedError, RuntimeError)
+
+
+@dataclass
+class BatchItem:
+    """Одно изображение пакета: имя файла (путь в архиве), исследование и содержимое"""
+    name: str
+    study: str
+    contents: Optional[bytes] = None
+    digest: Optional[str] = None
+    error: Optional[MRIAnalysisError] = None  # Файл отклонен до классификации
+
+
+@dataclass
+class StudySummary:
+    """Агрегат результатов по исследованию"""
+    count: int = 0
+    failed: int = 0
+    class_counts: Dict[str, int] = field(default_factory=dict)
+    probability_sums: Optional[np.ndarray] = None
+
+    def add(self, classification: Dict[str, Any]):
+        self.count += 1
+        self.class_counts[classification["class_name"]] = self.class_counts.get(classification["class_name"], 0) + 1
+        probabilities = np.array(list(classification["probabilities"].values()), dtype=np.float64)
+        self.probability_sums = probabilities if self.probability_sums is None else self.probability_sums + probabilities
+
+    def to_dict(self, study: str) -> Dict[str, Any]:
+        summary = {"study": study, "count": self.count, "failed": self.failed, "class_counts": self.class_counts}
+        if self.probability_sums is not None:
+            # Класс исследования - по средним вероятностям срезов
+            mean = self.probability_sums / self.count
+            classification = AnalysisPipeline.build_classification(mean[np.newaxis, :])
+            summary.update(
+                class_name=classification["class_name"],
+                confidence=classification["confidence"],
+                mean_probabilities=classification["probabilities"]
+            )
+        return summary
+
+
+def is_archive(filename: str, content_type: Optional[str] = None) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS) or content_type in ARCHIVE_CONTENT_TYPES
+
+
+def iter_archive(fileobj: BinaryIO, filename: str) -> Iterator[Tuple[str, Optional[bytes], Optional[MRIAnalysisError]]]:
+    """Изображения из zip или tar (в т.ч. сжатого) по одному, без распаковки всего архива
+
+    tar читается потоково; zip требует перехода к оглавлению в конце файла,
+    поэтому fileobj должен поддерживать seek (загрузка FastAPI хранится во
+    временном файле). Для файлов больше лимита вместо содержимого - None.
+    Поврежденный файл архива дает ошибку этого файла; если дальше архив
+    читать нельзя (оглавление zip, поток tar), - ошибку с пустым именем.
+    """
+    max_bytes = settings.CLASSIFY_BATCH_MAX_FILE_BYTES
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        try:
+            archive = zipfile.ZipFile(fileobj)
+        except ARCHIVE_ERRORS as e:
+            yield "", None, InvalidImageError(f"Архив {filename} поврежден: {str(e)}")
+            return
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir() or not is_image_member(info.filename):
+                    continue
+                if info.file_size > max_bytes:
+                    yield info.filename, None, None
+                    continue
+                try:
+                    contents = archive.read(info)
+                except ARCHIVE_ERRORS as e:
+                    yield info.filename, None, InvalidImageError(f"Не удалось прочитать файл из архива: {str(e)}")
+                    continue
+                yield info.filename, contents, None
+        return
+
+    fileobj.seek(0)
+    reading = ""  # Файл, содержимое которого сейчас читается
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for member in archive:
+                if not member.isfile() or not is_image_member(member.name):
+                    continue
+                if member.size > max_bytes:
+                    yield member.name, None, None
+                    continue
+                reading = member.name
+                contents = archive.extractfile(member).read()
+                reading = ""
+                yield member.name, contents, None
+    except ARCHIVE_ERRORS as e:
+        # Поток tar после ошибки не продолжить: остальные файлы архива недоступны
+        if reading:
+            yield reading, None, InvalidImageError(f"Не удалось прочитать файл из архива: {str(e)}")
+        else:
+            yield "", None, InvalidImageError(f"Архив {filename} не является zip или tar или поврежден: {str(e)}")
+
+
+def is_image_member(name: str) -> bool:
+    """Изображение в архиве; служебные файлы macOS (__MACOSX, ._*) пропускаются"""
+    base = posixpath.basename(name)
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith("__MACOSX/") and not base.startswith(".")
+
+
+def iter_batch_items(files: Iterable[Tuple[str, Optional[str], BinaryIO]]) -> Iterator[BatchItem]:
+    """Изображения пакета из загруженных файлов и архивов
+
+    Исследование - путь каталога файла с именем архива впереди (для файлов
+    в корне архива - имя архива) или каталог из имени загруженного файла
+    (uploads, если каталога нет). Синхронный: читает файлы и вызывается
+    в потоке.
+    """
+    max_files = settings.CLASSIFY_BATCH_MAX_FILES
+    max_bytes = settings.CLASSIFY_BATCH_MAX_FILE_BYTES
+    count = 0
+    for filename, content_type, fileobj in files:
+        filename = filename or "upload"
+        if is_archive(filename, content_type):
+            # Ошибка всего архива (пустое имя) относится к исследованию с его именем
+            paths = ((posixpath.join(filename, name) if name else filename, contents, error)
+                     for name, contents, error in iter_archive(fileobj, filename))
+            members = ((path, posixpath.dirname(path) if path != filename else filename, contents, error)
+                       for path, contents, error in paths)
+        else:
+            members = [(filename, posixpath.dirname(filename) or UPLOADS_STUDY, fileobj.read(max_bytes + 1), None)]
+        for name, study, contents, error in members:
+            count += 1
+            if count > max_files:
+                raise ImageSizeError(f"В пакете больше {max_files} изображений")
+            if error is not None:
+                yield BatchItem(name, study, error=error)
+            elif contents is None or len(contents) > max_bytes:
+                yield BatchItem(name, study, error=ImageSizeError(f"Файл больше {max_bytes} байт"))
+            else:
+                yield BatchItem(name, study, contents, content_digest(contents))
+
+
+class BatchClassifier:
+    """Классификация большого числа изображений за один запрос
+
+    Изображения обрабатываются порциями по batch_size: уже классифицированные
+    (кэш результатов или этап probabilities) отдаются сразу, остальные
+    декодируются параллельно в пуле потоков и проходят через модель одним
+    батчем. Следующая порция читается и декодируется, пока модель считает
+    текущую; снимки, уже отправленные в модель в предыдущих порциях, повторно
+    не считаются. Результаты пишутся в кэш под ключами /classify.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, busy_retry_delay: Optional[float] = None,
+                 busy_timeout: Optional[float] = None):
+        self.batch_size = batch_size or settings.CLASSIFY_BATCH_SIZE
+        if busy_retry_delay is None:
+            busy_retry_delay = settings.JOB_BUSY_RETRY_DELAY
+        self.busy_retry_delay = busy_retry_delay
+        self.busy_timeout = settings.JOB_BUSY_TIMEOUT if busy_timeout is None else busy_timeout
+
+    async def classify(self, items: Iterator[BatchItem]) -> AsyncIterator[Dict[str, Any]]:
+        """События пакетной классификации по мере готовности
+
+        item - результат файла (classification или error), study - агрегат по
+        исследованию, summary - итоги пакета. Исследования агрегируются в конце:
+        файлы одного исследования могут идти в архиве вперемешку.
+        """
+        start_time = time.perf_counter()
+        studies: Dict[str, StudySummary] = {}
+        totals = {"total": 0, "cached": 0, "computed": 0, "failed": 0, "batches": 0}
+        inflight: Set[str] = set()  # Снимки, отправленные в модель в этом пакете
+        computed: Dict[str, Tuple[Optional[Dict[str, Any]], Optional[MRIAnalysisError]]] = {}
+
+        def event(name: str, data: Dict[str, Any]) -> Dict[str, Any]:
+            return {"event": name, "data": data, "elapsed_ms": round((time.perf_counter() - start_time) * 1000, 1)}
+
+        def item_event(item: BatchItem, classification: Optional[Dict[str, Any]] = None,
+                       cached: bool = False) -> Dict[str, Any]:
+            totals["total"] += 1
+            study = studies.setdefault(item.study, StudySummary())
+            data = {"name": item.name, "study": item.study, "digest": item.digest}
+            if classification is None:
+                totals["failed"] += 1
+                study.failed += 1
+                error = item.error
+                data["error"] = {"status_code": error.status_code, "detail": error.detail,
+                                 "error_code": error.error_code}
+            else:
+                totals["cached" if cached else "computed"] += 1
+                study.add(classification)
+                data.update(cached=cached, classification=classification)
+            return event("item", data)
+
+        prepare = asyncio.ensure_future(self._prepare(items, inflight))
+        try:
+            while True:
+                chunk = await prepare
+                if chunk is None:
+                    break
+                ready, pending, repeated = chunk
+                inflight.update(item.digest for item, _ in pending)
+                # Следующая порция готовится, пока модель считает текущую
+                prepare = asyncio.ensure_future(self._prepare(items, inflight))
+                for item, classification in ready:
+                    yield item_event(item, classification, cached=classification is not None)
+                if pending:
+                    totals["batches"] += 1
+                    async for item, classification in self._predict(pending):
+                        computed[item.digest] = classification, item.error
+                        yield item_event(item, classification)
+                # Повторы снимков из предыдущих порций - как дубликаты внутри порции
+                for item in repeated:
+                    classification, item.error = computed[item.digest]
+                    yield item_event(item, classification)
+        finally:
+            prepare.cancel()
+
+        for name, study in studies.items():
+            yield event("study", study.to_dict(name))
+        yield event("summary", {**totals, "elapsed_ms": round((time.perf_counter() - start_time) * 1000, 1)})
+
+    async def _prepare(self, items: Iterator[BatchItem], inflight: Set[str]):
+        """Следующая порция: готовые результаты (из кэша или ошибки) и декодированные изображения
+
+        Снимки из inflight (уже отправленные в модель) не ищутся в кэше и не
+        декодируются: их результат берется из предыдущей порции.
+
+        Returns:
+            None, если изображения закончились, иначе (ready, pending, repeated), где
+            ready - [(item, classification или None при ошибке)], pending -
+            [(item, тензор (1, 224, 224, 3))], repeated - [item] из inflight
+        """
+        chunk = await asyncio.to_thread(lambda: [item for _, item in zip(range(self.batch_size), items)])
+        if not chunk:
+            return None
+        ready: List[Tuple[BatchItem, Optional[Dict[str, Any]]]] = []
+        valid = [item for item in chunk if item.error is None and item.digest not in inflight]
+        repeated = [item for item in chunk if item.error is None and item.digest in inflight]
+        ready.extend((item, None) for item in chunk if item.error is not None)
+        for item in repeated:
+            item.contents = None
+
+        cached = await asyncio.gather(*(self._fetch(item.digest) for item in valid))
+        misses = []
+        for item, classification in zip(valid, cached):
+            cache_metrics.record("endpoint:classify_batch", classification is not None)
+            if classification is not None:
+                ready.append((item, classification))
+            else:
+                misses.append(item)
+
+        # Одинаковые файлы в порции декодируются и считаются один раз
+        unique = list({item.digest: item for item in misses}.values())
+        tensors = await asyncio.gather(*(asyncio.to_thread(AnalysisPipeline._decode_tensor, item.contents) for item in unique),
+                                       return_exceptions=True)
+        decoded = {}
+        for item, tensor in zip(unique, tensors):
+            if isinstance(tensor, BaseException):
+                decoded[item.digest] = as_analysis_error(tensor)
+            else:
+                decoded[item.digest] = tensor
+
+        pending = []
+        for item in misses:
+            result = decoded[item.digest]
+            if isinstance(result, MRIAnalysisError):
+                item.error = result
+                ready.append((item, None))
+            else:
+                pending.append((item, result))
+            item.contents = None  # Содержимое больше не нужно
+        return ready, pending, repeated
+
+    async def _fetch(self, digest: str) -> Optional[Dict[str, Any]]:
+        """Классификация из кэша результатов (/classify или /analyze) или этапа probabilities"""
+        try:
+            cached = await result_cache.get(result_cache_key(digest))
+        except Exception as e:
+            logger.warning(f"Failed to read cached classification for {digest}: {str(e)}")
+            cached = None
+        if cached is not None:
+            return cached.get("classification", cached)
+        predictions = await stage_cache.get_array("probabilities", digest)
+        if predictions is not None:
+            return AnalysisPipeline.build_classification(predictions)
+        return None
+
+    async def _predict(self, pending: List[Tuple[BatchItem, np.ndarray]]):
+        """Один проход модели по порции и запись результатов в кэш"""
+        unique = {}
+        for item, tensor in pending:
+            unique.setdefault(item.digest, tensor)
+        digests = list(unique)
+        batch = np.concatenate([unique[digest] for digest in digests]).astype(np.float32)
+
+        executor = get_inference_executor()
+        inference_fn = get_inference_fn()
+        give_up_at = time.monotonic() + self.busy_timeout
+        try:
+            while True:
+                try:
+                    predictions = np.asarray(await executor.run("predict", inference_fn, batch))
+                    break
+                except ServiceBusyError:
+                    # Пул инференса занят одиночными запросами: уступаем и повторяем, но не
+                    # дольше busy_timeout; затем у файлов порции - ошибка SERVICE_BUSY
+                    if time.monotonic() >= give_up_at:
+                        raise
+                    await asyncio.sleep(self.busy_retry_delay)
+        except Exception as e:
+            error = as_analysis_error(e)
+            for item, _ in pending:
+                item.error = error
+                yield item, None
+            return
+
+        results = {digest: AnalysisPipeline.build_classification(predictions[i:i + 1])
+                   for i, digest in enumerate(digests)}
+        await asyncio.gather(*(self._store(digest, unique[digest], predictions[i:i + 1], results[digest])
+                               for i, digest in enumerate(digests)))
+        for item, _ in pending:
+            yield item, results[item.digest]
+
+    @staticmethod
+    async def _store(digest: str, img_array: np.ndarray, predictions: np.ndarray, classification: Dict[str, Any]):
+        """Запись вероятностей и классификации под теми же ключами, что у /classify"""
+        await stage_cache.set_array("probabilities", digest, predictions)
+        await AnalysisPipeline._index_near_duplicate(img_array, digest)
+        cache_key = result_cache_key(digest)
+        try:
+            cache_metrics.write("endpoint:classify_batch", await result_cache.set(cache_key, classification))
+        except Exception as e:
+            logger.warning(f"Failed to cache batch classification {cache_key}: {str(e)}")
+
+
+def as_analysis_error(error: BaseException) -> MRIAnalysisError:
+    """Ошибка файла в виде MRIAnalysisError (как в ответах /classify)"""
+    if isinstance(error, MRIAnalysisError):
+        return error
+    if isinstance(error, ValueError):
+        return ImageSizeError(str(error)) if "size" in str(error).lower() else InvalidImageError(str(error))
+    logger.error(f"Ошибка при пакетной классификации: {str(error)}", exc_info=error)
+    return ModelProcessingError(f"Ошибка при классификации: {str(error)}")
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import numpy as np
+from typing import Callable, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.services.inference_executor import InferenceExecutor, get_inference_executor
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """Динамический micro-batching запросов к модели
+
+    Конкурентные запросы собираются в течение max_wait_ms (или до max_batch_size
+    строк), после чего выполняется один батчевый проход модели, а каждый
+    ожидающий запрос получает свои строки результата.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        executor: Optional[InferenceExecutor] = None
+    ):
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size or settings.BATCH_MAX_SIZE
+        if max_wait_ms is None:
+            max_wait_ms = settings.BATCH_MAX_WAIT_MS
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending: List[Tuple[np.ndarray, asyncio.Future]] = []
+        self._pending_rows = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def predict(self, img_array: np.ndarray) -> np.ndarray:
+        """Предсказание для массива формы (n, 224, 224, 3) в составе общего батча
+
+        Args:
+            img_array: np.ndarray - предобработанные изображения
+
+        Returns:
+            np.ndarray: Предсказания формы (n, n_classes)
+        """
+        img_array = np.asarray(img_array, dtype=np.float32)
+        if img_array.ndim == 3:
+            img_array = np.expand_dims(img_array, axis=0)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((img_array, future))
+        self._pending_rows += len(img_array)
+
+        if self._pending_rows >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Отправка накопленных запросов одним батчем"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending, self._pending = self._pending, []
+        self._pending_rows = 0
+        if not pending:
+            return
+
+        task = asyncio.ensure_future(self._run_batch(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, pending: List[Tuple[np.ndarray, asyncio.Future]]):
+        """Один проход модели в пуле инференса и раздача строк результата"""
+        logger.debug(f"Running batched prediction for {len(pending)} requests")
+        executor = self.executor or get_inference_executor()
+        try:
+            batch = np.concatenate([img for img, _ in pending], axis=0)
+            predictions = await executor.run("predict", self.predict_fn, batch)
+            predictions = np.asarray(predictions)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for img, future in pending:
+            rows = predictions[offset:offset + len(img)]
+            offset += len(img)
+            if not future.done():
+                future.set_result(rows)
+
+
+_scheduler: Optional[BatchScheduler] = None
+
+
+def get_batch_scheduler(predict_fn: Callable[[np.ndarray], np.ndarray]) -> BatchScheduler:
+    """Планировщик батчей для функции инференса (пересоздается при ее смене)"""
+    global _scheduler
+    if _scheduler is None or _scheduler.predict_fn is not predict_fn:
+        _scheduler = BatchScheduler(predict_fn)
+    return _scheduler
@@ -0,0 +1,105 @@
+import base64
+import binascii
+import json
+import zlib
+from typing import Any
+import msgpack
+from app.core.config import settings
+
+try:
+    import lz4.frame
+except ImportError:  # lz4 - необязательная зависимость
+    lz4 = None
+
+# Заголовок бинарной записи: сигнатура + версия + способ сжатия
+MAGIC = b"MRC\x01"
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_LZ4 = 2
+COMPRESSIONS = {"none": COMPRESSION_NONE, "zlib": COMPRESSION_ZLIB, "lz4": COMPRESSION_LZ4}
+
+# Поля с base64 (PNG-визуализации, данные массивов кэша этапов) хранятся сырыми байтами
+BASE64_FIELDS = frozenset({"heatmap_img", "lime_img", "attribution_img", "data"})
+_EXT_BASE64 = 1
+
+
+class _Base64Bytes:
+    __slots__ = ("raw",)
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+
+
+def _pack_default(obj):
+    if isinstance(obj, _Base64Bytes):
+        return msgpack.ExtType(_EXT_BASE64, obj.raw)
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def _unpack_ext(code: int, data: bytes):
+    if code == _EXT_BASE64:
+        return base64.b64encode(data).decode("ascii")
+    return msgpack.ExtType(code, data)
+
+
+def _strip_base64(value: Any) -> Any:
+    """Замена base64-строк известных полей на их байты (обратно - при декодировании)"""
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key in BASE64_FIELDS and isinstance(item, str):
+                try:
+                    raw = base64.b64decode(item, validate=True)
+                except (binascii.Error, ValueError):
+                    result[key] = item
+                    continue
+                # Только каноничный base64 восстанавливается побайтно
+                result[key] = _Base64Bytes(raw) if base64.b64encode(raw).decode("ascii") == item else item
+            else:
+                result[key] = _strip_base64(item)
+        return result
+    if isinstance(value, (list, tuple)):
+        return [_strip_base64(item) for item in value]
+    return value
+
+
+def encode(value: Any, compression: str = None) -> bytes:
+    """Сериализация значения кэша: msgpack + необязательное сжатие
+
+    Args:
+        value: JSON-совместимое значение (результат анализа, запись кэша этапов)
+        compression: none, zlib или lz4 (по умолчанию settings.CACHE_COMPRESSION)
+    """
+    compression = compression or settings.CACHE_COMPRESSION
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown cache compression '{compression}', expected one of {sorted(COMPRESSIONS)}")
+    if compression == "lz4" and lz4 is None:
+        compression = "none"
+
+    payload = msgpack.packb(_strip_base64(value), default=_pack_default, use_bin_type=True)
+    method = COMPRESSIONS[compression]
+    if method == COMPRESSION_ZLIB:
+        payload = zlib.compress(payload, settings.CACHE_COMPRESSION_LEVEL)
+    elif method == COMPRESSION_LZ4:
+        payload = lz4.frame.compress(payload)
+    return MAGIC + bytes([method]) + payload
+
+
+def decode(data: bytes) -> Any:
+    """Десериализация значения кэша; записи в старом формате JSON читаются как есть"""
+    if isinstance(data, str):
+        return json.loads(data)
+    if not data.startswith(MAGIC):
+        return json.loads(data.decode("utf-8"))
+
+    method = data[len(MAGIC)]
+    payload = data[len(MAGIC) + 1:]
+    if method == COMPRESSION_ZLIB:
+        payload = zlib.decompress(payload)
+    elif method == COMPRESSION_LZ4:
+        if lz4 is None:
+            raise ValueError("Cache entry is lz4-compressed but lz4 is not installed")
+        payload = lz4.frame.decompress(payload)
+    elif method != COMPRESSION_NONE:
+        raise ValueError(f"Unknown cache compression method {method}")
+    return msgpack.unpackb(payload, ext_hook=_unpack_ext, raw=False)
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.services.cache_namespace import PREFIX, RESERVED
+
+logger = logging.getLogger(__name__)
+
+# Поля INFO, по которым подбирается размер кэша
+INFO_FIELDS = {
+    "memory": ("used_memory", "used_memory_peak", "maxmemory", "maxmemory_policy"),
+    "stats": ("evicted_keys", "expired_keys", "keyspace_hits", "keyspace_misses"),
+}
+
+
+class CacheMetrics:
+    """Счетчики попаданий и промахов кэша по областям (эндпоинт, этап, уровень кэша)
+
+    Счетчики ведутся в памяти процесса: при нескольких воркерах каждый
+    отдает свои значения.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scopes = defaultdict(lambda: {"hits": 0, "misses": 0, "writes": 0, "bytes_written": 0})
+
+    def hit(self, scope: str):
+        with self._lock:
+            self._scopes[scope]["hits"] += 1
+
+    def miss(self, scope: str):
+        with self._lock:
+            self._scopes[scope]["misses"] += 1
+
+    def record(self, scope: str, hit: bool):
+        if hit:
+            self.hit(scope)
+        else:
+            self.miss(scope)
+
+    def write(self, scope: str, size: int):
+        """Запись в кэш размером size байт (после кодирования)"""
+        with self._lock:
+            self._scopes[scope]["writes"] += 1
+            self._scopes[scope]["bytes_written"] += size
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Счетчики с долей попаданий и средним размером записи по каждой области"""
+        with self._lock:
+            scopes = {scope: dict(counters) for scope, counters in self._scopes.items()}
+        for counters in scopes.values():
+            lookups = counters["hits"] + counters["misses"]
+            counters["hit_ratio"] = counters["hits"] / lookups if lookups else None
+            counters["avg_entry_bytes"] = (
+                counters["bytes_written"] / counters["writes"] if counters["writes"] else None
+            )
+        return dict(sorted(scopes.items()))
+
+    def reset(self):
+        with self._lock:
+            self._scopes.clear()
+
+
+def key_category(key: str, namespace: str) -> Optional[str]:
+    """Категория ключа кэша для подсчета: result, stage:{этап}, phash, служебные или stale"""
+    parts = key.split(":")
+    if len(parts) < 2 or parts[0] != PREFIX:
+        return None
+    if parts[1] in RESERVED:
+        return parts[1]
+    if parts[1] != namespace:
+        return "stale"
+    if len(parts) > 3 and parts[2] == "stage":
+        return f"stage:{parts[3]}"
+    if len(parts) > 2 and parts[2] == "phash":
+        return "phash"
+    return "result"
+
+
+async def scan_key_counts(redis, namespace: str, batch_size: Optional[int] = None) -> Dict[str, int]:
+    """Число ключей mri:* по категориям через SCAN (без блокирующего KEYS)"""
+    batch_size = batch_size or settings.CACHE_SWEEP_BATCH
+    counts: Dict[str, int] = defaultdict(int)
+    cursor = 0
+    while True:
+        cursor, keys = await redis.scan(cursor, match=f"{PREFIX}:*", count=batch_size)
+        for key in keys:
+            category = key_category(key.decode("utf-8") if isinstance(key, bytes) else key, namespace)
+            if category is not None:
+                counts[category] += 1
+        if not cursor:
+            break
+        # Отдаем управление event loop между пакетами
+        await asyncio.sleep(0)
+    return dict(sorted(counts.items()))
+
+
+class KeyCounts:
+    """Последний подсчет ключей SCAN для /cache/metrics
+
+    Скрейп Prometheus не запускает SCAN сам: счетчики пересчитываются в фоне
+    не чаще раза в interval секунд, до первого подсчета метрик ключей нет.
+    """
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = settings.CACHE_KEY_COUNT_INTERVAL if interval is None else interval
+        self.counts: Dict[str, int] = {}
+        self.updated_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def update(self, counts: Dict[str, int]):
+        self.counts = counts
+        self.updated_at = time.monotonic()
+
+    def get(self, redis, namespace: str) -> Dict[str, int]:
+        """Последние значения; устаревшие пересчитываются в фоне"""
+        stale = self.updated_at is None or time.monotonic() - self.updated_at >= self.interval
+        if stale and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._refresh(redis, namespace))
+        return self.counts
+
+    async def _refresh(self, redis, namespace: str):
+        try:
+            self.update(await scan_key_counts(redis, namespace))
+        except Exception as e:
+            logger.warning(f"Failed to count cache keys: {str(e)}")
+
+
+async def redis_info(redis) -> Dict[str, Any]:
+    """Память и вытеснения из INFO"""
+    info = {}
+    for section, fields in INFO_FIELDS.items():
+        data = await redis.info(section)
+        for field in fields:
+            value = data.get(field)
+            info[field] = value.decode("utf-8") if isinstance(value, bytes) else value
+    return info
+
+
+def to_prometheus(stats: Dict[str, Any]) -> str:
+    """Метрики кэша в текстовом формате Prometheus"""
+    lines = []
+
+    def metric(name, value, help_text, labels=None, kind="gauge"):
+        if value is None:
+            return
+        if not any(line.startswith(f"# HELP {name} ") for line in lines):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+        label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}" if labels else ""
+        lines.append(f"{name}{label_text} {value}")
+
+    # Все строки одной метрики должны идти подряд
+    for name, field, help_text in (("mri_cache_hits_total", "hits", "Cache hits"),
+                                   ("mri_cache_misses_total", "misses", "Cache misses"),
+                                   ("mri_cache_writes_total", "writes", "Cache writes"),
+                                   ("mri_cache_written_bytes_total", "bytes_written", "Encoded bytes written")):
+        for scope, counters in stats["scopes"].items():
+            metric(name, counters[field], help_text, {"scope": scope}, "counter")
+    local = stats["local"]
+    metric("mri_local_cache_entries", local["entries"], "Entries in the in-process LRU")
+    metric("mri_local_cache_bytes", local["bytes"], "Bytes in the in-process LRU")
+    metric("mri_local_cache_evictions_total", local["evictions"], "Evictions from the in-process LRU", kind="counter")
+    for field in ("used_memory", "maxmemory", "evicted_keys", "expired_keys", "keyspace_hits", "keyspace_misses"):
+        metric(f"mri_redis_{field}", stats["redis"].get(field), f"Redis INFO {field}")
+    for category, count in stats["keys"].items():
+        metric("mri_cache_keys", count, "Cache keys by category (SCAN)", {"category": category})
+    return "\n".join(lines) + "\n"
+
+
+cache_metrics = CacheMetrics()
+key_counts = KeyCounts()
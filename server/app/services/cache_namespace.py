@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import logging
+from typing import Optional
+from app.core.config import settings
+from app.models.model_loader import get_weights_fingerprint
+from app.schemas.predictions import AttributionMethod
+from app.services.analysis_plan import AnalysisPlan
+
+logger = logging.getLogger(__name__)
+
+# Все ключи кэша результатов: mri:{пространство имен}:...
+PREFIX = "mri"
+# Служебные ключи вне пространств имен, которые очистка не трогает
+RESERVED = frozenset({"lease", "job"})
+# Версия формата сохраненного результата; повышается при изменении структуры ответа
+# (2 - изображения ссылками *_url на хранилище артефактов вместо base64 *_img)
+RESULT_FORMAT = 2
+
+
+def explainer_config() -> dict:
+    """Параметры, влияющие на результат анализа помимо весов модели"""
+    return {
+        "result_format": RESULT_FORMAT,
+        "model_version": settings.MODEL_VERSION,
+        "gradcam_layer": settings.GRADCAM_LAYER,
+        "lime_num_samples": settings.LIME_NUM_SAMPLES,
+        "lime_segmenter": settings.LIME_SEGMENTER,
+        "lime_adaptive": settings.LIME_ADAPTIVE,
+        "lime_min_samples": settings.LIME_MIN_SAMPLES,
+        "lime_tolerance": settings.LIME_TOLERANCE,
+        "attribution_steps": settings.ATTRIBUTION_STEPS,
+        "smoothgrad_noise": settings.SMOOTHGRAD_NOISE,
+    }
+
+
+def current_namespace() -> str:
+    """Пространство имен кэша: отпечаток весов модели + конфигурации объяснений
+
+    Отпечаток берется у весов, загруженных в память (см. get_weights_fingerprint),
+    а не у файла на диске. После загрузки новых весов или настроек объяснений ключи меняются сами,
+    старые записи перестают читаться и удаляются CacheSweeper.
+    """
+    config = ",".join(f"{k}={v}" for k, v in sorted(explainer_config().items()))
+    digest = hashlib.blake2b(f"{get_weights_fingerprint()}|{config}".encode(), digest_size=8)
+    return f"v{digest.hexdigest()}"
+
+
+def namespaced_key(*parts: str) -> str:
+    """Ключ в текущем пространстве имен: mri:{ns}:{parts...}"""
+    return ":".join((PREFIX, current_namespace(), *parts))
+
+
+def result_cache_key(digest: str, attribution: AttributionMethod = AttributionMethod.LIME,
+                     plan: Optional[AnalysisPlan] = None) -> str:
+    """Ключ кэша результата /analyze (и /classify для LIME) по хэшу содержимого"""
+    # Пространство имен меняется вместе с весами модели и настройками объяснений
+    cache_key = namespaced_key(digest)
+    if plan is not None and not plan.is_full:
+        # Частичный анализ (include=) хранится под своим набором полей
+        return f"{cache_key}:include={'+'.join(plan.tokens)}"
+    if attribution != AttributionMethod.LIME:
+        # Результаты с другим методом объяснения хранятся отдельно
+        cache_key = f"{cache_key}:{attribution.value}"
+    return cache_key
+
+
+def is_stale_key(key: str, namespace: str) -> bool:
+    """Ключ кэша из другого (старого) пространства имен или старого формата без него"""
+    parts = key.split(":")
+    if len(parts) < 2 or parts[0] != PREFIX:
+        return False
+    return parts[1] != namespace and parts[1] not in RESERVED
+
+
+class CacheSweeper:
+    """Фоновое удаление ключей старых пространств имен
+
+    Проходит ключи mri:* через SCAN небольшими пакетами с паузами, чтобы не
+    блокировать Redis, и удаляет их через UNLINK.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, pause: Optional[float] = None):
+        self.batch_size = batch_size or settings.CACHE_SWEEP_BATCH
+        self.pause = settings.CACHE_SWEEP_PAUSE if pause is None else pause
+        self._task: Optional[asyncio.Task] = None
+
+    async def sweep(self, redis, namespace: Optional[str] = None) -> int:
+        """Один проход по ключам; возвращает число удаленных ключей"""
+        namespace = namespace or current_namespace()
+        removed = 0
+        cursor = 0
+        while True:
+            cursor, keys = await redis.scan(cursor, match=f"{PREFIX}:*", count=self.batch_size)
+            stale = [key for key in keys
+                     if is_stale_key(key.decode("utf-8") if isinstance(key, bytes) else key, namespace)]
+            if stale:
+                removed += await redis.unlink(*stale)
+            if not cursor:
+                break
+            await asyncio.sleep(self.pause)
+        logger.info(f"Cache sweep finished: removed {removed} stale keys, namespace {namespace}")
+        return removed
+
+    def start(self, redis):
+        """Запуск очистки в фоне (например, при старте после деплоя)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run(redis))
+
+    async def _run(self, redis):
+        try:
+            await self.sweep(redis)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # Не критично: старые записи все равно истекут по TTL
+            logger.warning(f"Cache sweep failed: {str(e)}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+cache_sweeper = CacheSweeper()
@@ -0,0 +1,44 @@
+import hashlib
+from typing import Tuple
+from fastapi import UploadFile
+
+# Размер блока чтения загружаемого файла
+CHUNK_SIZE = 64 * 1024
+# BLAKE2b с 128-битным дайджестом: быстрый и без коллизий общих заголовков JPEG
+DIGEST_SIZE = 16
+# Формат идентификатора содержимого: hex BLAKE2b-128, дефис, длина в байтах
+DIGEST_PATTERN = r"^[0-9a-f]{32}-[0-9]+$"
+
+
+def _format_digest(hasher, length: int) -> str:
+    return f"{hasher.hexdigest()}-{length}"
+
+
+def content_digest(data: bytes) -> str:
+    """Идентификатор содержимого: BLAKE2b-128 всего файла + его длина
+
+    Клиент может вычислить его локально: hex(blake2b(data, digest_size=16)) + "-" + len(data)
+    """
+    return _format_digest(hashlib.blake2b(data, digest_size=DIGEST_SIZE), len(data))
+
+
+async def read_upload(file: UploadFile) -> Tuple[bytes, str]:
+    """Чтение загружаемого файла с вычислением хэша содержимого на лету
+
+    Файл читается один раз блоками; возвращенное содержимое передается дальше
+    в пайплайн без повторного чтения.
+
+    Returns:
+        Tuple[bytes, str]: Содержимое файла и его идентификатор (см. content_digest)
+    """
+    hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    chunks = []
+    length = 0
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        hasher.update(chunk)
+        chunks.append(chunk)
+        length += len(chunk)
+    return b"".join(chunks), _format_digest(hasher, length)
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from app.core.config import settings
+from app.core.exceptions import ServiceBusyError, StageTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceExecutor:
+    """Выполнение тяжелых этапов анализа (TensorFlow, LIME) в пуле потоков
+
+    Event loop не блокируется: кэш и легкие эндпоинты отвечают, пока идут
+    тяжелые вычисления. Очередь ограничена, каждый этап имеет свой таймаут,
+    который отсчитывается с момента, когда воркер взял задачу. Предсказания
+    идут в отдельный пул со своей очередью, чтобы долгие объяснения (LIME до
+    нескольких минут) не задерживали /classify.
+    """
+
+    PREDICT_STAGES = ("predict",)
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_queue_size: Optional[int] = None,
+        stage_timeouts: Optional[Dict[str, float]] = None,
+        predict_workers: Optional[int] = None
+    ):
+        self.max_workers = max_workers or settings.INFERENCE_WORKERS
+        self.predict_workers = predict_workers or settings.INFERENCE_PREDICT_WORKERS
+        if max_queue_size is None:
+            max_queue_size = settings.INFERENCE_QUEUE_SIZE
+        self.max_queue_size = max_queue_size
+        self.stage_timeouts = stage_timeouts if stage_timeouts is not None else dict(settings.STAGE_TIMEOUTS)
+        self._pools = {
+            "predict": ThreadPoolExecutor(max_workers=self.predict_workers, thread_name_prefix="inference-predict"),
+            "default": ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference"),
+        }
+        self._workers = {"predict": self.predict_workers, "default": self.max_workers}
+        self._in_flight = {"predict": 0, "default": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        """Количество выполняемых и ожидающих задач"""
+        return sum(self._in_flight.values())
+
+    async def run(self, stage: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Выполнение функции этапа в пуле потоков
+
+        Args:
+            stage: str - название этапа (predict, gradcam, lime), задает таймаут
+            fn: Callable - синхронная функция этапа
+
+        Returns:
+            Any: Результат функции
+
+        Raises:
+            ServiceBusyError: Очередь инференса переполнена
+            StageTimeoutError: Этап не уложился в таймаут
+        """
+        lane = "predict" if stage in self.PREDICT_STAGES else "default"
+        with self._lock:
+            if self._in_flight[lane] >= self._workers[lane] + self.max_queue_size:
+                raise ServiceBusyError(f"Очередь инференса переполнена (этап {stage})")
+            self._in_flight[lane] += 1
+
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+
+        def job():
+            loop.call_soon_threadsafe(_set_result, started, time.monotonic())
+            return fn(*args, **kwargs)
+
+        try:
+            future = self._pools[lane].submit(job)
+        except Exception:
+            self._release(lane)
+            raise
+        # Слот освобождается по фактическому завершению потока, а не по таймауту
+        future.add_done_callback(lambda _: self._release(lane))
+        result = asyncio.wrap_future(future)
+
+        timeout = self.stage_timeouts.get(stage)
+        try:
+            if timeout is None:
+                return await result
+            # Ожидание свободного воркера не входит в таймаут этапа
+            await asyncio.wait({started, result}, return_when=asyncio.FIRST_COMPLETED)
+            elapsed = time.monotonic() - started.result() if started.done() else 0.0
+            return await asyncio.wait_for(result, timeout=max(timeout - elapsed, 0.0))
+        except asyncio.TimeoutError:
+            future.cancel()
+            logger.error(f"Stage '{stage}' timed out after {timeout}s")
+            raise StageTimeoutError(f"Превышено время выполнения этапа {stage} ({timeout} с)")
+        except asyncio.CancelledError:
+            # Задача из очереди не запустится, если ее уже никто не ждет
+            future.cancel()
+            raise
+
+    def _release(self, lane: str):
+        with self._lock:
+            self._in_flight[lane] -= 1
+
+    def shutdown(self, wait: bool = False):
+        """Остановка пулов потоков"""
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def _set_result(future: asyncio.Future, value: Any):
+    if not future.done():
+        future.set_result(value)
+
+
+_executor: Optional[InferenceExecutor] = None
+
+
+def get_inference_executor() -> InferenceExecutor:
+    """Общий пул инференса процесса"""
+    global _executor
+    if _executor is None:
+        _executor = InferenceExecutor()
+    return _executor
+
+
+def shutdown_inference_executor():
+    """Остановка общего пула инференса"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
@@ -0,0 +1,435 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+import uuid
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.core.exceptions import JobNotFoundError, MRIAnalysisError, ServiceBusyError
+from app.schemas.jobs import JobStatus
+from app.services import cache_codec
+from app.services.cache_namespace import PREFIX
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = frozenset({JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED, JobStatus.EXPIRED})
+
+
+@dataclass
+class Job:
+    """Задача анализа; содержимое файла хранится в бэкенде отдельно"""
+    id: str
+    digest: str
+    priority: int = 0
+    attribution: Optional[str] = None
+    include: Optional[str] = None
+    status: JobStatus = JobStatus.QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    deadline: Optional[float] = None  # Абсолютное время (time.time()), после которого задача не нужна
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["status"] = self.status.value
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Job":
+        return cls(**{**data, "status": JobStatus(data["status"])})
+
+
+class LocalJobBackend:
+    """Очередь задач в памяти процесса (один узел, один процесс uvicorn)
+
+    Очередь - куча по (-приоритет, порядковый номер): задачи с большим
+    приоритетом выполняются раньше, с равным - в порядке поступления.
+    Отмененные задачи остаются в куче и пропускаются при выборке.
+    """
+
+    shared = False
+
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_size = max_size or settings.JOB_QUEUE_SIZE
+        self.ttl = ttl or settings.JOB_TTL
+        self._jobs: Dict[str, Job] = {}
+        self._contents: Dict[str, bytes] = {}
+        self._heap: List[Tuple[int, int, str]] = []
+        self._counter = itertools.count()
+        self._available = asyncio.Condition()
+
+    async def put(self, job: Job, contents: bytes):
+        self._prune()
+        if self.pending() >= self.max_size:
+            raise ServiceBusyError("Очередь задач переполнена, повторите запрос позже")
+        self._jobs[job.id] = job
+        self._contents[job.id] = contents
+        async with self._available:
+            heapq.heappush(self._heap, (-job.priority, next(self._counter), job.id))
+            self._available.notify()
+
+    async def take(self, timeout: float) -> Optional[Tuple[Job, bytes]]:
+        """Следующая задача по приоритету или None, если за timeout задач не появилось"""
+        async with self._available:
+            while True:
+                while self._heap:
+                    _, _, job_id = heapq.heappop(self._heap)
+                    job = self._jobs.get(job_id)
+                    if job is not None and job.status == JobStatus.QUEUED:
+                        return job, self._contents.pop(job_id)
+                try:
+                    await asyncio.wait_for(self._available.wait(), timeout)
+                except asyncio.TimeoutError:
+                    return None
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def mark_running(self, job: Job) -> bool:
+        """Перевод задачи QUEUED → RUNNING; False, если ее уже отменили"""
+        if not self._transition(replace(job, status=JobStatus.RUNNING), (JobStatus.QUEUED,)):
+            return False
+        job.status = JobStatus.RUNNING
+        return True
+
+    async def finish(self, job: Job) -> bool:
+        """Запись завершенной задачи; False, если она уже завершена (например, отменена)"""
+        if not self._transition(job, (JobStatus.QUEUED, JobStatus.RUNNING)):
+            return False
+        self._contents.pop(job.id, None)
+        return True
+
+    async def requeue(self, job: Job, contents: bytes) -> bool:
+        """Возврат прерванной задачи RUNNING → QUEUED"""
+        if not self._transition(job, (JobStatus.RUNNING,)):
+            return False
+        self._contents[job.id] = contents
+        async with self._available:
+            heapq.heappush(self._heap, (-job.priority, next(self._counter), job.id))
+            self._available.notify()
+        return True
+
+    def _transition(self, job: Job, expected: Iterable[JobStatus]) -> bool:
+        """Compare-and-set: запись job, только если текущий статус из expected
+
+        Хранится отдельный объект: изменения задачи воркером не видны до записи.
+        """
+        current = self._jobs.get(job.id)
+        if current is None or current.status not in expected:
+            return False
+        self._jobs[job.id] = job
+        return True
+
+    async def remove(self, job_id: str):
+        """Удаление задачи из очереди (запись о ней остается)"""
+        self._contents.pop(job_id, None)
+
+    def pending(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == JobStatus.QUEUED)
+
+    def _prune(self):
+        """Удаление завершенных задач старше ttl"""
+        expired_before = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and (job.finished_at or 0) < expired_before]:
+            del self._jobs[job_id]
+
+
+class RedisJobBackend:
+    """Очередь задач в Redis, общая для нескольких воркеров и узлов
+
+    Задача - хэш mri:job:{id} (поля job, status и contents), очередь - sorted
+    set mri:job:queue со счетом -приоритет * 10^13 + время постановки в мс.
+    Статус дублируется открытым полем status, чтобы переходы между статусами
+    (запуск, завершение, отмена, возврат в очередь) выполнялись атомарно
+    скриптом Lua (job закодирован cache_codec).
+    """
+
+    shared = True
+    QUEUE_KEY = f"{PREFIX}:job:queue"
+    # Compare-and-set статуса (ARGV: новый статус, job, ttl, допустимые текущие статусы):
+    # отмена из другого процесса не перезаписывается. Записи без поля status
+    # (до его появления) считаются поставленными в очередь
+    TRANSITION_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local status = redis.call('HGET', KEYS[1], 'status') or 'queued'
+for i = 4, #ARGV do
+    if status == ARGV[i] then
+        redis.call('HSET', KEYS[1], 'status', ARGV[1], 'job', ARGV[2])
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        return 1
+    end
+end
+return 0
+"""
+
+    def __init__(self, redis, max_size: Optional[int] = None, ttl: Optional[float] = None):
+        self.redis = redis
+        self.max_size = max_size or settings.JOB_QUEUE_SIZE
+        self.ttl = int(ttl or settings.JOB_TTL)
+
+    @staticmethod
+    def key(job_id: str) -> str:
+        return f"{PREFIX}:job:{job_id}"
+
+    async def put(self, job: Job, contents: bytes):
+        if await self.redis.zcard(self.QUEUE_KEY) >= self.max_size:
+            raise ServiceBusyError("Очередь задач переполнена, повторите запрос позже")
+        key = RedisJobBackend.key(job.id)
+        await self.redis.hset(key, mapping={
+            "job": cache_codec.encode(job.to_dict()), "status": job.status.value, "contents": contents
+        })
+        await self.redis.expire(key, self.ttl)
+        await self.redis.zadd(self.QUEUE_KEY, {job.id: RedisJobBackend.score(job)})
+
+    @staticmethod
+    def score(job: Job) -> int:
+        return -job.priority * 10 ** 13 + int(job.created_at * 1000)
+
+    async def take(self, timeout: float) -> Optional[Tuple[Job, bytes]]:
+        popped = await self.redis.bzpopmin(self.QUEUE_KEY, timeout=max(timeout, 0.01))
+        if not popped:
+            return None
+        job_id = popped[1].decode("utf-8") if isinstance(popped[1], bytes) else popped[1]
+        data, contents = await self.redis.hmget(RedisJobBackend.key(job_id), ["job", "contents"])
+        if data is None or contents is None:
+            return None
+        job = Job.from_dict(cache_codec.decode(data))
+        if job.status != JobStatus.QUEUED:
+            return None
+        return job, contents
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        data = await self.redis.hget(RedisJobBackend.key(job_id), "job")
+        return None if data is None else Job.from_dict(cache_codec.decode(data))
+
+    async def mark_running(self, job: Job) -> bool:
+        """Перевод задачи QUEUED → RUNNING; False, если ее уже отменили"""
+        if not await self._transition(replace(job, status=JobStatus.RUNNING), (JobStatus.QUEUED,)):
+            return False
+        job.status = JobStatus.RUNNING
+        return True
+
+    async def finish(self, job: Job) -> bool:
+        """Запись завершенной задачи; False, если она уже завершена (например, отменена)"""
+        if not await self._transition(job, (JobStatus.QUEUED, JobStatus.RUNNING)):
+            return False
+        await self.redis.hdel(RedisJobBackend.key(job.id), "contents")
+        return True
+
+    async def requeue(self, job: Job, contents: bytes) -> bool:
+        """Возврат прерванной задачи RUNNING → QUEUED (содержимое файла еще в Redis)"""
+        if not await self._transition(job, (JobStatus.RUNNING,)):
+            return False
+        await self.redis.zadd(self.QUEUE_KEY, {job.id: RedisJobBackend.score(job)})
+        return True
+
+    async def _transition(self, job: Job, expected: Iterable[JobStatus]) -> bool:
+        return bool(await self.redis.eval(
+            RedisJobBackend.TRANSITION_SCRIPT, 1, RedisJobBackend.key(job.id), job.status.value,
+            cache_codec.encode(job.to_dict()), self.ttl, *(status.value for status in expected)
+        ))
+
+    async def remove(self, job_id: str):
+        await self.redis.zrem(self.QUEUE_KEY, job_id)
+        await self.redis.hdel(RedisJobBackend.key(job_id), "contents")
+
+
+class JobManager:
+    """Асинхронные задачи анализа: очередь с приоритетами и пул воркеров
+
+    POST /jobs ставит задачу и сразу возвращает идентификатор, воркеры
+    выполняют ее через handler (тот же путь, что /analyze, с кэшем и
+    single-flight). Задача с deadline, не начатая или не завершенная к этому
+    времени, получает статус expired. Отмена снимает задачу из очереди или
+    прерывает ожидание ее результата; уже запущенный этап инференса
+    дорабатывает в пуле потоков, и его результат попадает в кэш. Задачи,
+    прерванные остановкой воркеров, возвращаются в очередь.
+    """
+
+    def __init__(self, workers: Optional[int] = None, poll_interval: Optional[float] = None,
+                 busy_retry_delay: Optional[float] = None, busy_timeout: Optional[float] = None):
+        self.workers = workers or settings.JOB_WORKERS
+        self.poll_interval = poll_interval or settings.JOB_POLL_INTERVAL
+        self.busy_retry_delay = busy_retry_delay or settings.JOB_BUSY_RETRY_DELAY
+        self.busy_timeout = busy_timeout or settings.JOB_BUSY_TIMEOUT
+        self.backend = None
+        self.handler: Optional[Callable[[Job, bytes], Awaitable[Dict[str, Any]]]] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelled: Set[str] = set()
+
+    def start(self, handler: Callable[[Job, bytes], Awaitable[Dict[str, Any]]], backend=None):
+        """Запуск воркеров; без backend - очередь в памяти процесса"""
+        self.handler = handler
+        self.backend = backend or LocalJobBackend()
+        if not self._tasks:
+            self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def _backend(self):
+        if self.backend is None:
+            raise ServiceBusyError("Очередь задач не запущена")
+        return self.backend
+
+    async def submit(self, contents: bytes, digest: str, attribution: Optional[str] = None,
+                     include: Optional[str] = None, priority: int = 0,
+                     deadline: Optional[float] = None) -> Job:
+        """Постановка задачи в очередь
+
+        Args:
+            deadline: Сколько секунд от постановки задача остается нужной
+        """
+        now = time.time()
+        job = Job(
+            id=uuid.uuid4().hex, digest=digest, priority=priority, attribution=attribution,
+            include=include, created_at=now, deadline=now + deadline if deadline else None
+        )
+        await self._backend().put(job, contents)
+        logger.info(f"Job {job.id} queued (digest {digest}, priority {priority})")
+        return job
+
+    async def get(self, job_id: str) -> Job:
+        job = await self._backend().get(job_id)
+        if job is None:
+            raise JobNotFoundError()
+        return job
+
+    async def cancel(self, job_id: str) -> Job:
+        """Отмена задачи; завершенная задача возвращается без изменений"""
+        job = await self.get(job_id)
+        if job.finished:
+            return job
+        cancelled = replace(job, status=JobStatus.CANCELLED, finished_at=time.time())
+        if not await self.backend.finish(cancelled):
+            # Задача завершилась раньше отмены
+            return await self.get(job_id)
+        job = cancelled
+        await self.backend.remove(job_id)
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancelled.add(job_id)
+            task.cancel()
+        logger.info(f"Job {job_id} cancelled")
+        return job
+
+    async def _worker(self):
+        while True:
+            try:
+                item = await self.backend.take(self.poll_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to take a job from the queue: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+            if item is None:
+                continue
+            try:
+                await self._execute(*item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Ошибка бэкенда при сохранении статуса не должна останавливать воркер
+                logger.error(f"Job {item[0].id} could not be processed: {str(e)}", exc_info=True)
+
+    async def _run_handler(self, job: Job, contents: bytes) -> Dict[str, Any]:
+        give_up_at = time.monotonic() + self.busy_timeout
+        while True:
+            try:
+                return await self.handler(job, contents)
+            except ServiceBusyError:
+                # Пул инференса занят: ждем и повторяем, но не дольше busy_timeout
+                # (и deadline); после этого задача завершается с ошибкой
+                if time.monotonic() >= give_up_at:
+                    raise
+                await asyncio.sleep(self.busy_retry_delay)
+
+    async def _execute(self, job: Job, contents: bytes):
+        now = time.time()
+        if job.deadline is not None and now >= job.deadline:
+            await self._finish(job, JobStatus.EXPIRED, error="Deadline passed before the job started")
+            return
+
+        job.started_at = now
+        if not await self.backend.mark_running(job):
+            # Задачу отменили между выборкой из очереди и запуском
+            logger.info(f"Job {job.id} was cancelled before it started")
+            return
+
+        task = asyncio.ensure_future(self._run_handler(job, contents))
+        self._running[job.id] = task
+        watcher = asyncio.ensure_future(self._watch(job.id, task)) if self.backend.shared else None
+        timeout = job.deadline - now if job.deadline is not None else None
+        try:
+            result = await asyncio.wait_for(task, timeout)
+            await self._finish(job, JobStatus.SUCCEEDED, result=result)
+        except asyncio.TimeoutError:
+            await self._finish(job, JobStatus.EXPIRED, error="Deadline exceeded")
+        except asyncio.CancelledError:
+            if job.id not in self._cancelled:
+                # Остановка воркеров: задача не должна навсегда остаться running
+                await self._requeue(job, contents)
+                raise
+        except MRIAnalysisError as e:
+            await self._finish(job, JobStatus.FAILED, error=str(e.detail))
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}", exc_info=True)
+            await self._finish(job, JobStatus.FAILED, error=str(e))
+        finally:
+            self._running.pop(job.id, None)
+            self._cancelled.discard(job.id)
+            if watcher is not None:
+                watcher.cancel()
+
+    async def _watch(self, job_id: str, task: asyncio.Task):
+        """Отмена задачи, отмененной через другой воркер (общий бэкенд)"""
+        while not task.done():
+            await asyncio.sleep(self.poll_interval)
+            try:
+                current = await self.backend.get(job_id)
+            except Exception:
+                continue
+            if current is not None and current.status == JobStatus.CANCELLED:
+                self._cancelled.add(job_id)
+                task.cancel()
+                return
+
+    async def _requeue(self, job: Job, contents: bytes):
+        queued = replace(job, status=JobStatus.QUEUED, started_at=None)
+        try:
+            if await self.backend.requeue(queued, contents):
+                logger.info(f"Job {job.id} returned to the queue")
+        except Exception as e:
+            logger.warning(f"Failed to return job {job.id} to the queue: {str(e)}")
+
+    async def _finish(self, job: Job, status: JobStatus, result: Optional[Dict[str, Any]] = None,
+                      error: Optional[str] = None):
+        finished = replace(job, status=status, result=result, error=error, finished_at=time.time())
+        # Compare-and-set: задача, отмененная во время выполнения, остается cancelled
+        if not await self.backend.finish(finished):
+            logger.info(f"Job {job.id} was cancelled, {status.value} result dropped")
+            return
+        logger.info(f"Job {job.id} {status.value}")
+
+
+job_manager = JobManager()
@@ -0,0 +1,93 @@
+import logging
+from typing import List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.models.ImageProcessor import ImageProcessor
+from app.services.cache_namespace import namespaced_key
+from app.services.result_cache import ResultCache, result_cache
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+
+
+class NearDuplicateIndex:
+    """Индекс почти одинаковых снимков по перцептивному хэшу
+
+    Поиск по расстоянию Хэмминга без перебора (multi-index hashing): 64-битный
+    хэш делится на threshold + 1 полос, и по принципу Дирихле хэши на
+    расстоянии не больше threshold совпадают хотя бы в одной полосе. Каждая
+    полоса - множество Redis mri:{ns}:phash:{алгоритм}:t{порог}:{полоса}:{значение}
+    с элементами "{хэш}:{хэш содержимого}".
+    """
+
+    def __init__(self, cache: Optional[ResultCache] = None, algorithm: Optional[str] = None,
+                 threshold: Optional[int] = None, expire: Optional[int] = None):
+        self.cache = cache or result_cache
+        self.algorithm = algorithm or settings.NEAR_DUPLICATE_ALGORITHM
+        self.threshold = settings.NEAR_DUPLICATE_THRESHOLD if threshold is None else threshold
+        self.expire = expire or settings.CACHE_TTL
+        self.bands = NearDuplicateIndex.band_bounds(self.threshold + 1)
+
+    @staticmethod
+    def band_bounds(count: int) -> List[Tuple[int, int]]:
+        """Границы (сдвиг, ширина) полос, на которые делится 64-битный хэш"""
+        widths = [HASH_BITS // count + (1 if i < HASH_BITS % count else 0) for i in range(count)]
+        bounds, shift = [], 0
+        for width in widths:
+            bounds.append((shift, width))
+            shift += width
+        return bounds
+
+    def compute_hash(self, img_array: np.ndarray) -> int:
+        return ImageProcessor.perceptual_hash(img_array, self.algorithm)
+
+    def _band_keys(self, phash: int) -> List[str]:
+        return [
+            namespaced_key("phash", self.algorithm, f"t{self.threshold}", str(i),
+                           str((phash >> shift) & ((1 << width) - 1)))
+            for i, (shift, width) in enumerate(self.bands)
+        ]
+
+    async def add(self, phash: int, digest: str):
+        """Добавление снимка в индекс"""
+        redis = self.cache.redis
+        if redis is None:
+            return
+        member = f"{phash:016x}:{digest}"
+        try:
+            for key in self._band_keys(phash):
+                await redis.sadd(key, member)
+                await redis.expire(key, self.expire)
+        except Exception as e:
+            logger.warning(f"Failed to index perceptual hash for {digest}: {str(e)}")
+
+    async def find(self, phash: int, exclude: Optional[str] = None) -> List[Tuple[int, str]]:
+        """Снимки на расстоянии Хэмминга не больше threshold, ближайшие первыми
+
+        Returns:
+            List[Tuple[int, str]]: Пары (расстояние, хэш содержимого)
+        """
+        redis = self.cache.redis
+        if redis is None:
+            return []
+        candidates = set()
+        try:
+            for key in self._band_keys(phash):
+                candidates.update(await redis.smembers(key))
+        except Exception as e:
+            logger.warning(f"Perceptual hash lookup failed: {str(e)}")
+            return []
+
+        matches = {}
+        for member in candidates:
+            if isinstance(member, bytes):
+                member = member.decode("utf-8")
+            hex_hash, _, digest = member.partition(":")
+            distance = bin(int(hex_hash, 16) ^ phash).count("1")
+            if distance <= self.threshold and digest != exclude:
+                matches[digest] = min(distance, matches.get(digest, distance))
+        return sorted((distance, digest) for digest, distance in matches.items())
+
+
+near_duplicate_index = NearDuplicateIndex()
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+from app.core.config import settings
+from app.core.exceptions import CacheError
+from app.services import cache_codec
+from app.services.cache_metrics import cache_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LocalLRUCache:
+    """In-process LRU кэш с лимитом по размеру и TTL"""
+
+    def __init__(self, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_bytes = settings.LOCAL_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.ttl = settings.LOCAL_CACHE_TTL if ttl is None else ttl
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._size = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """Суммарный размер записей в байтах (по size, переданному в set)"""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, size: int):
+        """Сохранение значения; size - занимаемая им память в байтах"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+
+class ResultCache:
+    """Двухуровневый кэш результатов анализа: LRU в процессе перед Redis
+
+    Чтение сначала обращается к локальному LRU, затем к Redis. Запись идет
+    сквозь оба уровня и публикует ключ в Redis pub/sub, чтобы остальные
+    воркеры сбросили устаревшую локальную копию. В Redis значения хранятся
+    в бинарном формате cache_codec, поэтому нужен клиент без decode_responses.
+    Локальный уровень хранит те же закодированные байты и декодирует их при
+    каждом попадании: декодированный результат с base64-изображениями в
+    несколько раз больше, и лимит LOCAL_CACHE_MAX_BYTES иначе не соблюдался бы.
+    Пока подписка на инвалидации потеряна, локальный уровень не используется.
+    """
+
+    INVALIDATION_CHANNEL = "mri:cache:invalidate"
+    RESUBSCRIBE_DELAY = 1.0  # Первая пауза перед переподпиской, секунды
+    RESUBSCRIBE_MAX_DELAY = 30.0
+
+    def __init__(self, local: Optional[LocalLRUCache] = None, expire: Optional[int] = None, redis=None):
+        self.local = local or LocalLRUCache()
+        self.expire = expire or settings.CACHE_TTL
+        self.redis = redis
+        # Идентификатор воркера, чтобы не сбрасывать собственные записи
+        self.worker_id = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+        # False, пока подписка на инвалидации восстанавливается
+        self.local_enabled = True
+
+    def init(self, redis):
+        """Подключение к Redis (клиент должен возвращать bytes)"""
+        self.redis = redis
+
+    def _client(self):
+        if self.redis is None:
+            raise CacheError("Result cache is not initialized")
+        return self.redis
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Результат из локального LRU или Redis (None при промахе)"""
+        if self.local_enabled:
+            encoded = self.local.get(key)
+            cache_metrics.record("tier:local", encoded is not None)
+            if encoded is not None:
+                logger.info(f"Local cache hit for key: {key}")
+                return cache_codec.decode(encoded)
+
+        cached = await self._client().get(key)
+        cache_metrics.record("tier:redis", bool(cached))
+        if not cached:
+            return None
+        value = cache_codec.decode(cached)
+        if self.local_enabled:
+            self.local.set(key, cached, len(cached))
+        return value
+
+    async def set(self, key: str, value: Any, expire: Optional[int] = None) -> int:
+        """Запись в Redis и локальный LRU с оповещением остальных воркеров
+
+        Returns:
+            int: Размер записи в Redis в байтах
+        """
+        encoded = cache_codec.encode(value)
+        redis = self._client()
+        await redis.set(key, encoded, ex=expire or self.expire)
+        if self.local_enabled:
+            self.local.set(key, encoded, len(encoded))
+        await self._publish_invalidation(redis, key)
+        return len(encoded)
+
+    async def invalidate(self, key: str):
+        """Удаление результата из обоих уровней во всех воркерах"""
+        self.local.delete(key)
+        redis = self._client()
+        await redis.delete(key)
+        await self._publish_invalidation(redis, key)
+
+    async def _publish_invalidation(self, redis, key: str):
+        try:
+            await redis.publish(self.INVALIDATION_CHANNEL, f"{self.worker_id}:{key}")
+        except Exception as e:
+            # Локальные копии других воркеров все равно истекут по TTL
+            logger.warning(f"Failed to publish cache invalidation for {key}: {str(e)}")
+
+    def handle_invalidation(self, message: str):
+        """Обработка сообщения об инвалидации от другого воркера"""
+        worker_id, _, key = message.partition(":")
+        if worker_id != self.worker_id:
+            self.local.delete(key)
+
+    async def start_listener(self, redis):
+        """Подписка на инвалидации из Redis pub/sub"""
+        if self._listener is not None:
+            return
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(self.INVALIDATION_CHANNEL)
+        self._listener = asyncio.ensure_future(self._listen(redis, pubsub))
+        logger.info("Cache invalidation listener started")
+
+    async def _listen(self, redis, pubsub):
+        """Прием инвалидаций; после ошибки - переподписка с экспоненциальной паузой"""
+        delay = self.RESUBSCRIBE_DELAY
+        try:
+            while True:
+                try:
+                    if pubsub is None:
+                        pubsub = redis.pubsub()
+                        await pubsub.subscribe(self.INVALIDATION_CHANNEL)
+                        # Оповещения за время разрыва потеряны: локальные копии могли устареть
+                        self.local.clear()
+                        self.local_enabled = True
+                        delay = self.RESUBSCRIBE_DELAY
+                        logger.info("Cache invalidation listener resubscribed")
+                    async for message in pubsub.listen():
+                        if message.get("type") != "message":
+                            continue
+                        data = message["data"]
+                        if isinstance(data, bytes):
+                            data = data.decode("utf-8")
+                        self.handle_invalidation(data)
+                    raise ConnectionError("Invalidation subscription closed")
+                except Exception as e:
+                    logger.error(f"Cache invalidation listener failed, retrying in {delay}s: {str(e)}")
+                    # Без оповещений локальный уровень мог устареть: до переподписки он не используется
+                    self.local_enabled = False
+                    self.local.clear()
+                    await self._close_pubsub(pubsub)
+                    pubsub = None
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.RESUBSCRIBE_MAX_DELAY)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await self._close_pubsub(pubsub)
+            self._listener = None
+
+    async def _close_pubsub(self, pubsub):
+        if pubsub is None:
+            return
+        try:
+            await pubsub.unsubscribe(self.INVALIDATION_CHANNEL)
+            await pubsub.reset()
+        except Exception as e:
+            logger.debug(f"Failed to close invalidation subscription: {str(e)}")
+
+    async def stop_listener(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+result_cache = ResultCache()
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+from fastapi_cache import FastAPICache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Снимает lease, только если он все еще принадлежит этому воркеру
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Объединение одновременных одинаковых вычислений по ключу (хэшу содержимого)
+
+    В процессе последующие запросы ждут задачу первого вычисления. Между
+    воркерами лидер берет lease в Redis (SET NX с TTL), остальные опрашивают
+    кэш результатов, пока лидер не запишет результат или lease не истечет.
+    """
+
+    LEASE_PREFIX = "mri:lease"
+
+    def __init__(self, lease_ttl: Optional[float] = None, poll_interval: Optional[float] = None):
+        self.lease_ttl = lease_ttl or settings.SINGLE_FLIGHT_LEASE_TTL
+        self.poll_interval = poll_interval or settings.SINGLE_FLIGHT_POLL_INTERVAL
+        self.worker_id = uuid.uuid4().hex
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[Any]],
+                 fetch: Callable[[], Awaitable[Optional[Any]]]) -> Any:
+        """Результат compute() для ключа, вычисленный не более одного раза одновременно
+
+        Args:
+            key: Ключ объединения (ключ кэша результата)
+            compute: Вычисление результата; должно сохранить его в кэш до возврата
+            fetch: Чтение результата из кэша (None, если его еще нет)
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            # Вычисление идет в отдельной задаче: отключение клиента-лидера
+            # не отменяет его для остальных ожидающих
+            task = asyncio.ensure_future(self._run_with_lease(key, compute, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.info(f"Joining in-flight computation for {key}")
+        return await asyncio.shield(task)
+
+    async def _run_with_lease(self, key: str, compute, fetch) -> Any:
+        redis = self._redis()
+        if redis is None:
+            return await compute()
+
+        lease_key = f"{self.LEASE_PREFIX}:{key}"
+        token = f"{self.worker_id}:{uuid.uuid4().hex}"
+        deadline = time.monotonic() + self.lease_ttl
+        while True:
+            try:
+                acquired = await redis.set(lease_key, token, nx=True, px=int(self.lease_ttl * 1000))
+            except Exception as e:
+                logger.warning(f"Failed to acquire lease {lease_key}: {str(e)}")
+                return await compute()
+
+            if acquired:
+                try:
+                    # Прежний лидер мог записать результат между проверкой кэша и захватом lease
+                    result = await fetch()
+                    if result is not None:
+                        return result
+                    return await compute()
+                finally:
+                    await self._release(redis, lease_key, token)
+
+            # Вычисление уже идет в другом воркере: ждем его результат
+            logger.info(f"Waiting for another worker to compute {key}")
+            while True:
+                await asyncio.sleep(self.poll_interval)
+                result = await fetch()
+                if result is not None:
+                    return result
+                if not await redis.exists(lease_key):
+                    # Лидер завершился без результата: пробуем взять lease сами
+                    break
+                if time.monotonic() > deadline:
+                    logger.warning(f"Lease {lease_key} wait timed out, computing locally")
+                    return await compute()
+
+    async def _release(self, redis, lease_key: str, token: str):
+        try:
+            await redis.eval(_RELEASE_SCRIPT, 1, lease_key, token)
+        except Exception as e:
+            # Lease все равно истечет по TTL
+            logger.warning(f"Failed to release lease {lease_key}: {str(e)}")
+
+    @staticmethod
+    def _redis():
+        try:
+            return getattr(FastAPICache.get_backend(), "redis", None)
+        except Exception:
+            return None
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,91 @@
+import base64
+import logging
+from typing import Any, Optional
+import numpy as np
+from app.services.cache_metrics import cache_metrics
+from app.services.cache_namespace import PREFIX, current_namespace
+from app.services.result_cache import ResultCache, result_cache
+
+logger = logging.getLogger(__name__)
+
+
+class StageCache:
+    """Кэш промежуточных результатов пайплайна по этапам
+
+    Каждый этап (предобработанный тензор, вероятности, heatmap Grad-CAM,
+    объяснение) хранится отдельной записью с ключом
+    mri:{пространство имен}:stage:{этап}:{хэш содержимого}[:{параметры этапа}],
+    поэтому /analyze после /classify досчитывает только недостающие этапы.
+    Ошибки кэша не прерывают анализ: этап просто вычисляется заново.
+    """
+
+    def __init__(self, cache: Optional[ResultCache] = None, namespace: Optional[str] = None):
+        self.cache = cache or result_cache
+        # По умолчанию - текущее пространство имен (версия весов и настроек объяснений)
+        self.namespace = namespace
+
+    def key(self, stage: str, digest: str, **params) -> str:
+        """Ключ записи этапа; параметры сортируются, чтобы ключ не зависел от их порядка"""
+        namespace = self.namespace or current_namespace()
+        key = f"{PREFIX}:{namespace}:stage:{stage}:{digest}"
+        if params:
+            key += ":" + ",".join(f"{k}={v}" for k, v in sorted(params.items()))
+        return key
+
+    async def get(self, stage: str, digest: str, **params) -> Optional[Any]:
+        key = self.key(stage, digest, **params)
+        try:
+            value = await self.cache.get(key)
+        except Exception as e:
+            logger.warning(f"Stage cache read failed for {key}: {str(e)}")
+            return None
+        cache_metrics.record(f"stage:{stage}", value is not None)
+        if value is not None:
+            logger.info(f"Stage cache hit: {key}")
+        return value
+
+    async def set(self, stage: str, digest: str, value: Any, **params):
+        key = self.key(stage, digest, **params)
+        try:
+            size = await self.cache.set(key, value)
+            if isinstance(size, int):
+                cache_metrics.write(f"stage:{stage}", size)
+        except Exception as e:
+            logger.warning(f"Stage cache write failed for {key}: {str(e)}")
+
+    async def get_array(self, stage: str, digest: str, **params) -> Optional[np.ndarray]:
+        value = await self.get(stage, digest, **params)
+        return None if value is None else StageCache.decode_array(value)
+
+    async def set_array(self, stage: str, digest: str, array: np.ndarray, **params):
+        await self.set(stage, digest, StageCache.encode_array(array), **params)
+
+    @staticmethod
+    def encode_array(array: np.ndarray) -> dict:
+        """JSON-представление массива: dtype, форма и base64 байтов"""
+        array = np.ascontiguousarray(array)
+        return {
+            "dtype": str(array.dtype),
+            "shape": list(array.shape),
+            "data": base64.b64encode(array.tobytes()).decode("ascii")
+        }
+
+    @staticmethod
+    def decode_array(value: dict) -> np.ndarray:
+        data = base64.b64decode(value["data"])
+        return np.frombuffer(data, dtype=value["dtype"]).reshape(value["shape"]).copy()
+
+    @staticmethod
+    def encode_tensor(img_array: np.ndarray) -> dict:
+        """Тензор после ImageProcessor.preprocess хранится как uint8 (в 4 раза компактнее)
+
+        Значения тензора - это пиксели / 255, поэтому преобразование обратимо без потерь.
+        """
+        return StageCache.encode_array(np.rint(img_array * 255.0).astype(np.uint8))
+
+    @staticmethod
+    def decode_tensor(value: dict) -> np.ndarray:
+        return StageCache.decode_array(value).astype(np.float32) / 255.0
+
+
+stage_cache = StageCache()
@@ -0,0 +1,74 @@
+"""Сравнение JSON и cache_codec для записи /analyze: размер, кодирование, декодирование
+
+Запуск из каталога server:
+    python -m benchmarks.cache_codec_benchmark
+"""
+import json
+import time
+import numpy as np
+from PIL import Image
+from app.models.GradCAM import GradCAM
+from app.services import cache_codec
+from app.services.analysis_pipeline import AnalysisPipeline
+from app.services.stage_cache import StageCache
+
+REPEATS = 200
+
+
+def make_result():
+    # Визуализации того же размера и вида, что и в реальном ответе
+    rng = np.random.default_rng(0)
+    heatmap = GradCAM.prepare_heatmap_image(rng.random((14, 14)).astype(np.float32))
+    lime = Image.fromarray(rng.integers(0, 256, (224, 224, 3), dtype=np.uint8))
+    return {
+        "classification": {
+            "class_name": "NonDemented", "confidence": 0.9, "class_id": 2,
+            "probabilities": {"MildDemented": 0.05, "ModerateDemented": 0.02,
+                              "NonDemented": 0.9, "VeryMildDemented": 0.03}
+        },
+        "interpretation": {
+            "findings": ["Обнаружена NonDemented степень деменции", "Уверенность модели: 90.00%"],
+            "recommendations": ["Рекомендуется консультация невролога"],
+            "severity": "moderate",
+            "additional_info": {
+                "heatmap_img": AnalysisPipeline._image_to_base64(heatmap),
+                "lime_img": AnalysisPipeline._image_to_base64(lime),
+                "lime_explanation": {"top_features": [{"feature": i, "weight": 0.1} for i in range(5)]}
+            }
+        },
+        "processing_time": 1.5,
+        "model_version": "1.0.0"
+    }
+
+
+def make_tensor_entry():
+    # Снимок МРТ: темный фон и яркая область в центре
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[:224, :224]
+    brain = ((yy - 112) ** 2 + (xx - 112) ** 2) < 90 ** 2
+    pixels = np.where(brain[..., None], rng.integers(60, 200, (224, 224, 3)), 0)
+    return StageCache.encode_tensor(pixels[np.newaxis].astype(np.float32) / 255.0)
+
+
+def measure(name, encode, decode, value):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        data = encode(value)
+    encode_ms = (time.perf_counter() - start) / REPEATS * 1000
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        decode(data)
+    decode_ms = (time.perf_counter() - start) / REPEATS * 1000
+    print(f"{name:12s} {len(data) / 1024:8.1f} KiB  encode {encode_ms:6.2f} ms  decode {decode_ms:6.2f} ms")
+
+
+def main():
+    for title, value in (("/analyze result", make_result()), ("stage tensor", make_tensor_entry())):
+        print(title)
+        measure("json", lambda v: json.dumps(v).encode(), lambda d: json.loads(d), value)
+        for compression in ("none", "zlib", "lz4"):
+            measure(f"codec/{compression}", lambda v: cache_codec.encode(v, compression), cache_codec.decode, value)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Сравнение Keras model.predict и скомпилированного InferenceFunction
+
+Запуск из каталога server:
+    python -m benchmarks.inference_benchmark
+"""
+import time
+import numpy as np
+from app.models.model import build_cnn_model
+from app.models.model_loader import InferenceFunction
+
+BATCH_SIZES = (1, 4, 16)
+REPEATS = 30
+
+
+def measure(fn, batch, repeats=REPEATS):
+    """Среднее время вызова в миллисекундах (после прогрева)"""
+    fn(batch)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(batch)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    # Веса не нужны: сравнивается только накладной расход вызова
+    model = build_cnn_model()
+    paths = {
+        "model.predict": lambda batch: model.predict(batch, verbose=0),
+        "tf.function": InferenceFunction(model, jit_compile=False),
+        "tf.function+xla": InferenceFunction(model, jit_compile=True),
+    }
+
+    print(f"{'batch':>6} " + " ".join(f"{name:>16}" for name in paths))
+    for batch_size in BATCH_SIZES:
+        batch = np.random.rand(batch_size, 224, 224, 3).astype(np.float32)
+        timings = [measure(fn, batch) for fn in paths.values()]
+        print(f"{batch_size:>6} " + " ".join(f"{t:>13.2f} ms" for t in timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Сравнение исходного вызова lime_image.explain_instance и LIMExplainer
+
+Запуск из каталога server:
+    python -m benchmarks.lime_benchmark
+"""
+import time
+import numpy as np
+from lime import lime_image
+from app.models.model import build_cnn_model
+from app.models.model_loader import InferenceFunction
+from app.models.LIMExplainer import LIMExplainer
+
+NUM_SAMPLES = 1000
+
+
+def main():
+    # Веса не нужны: сравнивается только стоимость объяснения
+    model = build_cnn_model()
+    image = np.random.rand(224, 224, 3)
+
+    start = time.perf_counter()
+    lime_image.LimeImageExplainer().explain_instance(
+        image, lambda images: model.predict(images, verbose=0),
+        top_labels=1, hide_color=0, num_samples=NUM_SAMPLES, batch_size=10
+    )
+    baseline = time.perf_counter() - start
+
+    inference_fn = InferenceFunction(model)
+    inference_fn.warmup()
+    explainer = LIMExplainer(model, num_samples=NUM_SAMPLES, predict_fn=inference_fn)
+    start = time.perf_counter()
+    explainer.explain(image)
+    engine = time.perf_counter() - start
+
+    print(f"lime_image.explain_instance: {baseline:.2f} s")
+    print(f"LIMExplainer:                {engine:.2f} s (x{baseline / engine:.1f})")
+
+
+if __name__ == "__main__":
+    main()
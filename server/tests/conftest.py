@@ -30,6 +30,14 @@ def setup_test_environment():
         file.unlink()
     test_files_dir.rmdir()
 
+@pytest.fixture(autouse=True)
+def artifact_dir(tmp_path):
+    # Артефакты анализа пишутся во временный каталог, а не в static/
+    from app.services.artifact_store import artifact_store
+    with patch.object(artifact_store, "root", tmp_path / "artifacts"), \
+            patch.object(artifact_store, "_index", None):
+        yield tmp_path / "artifacts"
+
 # Общие фикстуры для всех тестов
 @pytest.fixture
 def test_files_dir():
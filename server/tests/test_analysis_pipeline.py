@@ -3,8 +3,10 @@ import numpy as np
 from fastapi import UploadFile
 from io import BytesIO
 from PIL import Image
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from app.services.analysis_pipeline import AnalysisPipeline
+from app.services.analysis_plan import AnalysisPlan
+from app.services.stage_cache import StageCache
 from app.core.exceptions import InvalidImageError, ModelProcessingError
 
 @pytest.fixture
@@ -45,10 +47,16 @@ def mock_model():
     model.predict.return_value = np.array([[0.1, 0.2, 0.3, 0.4]])
     return model
 
+@pytest.fixture(autouse=True)
+def mock_inference_fn(mock_model):
+    # Скомпилированный инференс подменяем предсказанием mock-модели
+    with patch('app.services.analysis_pipeline.get_inference_fn', return_value=mock_model.predict) as mock:
+        yield mock
+
 @pytest.mark.asyncio
 class TestAnalysisPipeline:
     @patch('app.models.GradCAM.GradCAM.prepare_heatmap_image', return_value=Image.new('RGB', (224, 224)))
-    @patch('app.models.GradCAM.GradCAM.generate_heatmap', return_value=np.zeros((224, 224)))
+    @patch('app.models.GradCAM.GradCAM.predict_with_heatmap', return_value=(np.array([[0.1, 0.2, 0.3, 0.4]]), np.zeros((224, 224))))
     @patch('app.services.analysis_pipeline.get_model')
     async def test_process_image_valid(self, mock_get_model, mock_heatmap, mock_heatmap_img, sample_image, mock_model):
         mock_get_model.return_value = mock_model
@@ -75,18 +83,19 @@ class TestAnalysisPipeline:
         assert 'recommendations' in interpretation
         assert 'severity' in interpretation
         assert 'additional_info' in interpretation
-        assert 'heatmap_img' in interpretation['additional_info']
+        assert interpretation['additional_info']['heatmap_url'].startswith('/api/artifacts/heatmap-')
+        assert 'heatmap_img' not in interpretation['additional_info']
         assert 'lime_explanation' in interpretation['additional_info']
 
     @patch('app.models.GradCAM.GradCAM.prepare_heatmap_image', return_value=Image.new('RGB', (224, 224)))
-    @patch('app.models.GradCAM.GradCAM.generate_heatmap', return_value=np.zeros((224, 224)))
+    @patch('app.models.GradCAM.GradCAM.predict_with_heatmap', return_value=(np.array([[0.1, 0.2, 0.3, 0.4]]), np.zeros((224, 224))))
     @patch('app.services.analysis_pipeline.get_model')
     async def test_process_image_invalid(self, mock_get_model, mock_heatmap, mock_heatmap_img, invalid_image):
         with pytest.raises(InvalidImageError):
             await AnalysisPipeline.process_image(invalid_image)
 
     @patch('app.models.GradCAM.GradCAM.prepare_heatmap_image', return_value=Image.new('RGB', (224, 224)))
-    @patch('app.models.GradCAM.GradCAM.generate_heatmap', return_value=np.zeros((224, 224)))
+    @patch('app.models.GradCAM.GradCAM.predict_with_heatmap', return_value=(np.array([[0.1, 0.2, 0.3, 0.4]]), np.zeros((224, 224))))
     @patch('app.services.analysis_pipeline.get_model')
     async def test_process_image_wrong_size(self, mock_get_model, mock_heatmap, mock_heatmap_img, wrong_size_image, mock_model):
         mock_get_model.return_value = mock_model
@@ -98,7 +107,7 @@ class TestAnalysisPipeline:
         assert 'model_version' in result
 
     @patch('app.models.GradCAM.GradCAM.prepare_heatmap_image', return_value=Image.new('RGB', (224, 224)))
-    @patch('app.models.GradCAM.GradCAM.generate_heatmap', return_value=np.zeros((224, 224)))
+    @patch('app.models.GradCAM.GradCAM.predict_with_heatmap', return_value=(np.array([[0.1, 0.2, 0.3, 0.4]]), np.zeros((224, 224))))
     @patch('app.services.analysis_pipeline.get_model')
     async def test_process_image_model_error(self, mock_get_model, mock_heatmap, mock_heatmap_img, sample_image):
         mock_get_model.side_effect = Exception("Model loading error")
@@ -106,7 +115,7 @@ class TestAnalysisPipeline:
             await AnalysisPipeline.process_image(sample_image)
 
     @patch('app.models.GradCAM.GradCAM.prepare_heatmap_image', return_value=Image.new('RGB', (224, 224)))
-    @patch('app.models.GradCAM.GradCAM.generate_heatmap', return_value=np.zeros((224, 224)))
+    @patch('app.models.GradCAM.GradCAM.predict_with_heatmap', return_value=(np.array([[0.1, 0.2, 0.3, 0.4]]), np.zeros((224, 224))))
     @patch('app.services.analysis_pipeline.get_model')
     async def test_classify_image_valid(self, mock_get_model, mock_heatmap, mock_heatmap_img, sample_image, mock_model):
         mock_get_model.return_value = mock_model
@@ -123,7 +132,17 @@ class TestAnalysisPipeline:
         ])
 
     @patch('app.models.GradCAM.GradCAM.prepare_heatmap_image', return_value=Image.new('RGB', (224, 224)))
-    @patch('app.models.GradCAM.GradCAM.generate_heatmap', return_value=np.zeros((224, 224)))
+    @patch('app.models.GradCAM.GradCAM.predict_with_heatmap', return_value=(np.array([[0.1, 0.2, 0.3, 0.4]]), np.zeros((224, 224))))
+    @patch('app.services.analysis_pipeline.get_model')
+    async def test_classify_image_bytes(self, mock_get_model, mock_heatmap, mock_heatmap_img, sample_image, mock_model):
+        # Уже прочитанное содержимое файла передается без повторного чтения
+        contents = await sample_image.read()
+        result = await AnalysisPipeline.classify_image(contents)
+        assert result['class_name'] == 'VeryMildDemented'
+        assert result['class_id'] == 3
+
+    @patch('app.models.GradCAM.GradCAM.prepare_heatmap_image', return_value=Image.new('RGB', (224, 224)))
+    @patch('app.models.GradCAM.GradCAM.predict_with_heatmap', return_value=(np.array([[0.1, 0.2, 0.3, 0.4]]), np.zeros((224, 224))))
     @patch('app.services.analysis_pipeline.get_model')
     async def test_interpret_image_valid(self, mock_get_model, mock_heatmap, mock_heatmap_img, sample_image, mock_model):
         mock_get_model.return_value = mock_model
@@ -134,12 +153,12 @@ class TestAnalysisPipeline:
         assert 'recommendations' in result
         assert 'severity' in result
         assert 'additional_info' in result
-        assert 'heatmap_img' in result['additional_info']
+        assert 'heatmap_url' in result['additional_info']
         assert 'lime_explanation' in result['additional_info']
         assert 'top_features' in result['additional_info']['lime_explanation']
 
     @patch('app.models.GradCAM.GradCAM.prepare_heatmap_image', return_value=Image.new('RGB', (224, 224)))
-    @patch('app.models.GradCAM.GradCAM.generate_heatmap', return_value=np.zeros((224, 224)))
+    @patch('app.models.GradCAM.GradCAM.predict_with_heatmap', return_value=(np.array([[0.1, 0.2, 0.3, 0.4]]), np.zeros((224, 224))))
     @patch('app.services.analysis_pipeline.get_model')
     async def test_interpret_image_gradcam_error(self, mock_get_model, mock_heatmap, mock_heatmap_img, sample_image, mock_model):
         mock_heatmap.side_effect = Exception("GradCAM error")
@@ -148,10 +167,126 @@ class TestAnalysisPipeline:
             await AnalysisPipeline.interpret_image(sample_image)
 
     @patch('app.models.GradCAM.GradCAM.prepare_heatmap_image', return_value=Image.new('RGB', (224, 224)))
-    @patch('app.models.GradCAM.GradCAM.generate_heatmap', return_value=np.zeros((224, 224)))
+    @patch('app.models.GradCAM.GradCAM.predict_with_heatmap', return_value=(np.array([[0.1, 0.2, 0.3, 0.4]]), np.zeros((224, 224))))
     @patch('app.services.analysis_pipeline.get_model')
     async def test_interpret_image_lime_error(self, mock_get_model, mock_heatmap, mock_heatmap_img, sample_image, mock_model):
         mock_get_model.return_value = mock_model
         with patch('app.models.LIMExplainer.LIMExplainer.explain', side_effect=Exception("LIME error")):
             with pytest.raises(ModelProcessingError):
-                await AnalysisPipeline.interpret_image(sample_image) 
\ No newline at end of file
+                await AnalysisPipeline.interpret_image(sample_image)
+
+    @patch('app.models.GradCAM.GradCAM.prepare_heatmap_image', return_value=Image.new('RGB', (224, 224)))
+    @patch('app.models.GradCAM.GradCAM.predict_with_heatmap', return_value=(np.array([[0.1, 0.2, 0.3, 0.4]]), np.zeros((224, 224))))
+    @patch('app.services.analysis_pipeline.get_model')
+    async def test_process_image_gradient_attribution(self, mock_get_model, mock_heatmap, mock_heatmap_img, sample_image, mock_model):
+        mock_get_model.return_value = mock_model
+        with patch('app.services.analysis_pipeline.GradientExplainer.get_instance') as mock_explainer:
+            mock_explainer.return_value.explain.return_value = np.zeros((224, 224), dtype=np.float32)
+            result = await AnalysisPipeline.process_image(sample_image, attribution="smoothgrad")
+
+        additional_info = result['interpretation']['additional_info']
+        assert additional_info['attribution'] == {'method': 'smoothgrad'}
+        assert additional_info['attribution_url'].startswith('/api/artifacts/attribution-')
+        assert 'lime_explanation' not in additional_info
+        mock_explainer.return_value.explain.assert_called_once()
+        assert mock_explainer.return_value.explain.call_args[0][1:] == ('smoothgrad', 3)
+
+    @patch('app.models.GradCAM.GradCAM.prepare_heatmap_image', return_value=Image.new('RGB', (224, 224)))
+    @patch('app.models.GradCAM.GradCAM.predict_with_heatmap')
+    @patch('app.services.analysis_pipeline.get_model')
+    async def test_process_image_reuses_cached_stages(self, mock_get_model, mock_heatmap, mock_heatmap_img, sample_image, mock_model):
+        mock_get_model.return_value = mock_model
+        store = {}
+        cache = MagicMock()
+        cache.get = AsyncMock(side_effect=lambda key: store.get(key))
+        cache.set = AsyncMock(side_effect=lambda key, value: store.__setitem__(key, value))
+        contents = await sample_image.read()
+
+        with patch('app.services.analysis_pipeline.stage_cache', StageCache(cache, namespace="v1")), \
+                patch('app.models.GradCAM.GradCAM.predict_with_heatmaps',
+                      return_value=(np.array([[0.1, 0.2, 0.3, 0.4]]), np.zeros((1, 14, 14)))) as mock_heatmaps, \
+                patch('app.services.analysis_pipeline.GradientExplainer.get_instance') as mock_explainer:
+            mock_explainer.return_value.explain.return_value = np.zeros((224, 224), dtype=np.float32)
+
+            await AnalysisPipeline.classify_image(contents, digest="abc-10")
+            assert mock_model.predict.call_count == 1
+
+            # После /classify классификация не повторяется: считаются только Grad-CAM и объяснение
+            result = await AnalysisPipeline.process_image(contents, "smoothgrad", digest="abc-10")
+            assert result['classification']['class_id'] == 3
+            mock_heatmap.assert_not_called()
+            mock_heatmaps.assert_called_once()
+            assert mock_heatmaps.call_args[0][2] == [3]
+            assert mock_model.predict.call_count == 1
+
+            # Все этапы в кэше: повторный анализ ничего не вычисляет
+            await AnalysisPipeline.process_image(contents, "smoothgrad", digest="abc-10")
+            mock_heatmaps.assert_called_once()
+            mock_explainer.return_value.explain.assert_called_once()
+
+    @patch('app.models.GradCAM.GradCAM.prepare_heatmap_image', return_value=Image.new('RGB', (224, 224)))
+    @patch('app.models.GradCAM.GradCAM.predict_with_heatmap', return_value=(np.array([[0.1, 0.2, 0.3, 0.4]]), np.zeros((224, 224))))
+    @patch('app.services.analysis_pipeline.get_model')
+    async def test_process_image_gradcam_only_skips_lime(self, mock_get_model, mock_heatmap, mock_heatmap_img, sample_image, mock_model):
+        mock_get_model.return_value = mock_model
+        with patch('app.services.analysis_pipeline.AnalysisPipeline._explain_pixels') as mock_explain:
+            result = await AnalysisPipeline.process_image(sample_image, plan=AnalysisPlan.parse("gradcam"))
+
+        mock_explain.assert_not_called()
+        mock_heatmap.assert_called_once()
+        assert set(result['interpretation']['additional_info']) == {'heatmap_url'}
+
+    @patch('app.models.GradCAM.GradCAM.prepare_heatmap_image', return_value=Image.new('RGB', (224, 224)))
+    @patch('app.models.GradCAM.GradCAM.predict_with_heatmap')
+    @patch('app.services.analysis_pipeline.get_model')
+    async def test_process_image_lime_only_skips_gradcam(self, mock_get_model, mock_heatmap, mock_heatmap_img, sample_image, mock_model):
+        mock_get_model.return_value = mock_model
+        with patch('app.models.GradCAM.GradCAM.predict_with_heatmaps') as mock_heatmaps:
+            result = await AnalysisPipeline.process_image(sample_image, plan=AnalysisPlan.parse("lime"))
+
+        # Классификация - обычным предсказанием, без градиентов Grad-CAM
+        mock_heatmap.assert_not_called()
+        mock_heatmaps.assert_not_called()
+        mock_heatmap_img.assert_not_called()
+        assert mock_model.predict.called
+        assert set(result['interpretation']['additional_info']) == {'lime_explanation'}
+
+    async def test_classify_image_near_duplicate_hit(self, sample_image, mock_model):
+        store = {}
+        cache = MagicMock()
+        cache.get = AsyncMock(side_effect=lambda key: store.get(key))
+        cache.set = AsyncMock(side_effect=lambda key, value: store.__setitem__(key, value))
+        contents = await sample_image.read()
+        stage_cache = StageCache(cache, namespace="v1")
+        await stage_cache.set_array("probabilities", "original-10", np.array([[0.7, 0.1, 0.1, 0.1]]))
+
+        index = MagicMock()
+        index.compute_hash.return_value = 42
+        index.find = AsyncMock(return_value=[(2, "original-10")])
+        index.add = AsyncMock()
+        with patch('app.services.analysis_pipeline.stage_cache', stage_cache), \
+                patch('app.services.analysis_pipeline.near_duplicate_index', index), \
+                patch('app.services.analysis_pipeline.settings.NEAR_DUPLICATE_INDEX', True):
+            result = await AnalysisPipeline.classify_image(contents, digest="copy-10", near_duplicates=True)
+
+        # Классификация взята у почти одинакового снимка, модель не вызывалась
+        assert result['class_name'] == 'MildDemented'
+        assert result['near_duplicate_of'] == "original-10"
+        mock_model.predict.assert_not_called()
+        index.find.assert_awaited_once_with(42, exclude="copy-10")
+        # Чужой ответ не сохраняется как этап этого снимка
+        index.add.assert_not_awaited()
+        assert await stage_cache.get_array("probabilities", "copy-10") is None
+
+    async def test_classify_image_near_duplicates_off_by_default(self, sample_image, mock_model):
+        contents = await sample_image.read()
+        index = MagicMock()
+        index.find = AsyncMock(return_value=[(2, "original-10")])
+        with patch('app.services.analysis_pipeline.near_duplicate_index', index), \
+                patch('app.services.analysis_pipeline.settings.NEAR_DUPLICATE_INDEX', True):
+            result = await AnalysisPipeline.classify_image(contents)
+
+        # Без near_duplicates (полный анализ, поток) класс считается по самому снимку
+        index.find.assert_not_called()
+        assert 'near_duplicate_of' not in result
+        assert mock_model.predict.called
@@ -0,0 +1,100 @@
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from unittest.mock import AsyncMock, patch
+from app.api.endpoints import router, result_cache_key
+from app.schemas.predictions import AttributionMethod
+from app.services.analysis_plan import AnalysisPlan
+from app.services.content_hash import content_digest
+
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+class TestAnalysisPlan:
+    def test_default_is_full(self):
+        assert AnalysisPlan.parse(None).is_full
+        assert AnalysisPlan.parse("").attribution == "lime"
+        plan = AnalysisPlan.parse(None, "smoothgrad")
+        assert plan.is_full and plan.attribution == "smoothgrad" and not plan.features
+
+    def test_parse(self):
+        plan = AnalysisPlan.parse(" GradCAM ")
+        assert plan == AnalysisPlan(gradcam=True, attribution=None, features=False, image=False)
+        assert not plan.is_full
+
+        plan = AnalysisPlan.parse("lime_img,gradcam")
+        assert plan.attribution == "lime" and not plan.features and plan.image
+        assert plan.tokens == ("gradcam", "lime_img")
+
+        assert AnalysisPlan.parse("gradcam,lime,lime_img").is_full
+        assert AnalysisPlan.parse("integrated_gradients,gradcam", "integrated_gradients").is_full
+        assert AnalysisPlan.parse("smoothgrad").tokens == ("smoothgrad",)
+
+    @pytest.mark.parametrize("include, attribution", [
+        ("heatmap", None),
+        ("lime,smoothgrad", None),
+        ("lime", "integrated_gradients"),
+        ("gradcam", "smoothgrad"),
+    ])
+    def test_invalid(self, include, attribution):
+        with pytest.raises(ValueError):
+            AnalysisPlan.parse(include, attribution)
+
+    def test_project(self):
+        result = {
+            "classification": {"class_id": 1},
+            "interpretation": {"findings": [], "additional_info": {
+                "heatmap_url": "/api/artifacts/heatmap-1",
+                "lime_url": "/api/artifacts/lime-1",
+                "lime_explanation": {"top_features": []}
+            }}
+        }
+        projected = AnalysisPlan.parse("lime").project(result)
+        assert projected["interpretation"]["additional_info"] == {"lime_explanation": {"top_features": []}}
+        assert projected["classification"] == result["classification"]
+        # Исходный результат не меняется
+        assert "heatmap_url" in result["interpretation"]["additional_info"]
+
+    def test_cache_key_follows_selection(self):
+        digest = content_digest(b"scan")
+        full = result_cache_key(digest)
+        assert result_cache_key(digest, AttributionMethod.LIME, AnalysisPlan.parse(None)) == full
+        assert result_cache_key(digest, AttributionMethod.LIME, AnalysisPlan.parse("lime,gradcam,lime_img")) == full
+        assert result_cache_key(digest, AttributionMethod.LIME, AnalysisPlan.parse("gradcam")) == f"{full}:include=gradcam"
+        assert (result_cache_key(digest, AttributionMethod.LIME, AnalysisPlan.parse("lime,gradcam"))
+                == f"{full}:include=gradcam+lime")
+
+@pytest_asyncio.fixture
+async def client():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+@pytest.mark.asyncio
+class TestAnalyzeInclude:
+    async def test_invalid_include(self, client):
+        response = await client.post("/api/analyze?include=everything",
+                                     files={"file": ("scan.jpg", b"data", "image/jpeg")})
+        assert response.status_code == 422
+
+    async def test_partial_result_from_full_cache_entry(self, client):
+        digest = content_digest(b"data")
+        full = {
+            "classification": {"class_name": "NonDemented", "confidence": 0.9, "class_id": 2,
+                               "probabilities": {"NonDemented": 0.9}},
+            "interpretation": {"findings": [], "recommendations": [], "severity": "moderate",
+                               "additional_info": {"lime_explanation": {"top_features": []},
+                                                   "heatmap_url": "/api/artifacts/heatmap-1"}},
+            "processing_time": 1.0,
+            "model_version": "1.0.0"
+        }
+        store = {result_cache_key(digest): full}
+        with patch('app.api.endpoints.result_cache.get', AsyncMock(side_effect=lambda key: store.get(key))), \
+                patch('app.api.endpoints.AnalysisPipeline.process_image') as mock_process:
+            response = await client.post("/api/analyze?include=lime",
+                                         files={"file": ("scan.jpg", b"data", "image/jpeg")})
+
+        assert response.status_code == 200
+        mock_process.assert_not_called()
+        # Незапрошенные поля отсутствуют, а не равны null
+        assert response.json()["interpretation"]["additional_info"] == {"lime_explanation": {"top_features": []}}
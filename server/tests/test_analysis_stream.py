@@ -0,0 +1,140 @@
+import asyncio
+import base64
+import io
+import json
+import pytest
+import pytest_asyncio
+import numpy as np
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from PIL import Image
+from unittest.mock import AsyncMock, patch
+from app.api.endpoints import router, result_cache_key
+from app.core.exceptions import ModelProcessingError
+from app.services.analysis_pipeline import AnalysisPipeline
+from app.services.analysis_plan import AnalysisPlan
+from app.services.content_hash import content_digest
+
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+CLASSIFICATION = {
+    "class_name": "NonDemented", "confidence": 0.9, "class_id": 2,
+    "probabilities": {"MildDemented": 0.05, "ModerateDemented": 0.02, "NonDemented": 0.9, "VeryMildDemented": 0.03}
+}
+
+def png_base64():
+    buffered = io.BytesIO()
+    Image.new('RGB', (8, 8)).save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+@pytest.fixture
+def stages():
+    # Grad-CAM медленнее LIME: события приходят в порядке готовности
+    async def gradcam(img_array):
+        await asyncio.sleep(0.05)
+        return np.zeros((14, 14), dtype=np.float32)
+
+    async def explain(model, inference_fn, img_array, class_id, attribution):
+        return {"lime_explanation": {"top_features": [], "samples_used": 10, "stability": None},
+                "lime_img": png_base64()}
+
+    with patch('app.services.analysis_pipeline.AnalysisPipeline.classify_image', AsyncMock(return_value=CLASSIFICATION)), \
+            patch('app.services.analysis_pipeline.get_model'), \
+            patch('app.services.analysis_pipeline.get_inference_fn'), \
+            patch('app.services.analysis_pipeline.AnalysisPipeline._load_tensor',
+                  AsyncMock(return_value=np.zeros((1, 224, 224, 3)))), \
+            patch('app.services.analysis_pipeline.AnalysisPipeline._gradcam_stage', return_value=gradcam), \
+            patch('app.services.analysis_pipeline.AnalysisPipeline._explanation_params', return_value={}), \
+            patch('app.services.analysis_pipeline.AnalysisPipeline._explain_pixels', side_effect=explain) as mock_explain:
+        yield mock_explain
+
+@pytest.mark.asyncio
+class TestStreamAnalysis:
+    async def test_events_in_completion_order(self, stages):
+        events = [event async for event in AnalysisPipeline.stream_analysis(b"image")]
+        assert [event["event"] for event in events] == ["classification", "lime", "lime_img", "heatmap", "result"]
+        assert events[0]["data"] == CLASSIFICATION
+        assert events[3]["stage_ms"] >= 50
+        assert all(event["elapsed_ms"] >= 0 for event in events)
+
+        result = events[-1]["data"]
+        info = result["interpretation"]["additional_info"]
+        assert set(info) == {"heatmap_url", "lime_explanation", "lime_url"}
+        assert result["classification"] == CLASSIFICATION
+
+    async def test_plan_skips_stages(self, stages):
+        events = [event async for event in AnalysisPipeline.stream_analysis(b"image", plan=AnalysisPlan.parse("gradcam"))]
+        assert [event["event"] for event in events] == ["classification", "heatmap", "result"]
+        stages.assert_not_called()
+
+    def test_result_events(self):
+        result = {"classification": CLASSIFICATION,
+                  "interpretation": {"additional_info": {"heatmap_url": "/api/artifacts/heatmap-1"}}}
+        events = AnalysisPipeline.result_events(result)
+        assert [event["event"] for event in events] == ["classification", "heatmap", "result"]
+        assert all(event["cached"] for event in events)
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        data = json.loads(lines["data"])
+        assert data["event"] == lines["event"]
+        events.append(data)
+    return events
+
+@pytest_asyncio.fixture
+async def client():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+@pytest.mark.asyncio
+class TestStreamEndpoint:
+    async def test_sse_and_cache(self, client, stages):
+        store = {}
+        with patch('app.api.endpoints.result_cache.get', AsyncMock(side_effect=lambda key: store.get(key))), \
+                patch('app.api.endpoints.result_cache.set',
+                      AsyncMock(side_effect=lambda key, value: store.__setitem__(key, value))):
+            response = await client.post("/api/analyze/stream", files={"file": ("scan.jpg", b"data", "image/jpeg")})
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = parse_sse(response.text)
+            assert events[0]["event"] == "classification"
+            assert events[-1]["event"] == "result"
+            assert store[result_cache_key(content_digest(b"data"))] == events[-1]["data"]
+
+            # Повторный запрос отдается из кэша теми же событиями
+            response = await client.post("/api/analyze/stream", files={"file": ("scan.jpg", b"data", "image/jpeg")},
+                                         headers={"Accept": "application/x-ndjson"})
+            assert response.headers["content-type"].startswith("application/x-ndjson")
+            cached = [json.loads(line) for line in response.text.splitlines()]
+            assert {event["event"] for event in cached} == {event["event"] for event in events}
+            assert cached[-1]["data"] == events[-1]["data"]
+            assert all(event["cached"] for event in cached)
+
+    async def test_concurrent_requests_share_computation(self, client, stages):
+        store = {}
+        with patch('app.api.endpoints.result_cache.get', AsyncMock(side_effect=lambda key: store.get(key))), \
+                patch('app.api.endpoints.result_cache.set',
+                      AsyncMock(side_effect=lambda key, value: store.__setitem__(key, value))):
+            responses = await asyncio.gather(*(
+                client.post("/api/analyze/stream", files={"file": ("scan.jpg", b"data", "image/jpeg")},
+                            headers={"Accept": "application/x-ndjson"})
+                for _ in range(2)
+            ))
+        streams = [[json.loads(line) for line in response.text.splitlines()] for response in responses]
+        stages.assert_called_once()
+        assert streams[0][-1]["data"] == streams[1][-1]["data"]
+        # Второй запрос получает события готового результата
+        assert [any(event.get("cached") for event in events) for events in streams] == [False, True]
+
+    async def test_error_event(self, client, stages):
+        stages.side_effect = ModelProcessingError("Ошибка LIME")
+        with patch('app.api.endpoints.result_cache.get', AsyncMock(return_value=None)):
+            response = await client.post("/api/analyze/stream", files={"file": ("scan.jpg", b"data", "image/jpeg")},
+                                         headers={"Accept": "application/x-ndjson"})
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert events[0]["event"] == "classification"
+        assert events[-1] == {"event": "error", "data": {"status_code": 500, "detail": "Ошибка LIME",
+                                                          "error_code": "MODEL_ERROR"}}
@@ -0,0 +1,127 @@
+import base64
+import os
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from app.api.endpoints import router, parse_range
+from app.services.artifact_store import ArtifactStore, artifact_store
+
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+class TestArtifactStore:
+    def test_put_is_content_addressed(self, tmp_path):
+        store = ArtifactStore(tmp_path, max_bytes=1 << 20)
+        artifact_id = store.put("heatmap", PNG)
+        assert artifact_id == ArtifactStore.artifact_id("heatmap", PNG)
+        assert store.put("heatmap", PNG) == artifact_id
+        assert store.put("lime", PNG) != artifact_id
+        assert store.path(artifact_id).read_bytes() == PNG
+        assert len(store) == 2
+        assert store.size == 2 * len(PNG)
+        assert not list(tmp_path.glob("*/*.tmp"))
+
+    def test_unknown_type(self, tmp_path):
+        with pytest.raises(ValueError):
+            ArtifactStore(tmp_path).put("video", PNG)
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        store = ArtifactStore(tmp_path, max_bytes=25)
+        first = store.put("heatmap", b"a" * 10)
+        second = store.put("heatmap", b"b" * 10)
+        os.utime(store.path(first), (1, 1))
+        os.utime(store.path(second), (2, 2))
+        # Чтение делает артефакт недавно использованным
+        store.path(first)
+        third = store.put("heatmap", b"c" * 10)
+        assert store.path(second) is None
+        assert store.path(first) is not None and store.path(third) is not None
+        assert store.evictions == 1
+        assert store.size == 20
+
+    def test_eviction_rescans_disk_periodically(self, tmp_path):
+        store = ArtifactStore(tmp_path, max_bytes=100, rescan_interval=60)
+        with patch.object(store, "_scan", wraps=store._scan) as scan:
+            for i in range(20):
+                store.put("heatmap", bytes([i]) * 10)
+            # Индекс прочитан один раз; вытеснение идет с запасом, а не на каждой записи
+            assert scan.call_count == 1
+            assert store.evictions == 10 and store.size == 100
+
+            store.rescan_interval = 0
+            store.put("heatmap", b"x" * 30)
+            assert scan.call_count == 2
+
+    def test_index_is_rebuilt_from_disk(self, tmp_path):
+        artifact_id = ArtifactStore(tmp_path).put("lime", PNG)
+        store = ArtifactStore(tmp_path)
+        assert len(store) == 1
+        assert store.path(artifact_id) is not None
+
+    def test_publish_images_and_missing(self, tmp_path):
+        store = ArtifactStore(tmp_path)
+        info = store.publish_images({
+            "heatmap_img": base64.b64encode(PNG).decode(),
+            "lime_explanation": {"top_features": []}
+        })
+        assert set(info) == {"heatmap_url", "lime_explanation"}
+        result = {"interpretation": {"additional_info": info}}
+        assert not store.missing(result)
+
+        store.path(info["heatmap_url"].rsplit("/", 1)[1]).unlink()
+        assert store.missing(result)
+
+def test_parse_range():
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=95-200", 100) == (95, 99)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("items=0-1", 100) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+
+@pytest_asyncio.fixture
+async def client():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+@pytest.mark.asyncio
+class TestArtifactEndpoint:
+    async def test_get(self, client):
+        url = ArtifactStore.url(artifact_store.put("heatmap", PNG))
+        response = await client.get(url)
+        assert response.status_code == 200
+        assert response.content == PNG
+        assert response.headers["content-type"] == "image/png"
+        assert "immutable" in response.headers["cache-control"]
+        etag = response.headers["etag"]
+
+        assert (await client.get(url, headers={"If-None-Match": etag})).status_code == 304
+        head = await client.head(url)
+        assert head.status_code == 200
+        assert head.headers["content-length"] == str(len(PNG))
+
+    async def test_range(self, client):
+        url = ArtifactStore.url(artifact_store.put("lime", PNG))
+        response = await client.get(url, headers={"Range": "bytes=8-15"})
+        assert response.status_code == 206
+        assert response.content == PNG[8:16]
+        assert response.headers["content-range"] == f"bytes 8-15/{len(PNG)}"
+
+        response = await client.get(url, headers={"Range": f"bytes={len(PNG)}-"})
+        assert response.status_code == 416
+        # If-Range с устаревшим ETag - файл целиком
+        response = await client.get(url, headers={"Range": "bytes=0-1", "If-Range": '"old"'})
+        assert response.status_code == 200
+        assert response.content == PNG
+
+    async def test_not_found(self, client):
+        missing = ArtifactStore.artifact_id("heatmap", b"missing")
+        assert (await client.get(ArtifactStore.url(missing))).status_code == 404
+        assert (await client.get("/api/artifacts/../secret")).status_code == 404
+        assert (await client.get("/api/artifacts/heatmap-xyz")).status_code == 422
@@ -0,0 +1,213 @@
+import io
+import json
+import tarfile
+import zipfile
+import numpy as np
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from PIL import Image
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.api.endpoints import router, result_cache_key
+from app.core.exceptions import ServiceBusyError
+from app.services.batch_classify import BatchClassifier, StudySummary, iter_batch_items
+from app.services.content_hash import content_digest
+
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+PROBABILITIES = [0.1, 0.1, 0.7, 0.1]
+
+def jpeg(color):
+    buffered = io.BytesIO()
+    Image.new('RGB', (16, 16), color).save(buffered, format="JPEG")
+    return buffered.getvalue()
+
+def zip_archive(members):
+    buffered = io.BytesIO()
+    with zipfile.ZipFile(buffered, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buffered.getvalue()
+
+def tar_archive(members):
+    buffered = io.BytesIO()
+    with tarfile.open(fileobj=buffered, mode="w:gz") as tf:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return buffered.getvalue()
+
+class FakeExecutor:
+    def __init__(self, busy=0):
+        self.batches = []
+        self.busy = busy
+
+    async def run(self, stage, fn, batch):
+        if self.busy:
+            self.busy -= 1
+            raise ServiceBusyError()
+        self.batches.append(len(batch))
+        return fn(batch)
+
+@pytest.fixture
+def store():
+    store = {}
+    with patch('app.services.result_cache.result_cache.get', AsyncMock(side_effect=lambda key: store.get(key))), \
+            patch('app.services.result_cache.result_cache.set',
+                  AsyncMock(side_effect=lambda key, value: store.__setitem__(key, value) or 1)):
+        yield store
+
+@pytest.fixture
+def executor():
+    executor = FakeExecutor()
+    inference_fn = MagicMock(side_effect=lambda batch: np.tile(PROBABILITIES, (len(batch), 1)))
+    with patch('app.services.batch_classify.get_inference_executor', return_value=executor), \
+            patch('app.services.batch_classify.get_inference_fn', return_value=inference_fn):
+        yield executor
+
+class TestIterBatchItems:
+    def test_files_and_archives(self):
+        archive = zip_archive({"p1/a.jpg": b"a", "p1/notes.txt": b"x", "__MACOSX/p1/._a.jpg": b"junk", "b.png": b"b"})
+        tar = tar_archive({"p2/c.jpeg": b"c"})
+        files = [("scan.jpg", "image/jpeg", io.BytesIO(b"s")),
+                 ("study.zip", "application/zip", io.BytesIO(archive)),
+                 ("p2.tar.gz", "application/gzip", io.BytesIO(tar))]
+        items = list(iter_batch_items(files))
+        assert [(item.name, item.study) for item in items] == [
+            ("scan.jpg", "uploads"), ("study.zip/p1/a.jpg", "study.zip/p1"), ("study.zip/b.png", "study.zip"),
+            ("p2.tar.gz/p2/c.jpeg", "p2.tar.gz/p2")
+        ]
+        assert items[1].digest == content_digest(b"a")
+
+    def test_corrupt_archives(self):
+        archive = zip_archive({"p1/a.jpg": b"a", "p1/b.jpg": b"b"})
+        # Поврежденное сжатое содержимое одного файла zip
+        broken = bytearray(archive)
+        offset = archive.index(b"p1/a.jpg") + len("p1/a.jpg")
+        broken[offset] ^= 0xFF
+        # Обрезанный tar.gz: содержимое файла читается не до конца
+        noise = np.random.default_rng(0).bytes(16384)
+        files = [("s.zip", "application/zip", io.BytesIO(bytes(broken))),
+                 ("x.tar", "application/x-tar", io.BytesIO(b"garbage")),
+                 ("t.tar.gz", "application/gzip", io.BytesIO(tar_archive({"p/c.jpg": noise})[:4096]))]
+        items = list(iter_batch_items(files))
+        errors = {item.name: item.error for item in items if item.error is not None}
+        assert [item.name for item in items if item.error is None] == ["s.zip/p1/b.jpg"]
+        assert set(errors) == {"s.zip/p1/a.jpg", "x.tar", "t.tar.gz/p/c.jpg"}
+        assert all(error.error_code == "INVALID_IMAGE" for error in errors.values())
+        assert items[1].study == "s.zip/p1" and items[2].study == "x.tar"
+
+    def test_limits(self):
+        with patch('app.services.batch_classify.settings.CLASSIFY_BATCH_MAX_FILE_BYTES', 2):
+            item, = iter_batch_items([("big.jpg", "image/jpeg", io.BytesIO(b"big"))])
+        assert item.error.status_code == 400 and item.contents is None
+
+        with patch('app.services.batch_classify.settings.CLASSIFY_BATCH_MAX_FILES', 1):
+            with pytest.raises(Exception):
+                list(iter_batch_items([("a.zip", None, io.BytesIO(zip_archive({"a.jpg": b"a", "b.jpg": b"b"})))]))
+
+def test_study_summary():
+    summary = StudySummary()
+    summary.add({"class_name": "NonDemented", "probabilities": {"a": 0.2, "b": 0.1, "c": 0.6, "d": 0.1}})
+    summary.add({"class_name": "MildDemented", "probabilities": {"a": 0.6, "b": 0.1, "c": 0.2, "d": 0.1}})
+    data = summary.to_dict("p1")
+    assert data["count"] == 2 and data["class_counts"] == {"NonDemented": 1, "MildDemented": 1}
+    assert data["mean_probabilities"]["MildDemented"] == pytest.approx(0.4)
+    assert data["class_name"] == "MildDemented"
+
+@pytest.mark.asyncio
+class TestBatchClassifier:
+    async def test_batches_and_cache(self, store, executor):
+        images = {f"p{i % 2}/{i}.jpg": jpeg((i * 20, 0, 0)) for i in range(5)}
+        images["p0/dup.jpg"] = images["p0/0.jpg"]
+        images["p1/broken.jpg"] = b"not an image"
+        cached = {"class_name": "MildDemented", "confidence": 0.9, "class_id": 0,
+                  "probabilities": {"MildDemented": 0.9, "ModerateDemented": 0.0,
+                                    "NonDemented": 0.1, "VeryMildDemented": 0.0}}
+        store[result_cache_key(content_digest(images["p1/1.jpg"]))] = {"classification": cached}
+
+        items = iter_batch_items([("s.zip", None, io.BytesIO(zip_archive(images)))])
+        events = [event async for event in BatchClassifier(batch_size=4).classify(items)]
+
+        results = {event["data"]["name"]: event["data"] for event in events if event["event"] == "item"}
+        assert len(results) == 7
+        assert results["s.zip/p1/1.jpg"]["cached"] is True
+        assert results["s.zip/p1/1.jpg"]["classification"] == cached
+        assert results["s.zip/p0/0.jpg"]["classification"]["class_name"] == "NonDemented"
+        assert results["s.zip/p1/broken.jpg"]["error"]["error_code"] == "INVALID_IMAGE"
+        # Закэшированный снимок не считается; дубликат из следующей порции берет результат первой
+        assert executor.batches == [3, 1]
+        assert results["s.zip/p0/dup.jpg"]["cached"] is False
+        assert results["s.zip/p0/dup.jpg"]["classification"] == results["s.zip/p0/0.jpg"]["classification"]
+
+        studies = {event["data"]["study"]: event["data"] for event in events if event["event"] == "study"}
+        assert studies["s.zip/p0"]["count"] == 4 and studies["s.zip/p1"]["failed"] == 1
+        summary = events[-1]
+        assert summary["event"] == "summary"
+        assert {k: summary["data"][k] for k in ("total", "cached", "computed", "failed")} == \
+            {"total": 7, "cached": 1, "computed": 5, "failed": 1}
+
+        # Результаты записаны под ключом /classify: повторный пакет не обращается к модели
+        executor.batches.clear()
+        items = iter_batch_items([("s.zip", None, io.BytesIO(zip_archive(images)))])
+        events = [event async for event in BatchClassifier(batch_size=4).classify(items)]
+        assert executor.batches == []
+        assert events[-1]["data"]["cached"] == 6
+
+    async def test_duplicates_in_chunk(self, store, executor):
+        image = jpeg("green")
+        files = [("a.jpg", "image/jpeg", io.BytesIO(image)), ("b.jpg", "image/jpeg", io.BytesIO(image))]
+        with patch('app.services.batch_classify.AnalysisPipeline._index_near_duplicate', AsyncMock()) as index:
+            events = [event async for event in BatchClassifier().classify(iter_batch_items(files))]
+        assert [event["data"]["cached"] for event in events[:2]] == [False, False]
+        assert executor.batches == [1]
+        # Посчитанный снимок попадает в индекс почти одинаковых снимков, как у /classify
+        index.assert_awaited_once()
+        assert index.await_args.args[0].shape == (1, 224, 224, 3)
+        assert index.await_args.args[1] == content_digest(image)
+
+    async def test_retries_busy_executor(self, store, executor):
+        executor.busy = 2
+        items = iter_batch_items([("a.jpg", "image/jpeg", io.BytesIO(jpeg("red")))])
+        events = [event async for event in BatchClassifier(busy_retry_delay=0).classify(items)]
+        assert events[0]["data"]["cached"] is False
+        assert executor.batches == [1]
+
+    async def test_busy_timeout(self, store, executor):
+        executor.busy = 1000
+        items = iter_batch_items([("a.jpg", "image/jpeg", io.BytesIO(jpeg("red")))])
+        classifier = BatchClassifier(busy_retry_delay=0.01, busy_timeout=0.05)
+        events = [event async for event in classifier.classify(items)]
+        # Пул так и не освободился: ошибка у файла, пакет завершается
+        assert events[0]["data"]["error"]["error_code"] == "SERVICE_BUSY"
+        assert events[-1]["data"]["failed"] == 1
+        assert executor.batches == []
+
+@pytest_asyncio.fixture
+async def client():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+@pytest.mark.asyncio
+class TestBatchEndpoint:
+    async def test_ndjson(self, client, store, executor):
+        files = [("files", ("a.jpg", jpeg("red"), "image/jpeg")),
+                 ("files", ("p.tar.gz", tar_archive({"p/b.jpg": jpeg("blue")}), "application/gzip"))]
+        response = await client.post("/api/classify/batch", files=files, headers={"Accept": "application/x-ndjson"})
+        assert response.status_code == 200
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert [event["event"] for event in events] == ["item", "item", "study", "study", "summary"]
+        assert executor.batches == [2]
+
+    async def test_broken_archive(self, client, store, executor):
+        response = await client.post("/api/classify/batch", files=[("files", ("x.tar", b"garbage", "application/x-tar"))],
+                                     headers={"Accept": "application/x-ndjson"})
+        assert response.status_code == 200
+        events = [json.loads(line) for line in response.text.splitlines()]
+        # Поврежденный архив - ошибка его файла, а не всего пакета
+        assert [event["event"] for event in events] == ["item", "study", "summary"]
+        assert events[0]["data"]["name"] == "x.tar"
+        assert events[0]["data"]["error"]["error_code"] == "INVALID_IMAGE"
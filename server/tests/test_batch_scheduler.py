@@ -0,0 +1,64 @@
+import pytest
+import asyncio
+import numpy as np
+from unittest.mock import MagicMock
+from app.services.batch_scheduler import BatchScheduler, get_batch_scheduler
+
+@pytest.fixture
+def predict_fn():
+    # Возвращает в первой колонке сумму пикселей, чтобы различать строки батча
+    def fn(batch):
+        sums = batch.reshape(len(batch), -1).sum(axis=1)
+        return np.stack([sums, np.zeros_like(sums), np.zeros_like(sums), np.zeros_like(sums)], axis=1)
+    return MagicMock(side_effect=fn)
+
+def make_image(value):
+    return np.full((1, 4, 4, 3), value, dtype=np.float32)
+
+@pytest.mark.asyncio
+class TestBatchScheduler:
+    async def test_single_request(self, predict_fn):
+        scheduler = BatchScheduler(predict_fn, max_batch_size=8, max_wait_ms=1)
+        result = await scheduler.predict(make_image(1.0))
+
+        assert result.shape == (1, 4)
+        assert result[0][0] == pytest.approx(48.0)
+        predict_fn.assert_called_once()
+
+    async def test_concurrent_requests_are_batched(self, predict_fn):
+        scheduler = BatchScheduler(predict_fn, max_batch_size=8, max_wait_ms=20)
+        results = await asyncio.gather(*[
+            scheduler.predict(make_image(float(i))) for i in range(5)
+        ])
+
+        # Один проход модели на все запросы
+        predict_fn.assert_called_once()
+        assert predict_fn.call_args[0][0].shape == (5, 4, 4, 3)
+        # Каждый запрос получает свою строку
+        for i, result in enumerate(results):
+            assert result.shape == (1, 4)
+            assert result[0][0] == pytest.approx(48.0 * i)
+
+    async def test_full_batch_flushes_immediately(self, predict_fn):
+        scheduler = BatchScheduler(predict_fn, max_batch_size=2, max_wait_ms=10000)
+        results = await asyncio.wait_for(
+            asyncio.gather(scheduler.predict(make_image(1.0)), scheduler.predict(make_image(2.0))),
+            timeout=1
+        )
+        assert len(results) == 2
+        predict_fn.assert_called_once()
+
+    async def test_batch_split_by_max_size(self, predict_fn):
+        scheduler = BatchScheduler(predict_fn, max_batch_size=2, max_wait_ms=1)
+        await asyncio.gather(*[scheduler.predict(make_image(1.0)) for _ in range(5)])
+        assert predict_fn.call_count == 3
+
+    async def test_prediction_error_propagates(self):
+        scheduler = BatchScheduler(MagicMock(side_effect=Exception("Model error")), max_wait_ms=1)
+        with pytest.raises(Exception, match="Model error"):
+            await scheduler.predict(make_image(1.0))
+
+    async def test_get_batch_scheduler_per_predict_fn(self):
+        fn_a, fn_b = MagicMock(), MagicMock()
+        assert get_batch_scheduler(fn_a) is get_batch_scheduler(fn_a)
+        assert get_batch_scheduler(fn_b) is not get_batch_scheduler(fn_a)
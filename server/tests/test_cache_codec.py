@@ -0,0 +1,61 @@
+import pytest
+import base64
+import json
+import numpy as np
+from app.services import cache_codec
+from app.services.stage_cache import StageCache
+
+@pytest.fixture
+def analysis_result():
+    png = base64.b64encode(b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4).decode("ascii")
+    return {
+        "classification": {
+            "class_name": "NonDemented",
+            "confidence": 0.9,
+            "class_id": 2,
+            "probabilities": {"MildDemented": 0.05, "ModerateDemented": 0.02,
+                              "NonDemented": 0.9, "VeryMildDemented": 0.03}
+        },
+        "interpretation": {
+            "findings": ["Обнаружена NonDemented степень деменции"],
+            "recommendations": [],
+            "severity": "moderate",
+            "additional_info": {
+                "heatmap_img": png,
+                "lime_img": png,
+                "lime_explanation": {"top_features": [{"feature": 3, "weight": 0.1}]}
+            }
+        },
+        "processing_time": 1.5,
+        "model_version": "1.0.0"
+    }
+
+class TestCacheCodec:
+    @pytest.mark.parametrize("compression", ["none", "zlib", "lz4"])
+    def test_roundtrip(self, analysis_result, compression):
+        encoded = cache_codec.encode(analysis_result, compression)
+        assert encoded.startswith(cache_codec.MAGIC)
+        assert cache_codec.decode(encoded) == analysis_result
+
+    def test_images_stored_as_raw_bytes(self, analysis_result):
+        encoded = cache_codec.encode(analysis_result, "none")
+        assert len(encoded) < len(json.dumps(analysis_result).encode())
+        png = analysis_result["interpretation"]["additional_info"]["heatmap_img"]
+        assert png.encode() not in encoded
+
+    def test_stage_array_roundtrip(self):
+        value = StageCache.encode_array(np.random.rand(14, 14).astype(np.float32))
+        decoded = cache_codec.decode(cache_codec.encode(value))
+        np.testing.assert_array_equal(StageCache.decode_array(decoded), StageCache.decode_array(value))
+
+    def test_non_base64_field_kept_as_string(self):
+        value = {"data": "not base64!", "lime_img": "YWJj"}
+        assert cache_codec.decode(cache_codec.encode(value)) == value
+
+    def test_reads_legacy_json(self, analysis_result):
+        assert cache_codec.decode(json.dumps(analysis_result).encode()) == analysis_result
+        assert cache_codec.decode(json.dumps(analysis_result)) == analysis_result
+
+    def test_unknown_compression(self):
+        with pytest.raises(ValueError):
+            cache_codec.encode({}, "brotli")
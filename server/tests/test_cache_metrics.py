@@ -0,0 +1,132 @@
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.api.endpoints import router
+from app.services.cache_metrics import CacheMetrics, KeyCounts, key_category, redis_info, scan_key_counts, to_prometheus
+
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+KEYS = [
+    "mri:v1:abc-10", "mri:v1:abc-10:integrated_gradients",
+    "mri:v1:stage:tensor:abc-10", "mri:v1:stage:lime:abc-10:num_samples=1000",
+    "mri:v1:phash:phash:t6:0:12", "mri:v0:abc-10", "mri:lease:mri:v1:abc-10", "other:key"
+]
+
+def fake_redis(keys):
+    # SCAN по снимку списка ключей пакетами по count
+    async def scan(cursor, match=None, count=10):
+        batch = keys[cursor:cursor + count]
+        next_cursor = cursor + count
+        return (next_cursor if next_cursor < len(keys) else 0), [k.encode() for k in batch if k.startswith("mri:")]
+
+    async def info(section):
+        return {
+            "memory": {"used_memory": 1024, "used_memory_peak": 2048, "maxmemory": 0,
+                       "maxmemory_policy": b"allkeys-lru"},
+            "stats": {"evicted_keys": 3, "expired_keys": 5, "keyspace_hits": 7, "keyspace_misses": 2}
+        }[section]
+
+    redis = MagicMock()
+    redis.scan = AsyncMock(side_effect=scan)
+    redis.info = AsyncMock(side_effect=info)
+    return redis
+
+class TestCacheMetrics:
+    def test_snapshot(self):
+        metrics = CacheMetrics()
+        metrics.record("endpoint:analyze", True)
+        metrics.record("endpoint:analyze", False)
+        metrics.record("endpoint:analyze", True)
+        metrics.write("endpoint:analyze", 100)
+        metrics.write("endpoint:analyze", 300)
+        metrics.miss("stage:lime")
+
+        snapshot = metrics.snapshot()
+        assert snapshot["endpoint:analyze"]["hits"] == 2
+        assert snapshot["endpoint:analyze"]["hit_ratio"] == pytest.approx(2 / 3)
+        assert snapshot["endpoint:analyze"]["avg_entry_bytes"] == 200
+        assert snapshot["stage:lime"]["hit_ratio"] == 0
+        assert snapshot["stage:lime"]["avg_entry_bytes"] is None
+
+        metrics.reset()
+        assert metrics.snapshot() == {}
+
+    def test_key_category(self):
+        assert [key_category(key, "v1") for key in KEYS] == [
+            "result", "result", "stage:tensor", "stage:lime", "phash", "stale", "lease", None
+        ]
+
+    @pytest.mark.asyncio
+    async def test_scan_key_counts(self):
+        redis = fake_redis(KEYS)
+        counts = await scan_key_counts(redis, "v1", batch_size=3)
+        assert counts == {"lease": 1, "phash": 1, "result": 2, "stage:lime": 1, "stage:tensor": 1, "stale": 1}
+        assert redis.scan.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_key_counts_refreshed_in_background(self):
+        redis = fake_redis(KEYS)
+        counts = KeyCounts(interval=60)
+        assert counts.get(redis, "v1") == {}
+        await counts._task
+        assert counts.get(redis, "v1")["result"] == 2
+        # Свежий подсчет не пересчитывается до истечения interval
+        assert redis.scan.await_count == 1
+        assert counts._task.done()
+
+    @pytest.mark.asyncio
+    async def test_redis_info(self):
+        info = await redis_info(fake_redis([]))
+        assert info["maxmemory_policy"] == "allkeys-lru"
+        assert info["evicted_keys"] == 3
+
+    def test_prometheus_groups_metric_lines(self):
+        text = to_prometheus({
+            "scopes": {"a": {"hits": 1, "misses": 2, "writes": 0, "bytes_written": 0},
+                       "b": {"hits": 3, "misses": 4, "writes": 1, "bytes_written": 10}},
+            "local": {"entries": 1, "bytes": 10, "evictions": 0},
+            "redis": {"used_memory": 1024, "maxmemory": None},
+            "keys": {"result": 2}
+        })
+        lines = text.splitlines()
+        hits = [i for i, line in enumerate(lines) if line.startswith("mri_cache_hits_total")]
+        assert hits == [hits[0], hits[0] + 1]
+        assert 'mri_cache_misses_total{scope="b"} 4' in lines
+        assert 'mri_cache_keys{category="result"} 2' in lines
+        assert not any(line.startswith("mri_redis_maxmemory") for line in lines)
+
+@pytest_asyncio.fixture
+async def client():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+@pytest.mark.asyncio
+class TestCacheStatsEndpoint:
+    async def test_stats(self, client):
+        redis = fake_redis(KEYS)
+        with patch('app.api.endpoints.result_cache.redis', redis), \
+                patch('app.api.endpoints.key_counts', KeyCounts(interval=60)), \
+                patch('app.api.endpoints.current_namespace', return_value="v1"):
+            response = await client.get("/api/cache/stats")
+            assert response.status_code == 200
+            stats = response.json()
+            assert stats["namespace"] == "v1"
+            assert stats["keys"]["result"] == 2
+            assert stats["redis"]["evicted_keys"] == 3
+            assert set(stats["local"]) == {"entries", "bytes", "max_bytes", "evictions"}
+
+            scans = redis.scan.await_count
+
+            # Скрейп берет подсчет ключей из /cache/stats, без нового SCAN
+            metrics = await client.get("/api/cache/metrics")
+            assert metrics.status_code == 200
+            assert "mri_redis_evicted_keys 3" in metrics.text
+            assert 'mri_cache_keys{category="result"} 2' in metrics.text
+            assert redis.scan.await_count == scans
+
+    async def test_not_initialized(self, client):
+        with patch('app.api.endpoints.result_cache.redis', None):
+            assert (await client.get("/api/cache/stats")).status_code == 500
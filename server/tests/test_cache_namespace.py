@@ -0,0 +1,72 @@
+import pytest
+from unittest.mock import patch
+from app.core.config import settings
+from app.services import cache_namespace
+from app.services.cache_namespace import CacheSweeper, current_namespace, is_stale_key, namespaced_key
+
+class FakeRedis:
+    """Имитация SCAN (по 2 ключа за вызов) и UNLINK"""
+
+    def __init__(self, keys):
+        self.store = {key.encode(): b"" for key in keys}
+        # Курсор - позиция в исходном порядке: удаление не сдвигает остальные ключи
+        self.order = sorted(self.store)
+
+    async def scan(self, cursor, match=None, count=None):
+        keys = self.order
+        batch = [key for key in keys[cursor:cursor + 2] if key in self.store]
+        next_cursor = cursor + 2 if cursor + 2 < len(keys) else 0
+        prefix = match.rstrip("*").encode()
+        return next_cursor, [key for key in batch if key.startswith(prefix)]
+
+    async def unlink(self, *keys):
+        for key in keys:
+            del self.store[key]
+        return len(keys)
+
+class TestCacheNamespace:
+    def test_namespace_is_stable(self):
+        assert current_namespace() == current_namespace()
+        assert namespaced_key("abc-10") == f"mri:{current_namespace()}:abc-10"
+
+    def test_namespace_changes_with_weights(self):
+        before = current_namespace()
+        with patch.object(cache_namespace, 'get_weights_fingerprint', return_value="other"):
+            assert current_namespace() != before
+
+    def test_namespace_changes_with_explainer_config(self):
+        before = current_namespace()
+        with patch.object(settings, 'LIME_NUM_SAMPLES', settings.LIME_NUM_SAMPLES + 1):
+            assert current_namespace() != before
+        with patch.object(settings, 'GRADCAM_LAYER', 'conv2d_4'):
+            assert current_namespace() != before
+
+    def test_namespace_changes_with_result_format(self):
+        # Записи со старой структурой ответа (base64 *_img) не читаются новым кодом
+        before = current_namespace()
+        with patch.object(cache_namespace, 'RESULT_FORMAT', cache_namespace.RESULT_FORMAT + 1):
+            assert current_namespace() != before
+
+    def test_is_stale_key(self):
+        assert not is_stale_key("mri:vnew:abc-10", "vnew")
+        assert not is_stale_key("mri:vnew:stage:tensor:abc-10", "vnew")
+        assert is_stale_key("mri:vold:abc-10", "vnew")
+        # Ключи старого формата без пространства имен
+        assert is_stale_key("mri:abc-10", "vnew")
+        assert is_stale_key("mri:stage:tensor:abc-10:1.0.0", "vnew")
+        # Служебные и чужие ключи не трогаются
+        assert not is_stale_key("mri:lease:mri:vold:abc-10", "vnew")
+        assert not is_stale_key("test_key", "vnew")
+
+@pytest.mark.asyncio
+async def test_sweeper_removes_only_stale_keys():
+    redis = FakeRedis([
+        "mri:vnew:a-1", "mri:vnew:stage:tensor:a-1", "mri:vold:a-1",
+        "mri:vold:stage:gradcam:a-1", "mri:a-1", "mri:lease:mri:vnew:a-1", "other"
+    ])
+    removed = await CacheSweeper(batch_size=2, pause=0).sweep(redis, "vnew")
+
+    assert removed == 3
+    assert sorted(redis.store) == [
+        b"mri:lease:mri:vnew:a-1", b"mri:vnew:a-1", b"mri:vnew:stage:tensor:a-1", b"other"
+    ]
@@ -0,0 +1,86 @@
+import pytest
+import zipfile
+from unittest.mock import AsyncMock, patch
+from app.cli import RateLimiter, WarmStats, iter_images, main, warm
+from app.services.cache_namespace import result_cache_key
+from app.services.content_hash import content_digest
+
+ANALYSIS = {"classification": {"class_id": 1}, "interpretation": {}}
+
+@pytest.fixture
+def images_dir(tmp_path):
+    (tmp_path / "study").mkdir()
+    (tmp_path / "study" / "a.jpg").write_bytes(b"image-a")
+    (tmp_path / "study" / "b.PNG").write_bytes(b"image-b")
+    (tmp_path / "notes.txt").write_bytes(b"not an image")
+    return tmp_path
+
+async def run_compute(key, compute, fetch):
+    return await compute()
+
+@pytest.fixture
+def store():
+    store = {}
+    with patch('app.cli.result_cache.get', AsyncMock(side_effect=lambda key: store.get(key))), \
+            patch('app.cli.result_cache.set', AsyncMock(side_effect=lambda key, value: store.__setitem__(key, value))), \
+            patch('app.cli.single_flight.do', AsyncMock(side_effect=run_compute)):
+        yield store
+
+class TestIterImages:
+    def test_directory(self, images_dir):
+        assert [contents for _, contents in iter_images(str(images_dir))] == [b"image-a", b"image-b"]
+
+    def test_zip(self, tmp_path):
+        archive = tmp_path / "studies.zip"
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("s1/a.jpeg", b"image-a")
+            zf.writestr("s1/readme.md", b"text")
+        assert list(iter_images(str(archive))) == [("s1/a.jpeg", b"image-a")]
+
+    def test_invalid_path(self, tmp_path):
+        with pytest.raises(ValueError):
+            list(iter_images(str(tmp_path / "missing")))
+
+@pytest.mark.asyncio
+class TestWarm:
+    async def test_analyze_writes_endpoint_keys_and_resumes(self, images_dir, store):
+        with patch('app.cli.AnalysisPipeline.process_image', AsyncMock(return_value=ANALYSIS)) as mock_process:
+            stats = await warm(str(images_dir), workers=2)
+            assert stats.processed == 2 and stats.cached == 0 and stats.failed == 0
+            assert store[result_cache_key(content_digest(b"image-a"))] == ANALYSIS
+
+            # Повторный запуск ничего не пересчитывает
+            stats = await warm(str(images_dir), workers=2)
+            assert stats.processed == 0 and stats.cached == 2
+            assert mock_process.await_count == 2
+
+    async def test_classification_entry_does_not_count_as_analysis(self, images_dir, store):
+        store[result_cache_key(content_digest(b"image-a"))] = {"class_id": 1}
+        with patch('app.cli.AnalysisPipeline.process_image', AsyncMock(return_value=ANALYSIS)):
+            stats = await warm(str(images_dir))
+        assert stats.processed == 2
+
+    async def test_classify_mode(self, images_dir, store):
+        with patch('app.cli.AnalysisPipeline.classify_image', AsyncMock(return_value={"class_id": 2})) as mock_classify:
+            stats = await warm(str(images_dir), mode="classify")
+        assert stats.processed == 2
+        assert mock_classify.await_args[0][1] in {content_digest(b"image-a"), content_digest(b"image-b")}
+
+    async def test_errors_counted(self, images_dir, store):
+        process = AsyncMock(side_effect=[ANALYSIS, Exception("broken image")])
+        with patch('app.cli.AnalysisPipeline.process_image', process):
+            stats = await warm(str(images_dir), workers=1)
+        assert stats.processed == 1 and stats.failed == 1
+
+    async def test_rate_limiter_spaces_starts(self):
+        limiter = RateLimiter(rate=50)
+        with patch('app.cli.asyncio.sleep', AsyncMock()) as mock_sleep:
+            for _ in range(3):
+                await limiter.wait()
+        assert mock_sleep.await_count == 2
+
+def test_main_prints_summary(images_dir, capsys):
+    with patch('app.cli.init_cache', AsyncMock()), \
+            patch('app.cli.warm', AsyncMock(return_value=WarmStats(processed=3, elapsed=1.5))):
+        assert main(["warm", str(images_dir), "--rate", "2"]) == 0
+    assert "processed 3" in capsys.readouterr().out
@@ -0,0 +1,36 @@
+import pytest
+import hashlib
+from io import BytesIO
+from fastapi import UploadFile
+from app.services import content_hash
+from app.services.content_hash import content_digest, read_upload
+
+JPEG_HEADER = b"\xff\xd8\xff\xe0" + b"\x00" * 2044
+
+@pytest.mark.asyncio
+class TestContentHash:
+    async def test_read_upload_returns_contents_and_digest(self):
+        data = b"mri" * 100000
+        contents, digest = await read_upload(UploadFile(file=BytesIO(data), filename="scan.jpg"))
+
+        assert contents == data
+        assert digest == f"{hashlib.blake2b(data, digest_size=16).hexdigest()}-{len(data)}"
+        assert digest == content_digest(data)
+
+    async def test_same_header_different_content(self):
+        # Снимки одного сканера с одинаковым заголовком получают разные ключи
+        first = content_digest(JPEG_HEADER + b"scan-1")
+        second = content_digest(JPEG_HEADER + b"scan-2")
+        assert first != second
+
+    async def test_chunked_read(self, monkeypatch):
+        monkeypatch.setattr(content_hash, "CHUNK_SIZE", 7)
+        data = bytes(range(256)) * 3
+        contents, digest = await read_upload(UploadFile(file=BytesIO(data), filename="scan.jpg"))
+        assert contents == data
+        assert digest == content_digest(data)
+
+    async def test_empty_file(self):
+        contents, digest = await read_upload(UploadFile(file=BytesIO(b""), filename="empty.jpg"))
+        assert contents == b""
+        assert digest.endswith("-0")
@@ -108,4 +108,100 @@ class TestGradCAM:
         assert save_path.endswith('.png')
         mock_makedirs.assert_called_once()
         mock_resize.assert_called_once()
-        mock_apply.assert_called_once()
\ No newline at end of file
+        mock_apply.assert_called_once()
+
+@pytest.fixture
+def small_model():
+    # Небольшая реальная модель для проверки Grad-CAM движка
+    inputs = tf.keras.Input(shape=(224, 224, 3))
+    x = tf.keras.layers.Conv2D(8, (3, 3), strides=4, activation='relu', name='gradcam_conv')(inputs)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(4, activation='softmax')(x)
+    return tf.keras.Model(inputs, outputs)
+
+def reference_heatmap(model, img_array, layer_name):
+    # Исходная (некэшированная) реализация Grad-CAM
+    grad_model = tf.keras.Model(
+        inputs=model.inputs,
+        outputs=[model.get_layer(layer_name).output, model.outputs[0]]
+    )
+    with tf.GradientTape() as tape:
+        conv_outputs, predictions = grad_model(tf.convert_to_tensor(img_array))
+        class_idx = tf.argmax(predictions[0])
+        loss = predictions[:, class_idx]
+    grads = tape.gradient(loss, conv_outputs)
+    pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
+    heatmap = tf.squeeze(conv_outputs[0] @ pooled_grads[..., tf.newaxis])
+    return (tf.maximum(heatmap, 0) / (tf.reduce_max(heatmap) + 1e-10)).numpy()
+
+class TestGradCAMEngine:
+    def setup_method(self):
+        GradCAM.clear_cache()
+
+    def test_engine_cached_per_model_and_layer(self, small_model):
+        engine = GradCAM.get_engine(small_model, 'gradcam_conv')
+        assert GradCAM.get_engine(small_model, 'gradcam_conv') is engine
+        assert engine.model is small_model
+
+    def test_engine_rebuilt_for_new_model(self, small_model):
+        engine = GradCAM.get_engine(small_model, 'gradcam_conv')
+        new_model = tf.keras.models.clone_model(small_model)
+        new_engine = GradCAM.get_engine(new_model, 'gradcam_conv')
+
+        assert new_engine is not engine
+        # Движки перезагруженной модели удаляются из кэша
+        assert all(e.model is new_model for e in GradCAM._engines.values())
+
+    def test_heatmap_matches_reference(self, small_model, sample_image_array):
+        heatmap = GradCAM.generate_heatmap(small_model, sample_image_array, layer_name='gradcam_conv')
+        expected = reference_heatmap(small_model, sample_image_array, 'gradcam_conv')
+
+        assert heatmap.shape == expected.shape
+        np.testing.assert_allclose(heatmap, expected, rtol=1e-4, atol=1e-5)
+        assert np.all(heatmap >= 0) and np.all(heatmap <= 1)
+
+    def test_heatmap_invalid_rank(self, small_model):
+        with pytest.raises(ValueError):
+            GradCAM.generate_heatmap(small_model, np.random.rand(224, 224), layer_name='gradcam_conv')
+
+    def test_predict_with_heatmap_single_pass(self, small_model, sample_image_array):
+        predictions, heatmap = GradCAM.predict_with_heatmap(small_model, sample_image_array, layer_name='gradcam_conv')
+
+        # Вероятности совпадают с обычным проходом модели
+        np.testing.assert_allclose(predictions, small_model(sample_image_array).numpy(), rtol=1e-4, atol=1e-6)
+        np.testing.assert_allclose(
+            heatmap, reference_heatmap(small_model, sample_image_array, 'gradcam_conv'), rtol=1e-4, atol=1e-5
+        )
+
+    def test_batched_heatmaps_match_single(self, small_model):
+        images = np.random.rand(3, 224, 224, 3).astype(np.float32)
+        predictions, heatmaps = GradCAM.predict_with_heatmaps(small_model, images, layer_name='gradcam_conv')
+
+        assert predictions.shape == (3, 4)
+        assert heatmaps.shape[0] == 3
+        # Результат каждого образца не зависит от остальных образцов батча
+        for i in range(3):
+            expected = reference_heatmap(small_model, images[i:i + 1], 'gradcam_conv')
+            np.testing.assert_allclose(heatmaps[i], expected, rtol=1e-4, atol=1e-5)
+
+    def test_batched_heatmaps_target_classes(self, small_model):
+        images = np.random.rand(2, 224, 224, 3).astype(np.float32)
+        heatmaps = GradCAM.generate_heatmaps(small_model, images, class_indices=[0, 3], layer_name='gradcam_conv')
+        chunked = GradCAM.generate_heatmaps(
+            small_model, images, class_indices=[0, 3], layer_name='gradcam_conv', batch_size=1
+        )
+
+        assert heatmaps.shape[0] == 2
+        np.testing.assert_allclose(heatmaps, chunked, rtol=1e-4, atol=1e-5)
+
+    def test_batched_heatmaps_invalid_class_indices(self, small_model):
+        images = np.random.rand(2, 224, 224, 3).astype(np.float32)
+        with pytest.raises(ValueError):
+            GradCAM.generate_heatmaps(small_model, images, class_indices=[0], layer_name='gradcam_conv')
+
+def test_save_heatmap_names_do_not_collide(tmp_path):
+    first = GradCAM.save_heatmap(np.zeros((7, 7), dtype=np.float32), save_dir=str(tmp_path))
+    second = GradCAM.save_heatmap(np.ones((7, 7), dtype=np.float32), save_dir=str(tmp_path))
+    assert first != second
+    assert GradCAM.save_heatmap(np.zeros((7, 7), dtype=np.float32), save_dir=str(tmp_path)) == first
+    assert len(list(tmp_path.glob("heatmap_*.png"))) == 2
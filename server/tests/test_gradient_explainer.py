@@ -0,0 +1,63 @@
+import pytest
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+from app.models.GradientExplainer import GradientExplainer
+
+@pytest.fixture(scope="module")
+def small_model():
+    # Небольшая гладкая модель, чтобы проверять свойства атрибуций
+    inputs = tf.keras.Input(shape=(224, 224, 3))
+    x = tf.keras.layers.Conv2D(4, (3, 3), strides=8, activation='tanh')(inputs)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(4, activation='softmax')(x)
+    return tf.keras.Model(inputs, outputs)
+
+@pytest.fixture
+def sample_image_array():
+    return np.random.RandomState(0).rand(1, 224, 224, 3).astype(np.float32)
+
+class TestGradientExplainer:
+    def test_integrated_gradients_completeness(self, small_model, sample_image_array):
+        explainer = GradientExplainer(small_model)
+        attributions = explainer.integrated_gradients(sample_image_array, class_idx=2, steps=64)
+
+        # Сумма атрибуций ≈ f(x) - f(baseline)
+        expected = (small_model(sample_image_array)[0, 2] - small_model(np.zeros_like(sample_image_array))[0, 2]).numpy()
+        assert attributions.shape == (224, 224, 3)
+        assert attributions.sum() == pytest.approx(expected, rel=0.05, abs=1e-4)
+
+    def test_batched_gradients_chunked(self, small_model, sample_image_array):
+        full = GradientExplainer(small_model, batch_size=64).integrated_gradients(sample_image_array, 1, steps=16)
+        chunked = GradientExplainer(small_model, batch_size=5).integrated_gradients(sample_image_array, 1, steps=16)
+        np.testing.assert_allclose(full, chunked, rtol=1e-4, atol=1e-7)
+
+    def test_smoothgrad(self, small_model, sample_image_array):
+        explainer = GradientExplainer(small_model)
+        grads = explainer.smoothgrad(sample_image_array, samples=8, random_state=0)
+        assert grads.shape == (224, 224, 3)
+        np.testing.assert_allclose(
+            grads, explainer.smoothgrad(sample_image_array, samples=8, random_state=0), rtol=1e-5
+        )
+
+    @pytest.mark.parametrize("method", GradientExplainer.METHODS)
+    def test_explain_normalized(self, small_model, sample_image_array, method):
+        saliency = GradientExplainer(small_model).explain(sample_image_array, method=method)
+        assert saliency.shape == (224, 224)
+        assert saliency.min() >= 0 and saliency.max() == pytest.approx(1.0)
+
+    def test_explain_invalid(self, small_model, sample_image_array):
+        explainer = GradientExplainer(small_model)
+        with pytest.raises(ValueError):
+            explainer.explain(sample_image_array, method='lime')
+        with pytest.raises(ValueError):
+            explainer.explain(np.random.rand(100, 100, 3))
+
+    def test_get_instance(self, small_model):
+        instance = GradientExplainer.get_instance(small_model)
+        assert GradientExplainer.get_instance(small_model) is instance
+
+    def test_prepare_attribution_image(self):
+        image = GradientExplainer.prepare_attribution_image(np.random.rand(224, 224).astype(np.float32))
+        assert isinstance(image, Image.Image)
+        assert image.size == (224, 224)
@@ -0,0 +1,97 @@
+import pytest
+import asyncio
+import threading
+import time
+from app.services.inference_executor import InferenceExecutor
+from app.core.exceptions import ServiceBusyError, StageTimeoutError
+
+@pytest.fixture
+def executor():
+    executor = InferenceExecutor(max_workers=1, max_queue_size=1, stage_timeouts={"lime": 0.1})
+    yield executor
+    executor.shutdown(wait=True)
+
+@pytest.mark.asyncio
+class TestInferenceExecutor:
+    async def test_run_in_worker_thread(self, executor):
+        loop_thread = threading.get_ident()
+        result = await executor.run("predict", lambda x: (x * 2, threading.get_ident()), 21)
+
+        assert result[0] == 42
+        assert result[1] != loop_thread
+        assert executor.in_flight == 0
+
+    async def test_event_loop_not_blocked(self, executor):
+        # Пока воркер занят, event loop продолжает обслуживать другие корутины
+        task = asyncio.ensure_future(executor.run("predict", time.sleep, 0.2))
+        start = time.monotonic()
+        await asyncio.sleep(0.01)
+        assert time.monotonic() - start < 0.15
+        await task
+
+    async def test_stage_timeout(self, executor):
+        with pytest.raises(StageTimeoutError):
+            await executor.run("lime", time.sleep, 0.5)
+
+    async def test_queue_overflow(self, executor):
+        event = threading.Event()
+        # Один воркер и одно место в очереди
+        first = asyncio.ensure_future(executor.run("predict", event.wait, 5))
+        second = asyncio.ensure_future(executor.run("predict", event.wait, 5))
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(ServiceBusyError):
+            await executor.run("predict", lambda: None)
+
+        event.set()
+        await asyncio.gather(first, second)
+        assert executor.in_flight == 0
+
+    async def test_exception_propagates(self, executor):
+        def fail():
+            raise ValueError("stage error")
+
+        with pytest.raises(ValueError, match="stage error"):
+            await executor.run("gradcam", fail)
+        assert executor.in_flight == 0
+
+    async def test_timeout_starts_when_worker_picks_up(self):
+        executor = InferenceExecutor(max_workers=1, max_queue_size=1, stage_timeouts={"lime": 0.25})
+        try:
+            first = asyncio.ensure_future(executor.run("gradcam", time.sleep, 0.3))
+            await asyncio.sleep(0.01)
+            # Вторая задача ждет воркер 0.3 с и выполняется 0.1 с: считается только выполнение
+            assert await executor.run("lime", lambda: time.sleep(0.1) or "done") == "done"
+            await first
+        finally:
+            executor.shutdown(wait=True)
+
+    async def test_predict_not_blocked_by_explanations(self):
+        executor = InferenceExecutor(max_workers=1, max_queue_size=0, predict_workers=1,
+                                     stage_timeouts={"predict": 0.5})
+        event = threading.Event()
+        try:
+            lime = asyncio.ensure_future(executor.run("lime", event.wait, 5))
+            await asyncio.sleep(0.01)
+            # Пул объяснений занят и очередь полна, но predict идет в свой пул
+            with pytest.raises(ServiceBusyError):
+                await executor.run("lime", lambda: None)
+            assert await executor.run("predict", lambda: "ok") == "ok"
+            event.set()
+            await lime
+        finally:
+            event.set()
+            executor.shutdown(wait=True)
+
+    async def test_cancelled_queued_job_does_not_run(self, executor):
+        event = threading.Event()
+        ran = []
+        first = asyncio.ensure_future(executor.run("predict", event.wait, 5))
+        second = asyncio.ensure_future(executor.run("predict", ran.append, 1))
+        await asyncio.sleep(0.01)
+        second.cancel()
+        await asyncio.sleep(0.01)
+        event.set()
+        await first
+        assert ran == []
+        assert executor.in_flight == 0
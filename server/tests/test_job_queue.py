@@ -0,0 +1,262 @@
+import asyncio
+import time
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from unittest.mock import AsyncMock, patch
+from app.api.endpoints import router, run_analysis_job
+from app.core.exceptions import JobNotFoundError, ModelProcessingError, ServiceBusyError
+from app.schemas.jobs import JobStatus
+from app.services.job_queue import Job, JobManager, LocalJobBackend, RedisJobBackend, job_manager
+
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+class FakeRedis:
+    """Минимальная имитация хэшей и sorted set для очереди задач"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.zset = {}
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        self.hashes.setdefault(key, {}).update(mapping or {field: value})
+
+    async def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    async def hmget(self, key, fields):
+        return [self.hashes.get(key, {}).get(field) for field in fields]
+
+    async def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(field, None)
+
+    async def expire(self, key, ttl):
+        pass
+
+    async def eval(self, script, numkeys, key, status, job, ttl, *expected):
+        # TRANSITION_SCRIPT
+        fields = self.hashes.get(key)
+        if not fields or fields.get("status", "queued") not in expected:
+            return 0
+        fields.update(status=status, job=job)
+        return 1
+
+    async def zadd(self, key, mapping):
+        self.zset.update(mapping)
+
+    async def zcard(self, key):
+        return len(self.zset)
+
+    async def zrem(self, key, member):
+        self.zset.pop(member, None)
+
+    async def bzpopmin(self, key, timeout=0):
+        if not self.zset:
+            await asyncio.sleep(timeout)
+            return None
+        member = min(self.zset, key=self.zset.get)
+        return key, member.encode(), self.zset.pop(member)
+
+async def wait_for_status(manager, job_id, *statuses, timeout=2.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        job = await manager.get(job_id)
+        if job.status in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} is still {job.status}")
+
+@pytest_asyncio.fixture
+async def manager():
+    manager = JobManager(workers=1, poll_interval=0.05, busy_retry_delay=0.01)
+    yield manager
+    await manager.stop()
+
+@pytest.mark.asyncio
+class TestJobManager:
+    async def test_priority_order_and_cancel_queued(self, manager):
+        order = []
+        gate = asyncio.Event()
+
+        async def handler(job, contents):
+            order.append(contents)
+            await gate.wait()
+            return {"contents": contents.decode()}
+
+        manager.start(handler)
+        first = await manager.submit(b"first", "a-1")
+        await wait_for_status(manager, first.id, JobStatus.RUNNING)
+        low = await manager.submit(b"low", "a-2", priority=-1)
+        high = await manager.submit(b"high", "a-3", priority=5)
+        dropped = await manager.submit(b"dropped", "a-4", priority=9)
+        assert (await manager.cancel(dropped.id)).status == JobStatus.CANCELLED
+
+        gate.set()
+        assert (await wait_for_status(manager, low.id, JobStatus.SUCCEEDED)).result == {"contents": "low"}
+        assert order == [b"first", b"high", b"low"]
+        assert (await manager.get(high.id)).status == JobStatus.SUCCEEDED
+        # Отмена завершенной задачи ничего не меняет
+        assert (await manager.cancel(high.id)).status == JobStatus.SUCCEEDED
+
+    async def test_cancel_running(self, manager):
+        cancelled = asyncio.Event()
+
+        async def handler(job, contents):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        manager.start(handler)
+        job = await manager.submit(b"x", "a-1")
+        await wait_for_status(manager, job.id, JobStatus.RUNNING)
+        await manager.cancel(job.id)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert (await manager.get(job.id)).status == JobStatus.CANCELLED
+
+        # Воркер продолжает брать задачи
+        manager.handler = AsyncMock(return_value={"ok": True})
+        next_job = await manager.submit(b"y", "a-2")
+        assert (await wait_for_status(manager, next_job.id, JobStatus.SUCCEEDED)).result == {"ok": True}
+
+    async def test_deadline(self, manager):
+        async def handler(job, contents):
+            await asyncio.sleep(10)
+
+        manager.start(handler)
+        running = await manager.submit(b"x", "a-1", deadline=0.1)
+        waiting = await manager.submit(b"y", "a-2", deadline=0.05)
+        job = await wait_for_status(manager, running.id, JobStatus.EXPIRED)
+        assert job.error == "Deadline exceeded"
+        job = await wait_for_status(manager, waiting.id, JobStatus.EXPIRED)
+        assert job.started_at is None
+
+    async def test_busy_retry_and_failure(self, manager):
+        handler = AsyncMock(side_effect=[ServiceBusyError(), {"ok": True}, ModelProcessingError("boom")])
+        manager.start(handler)
+        job = await manager.submit(b"x", "a-1")
+        assert (await wait_for_status(manager, job.id, JobStatus.SUCCEEDED)).result == {"ok": True}
+        failed = await manager.submit(b"y", "a-2")
+        assert (await wait_for_status(manager, failed.id, JobStatus.FAILED)).error == "boom"
+
+    async def test_busy_timeout(self):
+        manager = JobManager(workers=1, poll_interval=0.05, busy_retry_delay=0.01, busy_timeout=0.05)
+        manager.start(AsyncMock(side_effect=ServiceBusyError("busy")))
+        try:
+            job = await manager.submit(b"x", "a-1")
+            assert (await wait_for_status(manager, job.id, JobStatus.FAILED)).error == "busy"
+        finally:
+            await manager.stop()
+
+    async def test_queue_limit_and_missing_job(self):
+        manager = JobManager(workers=1)
+        manager.backend = LocalJobBackend(max_size=1)
+        await manager.submit(b"x", "a-1")
+        with pytest.raises(ServiceBusyError):
+            await manager.submit(b"y", "a-2")
+        with pytest.raises(JobNotFoundError):
+            await manager.get("missing")
+
+    async def test_redis_backend(self, manager):
+        redis = FakeRedis()
+        manager.start(AsyncMock(return_value={"ok": True}), RedisJobBackend(redis))
+        low = await manager.submit(b"low", "a-1")
+        high = await manager.submit(b"high", "a-2", priority=1)
+        assert (await wait_for_status(manager, low.id, JobStatus.SUCCEEDED)).result == {"ok": True}
+        assert [call.args[1] for call in manager.handler.await_args_list] == [b"high", b"low"]
+        assert (await manager.get(high.id)).finished_at is not None
+        # После завершения содержимое файла не хранится
+        assert "contents" not in redis.hashes[RedisJobBackend.key(low.id)]
+
+    async def test_redis_cancel_between_take_and_start(self, manager):
+        # Задачу выбрал один процесс, а DELETE /jobs пришел в другой
+        redis = FakeRedis()
+        backend = RedisJobBackend(redis)
+        other = JobManager(workers=1)
+        other.backend = RedisJobBackend(redis)
+        manager.backend = backend
+        manager.handler = AsyncMock(return_value={"ok": True})
+        job = await manager.submit(b"x", "a-1")
+        taken, contents = await backend.take(0.01)
+        await other.cancel(job.id)
+
+        await manager._execute(taken, contents)
+        manager.handler.assert_not_awaited()
+        assert (await manager.get(job.id)).status == JobStatus.CANCELLED
+
+    async def test_local_cancel_is_not_overwritten_by_result(self, manager):
+        # Отмена пришла, когда обработчик уже вернул результат
+        manager.backend = LocalJobBackend()
+        job = await manager.submit(b"x", "a-1")
+        taken, _ = await manager.backend.take(0.01)
+        assert await manager.backend.mark_running(taken)
+        await manager.cancel(job.id)
+
+        await manager._finish(taken, JobStatus.SUCCEEDED, result={"ok": True})
+        current = await manager.get(job.id)
+        assert current.status == JobStatus.CANCELLED and current.result is None
+
+    @pytest.mark.parametrize("shared", [False, True])
+    async def test_stop_requeues_running_job(self, shared):
+        started = asyncio.Event()
+
+        async def handler(job, contents):
+            started.set()
+            await asyncio.sleep(10)
+
+        redis = FakeRedis()
+        manager = JobManager(workers=1, poll_interval=0.05)
+        manager.start(handler, RedisJobBackend(redis) if shared else None)
+        job = await manager.submit(b"x", "a-1")
+        await asyncio.wait_for(started.wait(), 1)
+        await manager.stop()
+        # Прерванная задача не остается running навсегда
+        requeued = await manager.get(job.id)
+        assert requeued.status == JobStatus.QUEUED and requeued.started_at is None
+
+        backend = manager.backend
+        manager.start(AsyncMock(return_value={"ok": True}), backend)
+        try:
+            assert (await wait_for_status(manager, job.id, JobStatus.SUCCEEDED)).result == {"ok": True}
+            assert manager.handler.await_args.args[1] == b"x"
+        finally:
+            await manager.stop()
+
+def test_job_roundtrip():
+    job = Job(id="1", digest="a-1", priority=2, include="gradcam", result={"x": 1})
+    assert Job.from_dict(job.to_dict()) == job
+
+@pytest_asyncio.fixture
+async def client():
+    job_manager.start(run_analysis_job)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+    await job_manager.stop()
+
+@pytest.mark.asyncio
+class TestJobEndpoints:
+    async def test_submit_and_poll(self, client):
+        result = {"classification": {"class_id": 2}, "interpretation": {}}
+        with patch('app.api.endpoints.result_cache.get', AsyncMock(return_value=None)), \
+                patch('app.api.endpoints.result_cache.set', AsyncMock(return_value=10)), \
+                patch('app.api.endpoints.AnalysisPipeline.process_image', AsyncMock(return_value=result)) as mock_process:
+            response = await client.post("/api/jobs?include=gradcam&priority=3",
+                                         files={"file": ("scan.jpg", b"data", "image/jpeg")})
+            assert response.status_code == 202
+            job = response.json()
+            assert job["status"] == "queued"
+            assert response.headers["location"] == f"/api/jobs/{job['id']}"
+
+            job = await wait_for_status(job_manager, job["id"], JobStatus.SUCCEEDED)
+            response = await client.get(f"/api/jobs/{job.id}")
+            assert response.json()["result"] == result
+            assert mock_process.await_args.args[3].tokens == ("gradcam",)
+
+    async def test_errors(self, client):
+        assert (await client.get("/api/jobs/missing")).status_code == 404
+        assert (await client.delete("/api/jobs/missing")).status_code == 404
+        response = await client.post("/api/jobs?include=unknown", files={"file": ("scan.jpg", b"data", "image/jpeg")})
+        assert response.status_code == 422
@@ -112,4 +112,82 @@ class TestLIMExplainer:
         img_array = np.expand_dims(img_array, axis=0)
         
         with pytest.raises(ModelProcessingError):
-            explainer.explain(img_array[0]) 
\ No newline at end of file
+            explainer.explain(img_array[0])
+
+    def test_batched_predictions(self, sample_image):
+        calls = []
+
+        class RecordingModel:
+            def predict(self, x):
+                calls.append(x.shape)
+                return np.tile([0.1, 0.2, 0.3, 0.4], (len(x), 1))
+
+        explainer = LIMExplainer(RecordingModel(), num_samples=300, batch_size=128)
+        img_array = np.array(Image.open(sample_image))
+        explainer.explain(img_array)
+
+        # 300 возмущений за 3 прохода модели, float32
+        assert [shape[0] for shape in calls] == [128, 128, 44]
+        assert all(shape[1:] == (224, 224, 3) for shape in calls)
+
+    def test_perturbations_match_lime(self, mock_model):
+        from lime import lime_image
+
+        image = np.random.RandomState(1).rand(224, 224, 3)
+        segments = np.repeat(np.arange(16), 224 * 224 // 16).reshape(224, 224)
+
+        def classifier(images):
+            # Предсказание зависит от содержимого изображения
+            means = images.reshape(len(images), -1, 3).mean(axis=1)
+            return np.concatenate([means, 1 - means.sum(axis=1, keepdims=True)], axis=1)
+
+        lime_explainer = lime_image.LimeImageExplainer(random_state=0)
+        fudged_image = np.zeros_like(image)
+        data, expected = lime_explainer.data_labels(image, fudged_image, segments, classifier, 50, batch_size=10)
+
+        explainer = LIMExplainer(mock_model, predict_fn=classifier, batch_size=32)
+        labels = explainer._predict_perturbations(image.astype(np.float32), segments, data.astype(np.uint8))
+        # Возмущения строятся в float32
+        np.testing.assert_allclose(labels, expected, rtol=1e-4, atol=1e-5)
+
+    def test_get_instance_reused(self, mock_model):
+        instance = LIMExplainer.get_instance(mock_model)
+        assert LIMExplainer.get_instance(mock_model) is instance
+
+        predict_fn = lambda x: mock_model.predict(x)
+        assert LIMExplainer.get_instance(mock_model, predict_fn=predict_fn) is not instance
+
+    def test_fixed_mode_reports_samples(self, sample_image, mock_model):
+        explainer = LIMExplainer(mock_model, num_samples=200, adaptive=False)
+        explanation = explainer.explain(np.array(Image.open(sample_image)))
+        assert explanation.samples_used == 200
+        assert explanation.stability is None
+
+    def test_adaptive_early_stopping(self, sample_image):
+        class LinearModel:
+            # Линейная по суперпикселям модель: суррогат сходится быстро
+            def predict(self, x):
+                left = x[:, :, :112].mean(axis=(1, 2, 3))
+                return np.stack([left, 1 - left, np.zeros_like(left), np.zeros_like(left)], axis=1)
+
+        explainer = LIMExplainer(
+            LinearModel(), num_samples=1000, batch_size=64, segmenter='grid',
+            adaptive=True, min_samples=128, tolerance=0.05, random_state=0
+        )
+        img_array = np.random.RandomState(0).rand(224, 224, 3)
+        explanation = explainer.explain(img_array)
+
+        assert 128 <= explanation.samples_used < 1000
+        assert 0.95 <= explanation.stability <= 1.0
+        assert explanation.top_labels == [0]
+        # Признаки левой половины изображения получают положительный вес
+        top_feature = explanation.local_exp[0][0][0]
+        assert explanation.segments[:, :112].max() >= top_feature
+
+    def test_adaptive_respects_max_samples(self, sample_image, mock_model):
+        explainer = LIMExplainer(
+            mock_model, num_samples=300, batch_size=100, adaptive=True,
+            min_samples=300, tolerance=0.0, random_state=0
+        )
+        explanation = explainer.explain(np.array(Image.open(sample_image)))
+        assert explanation.samples_used == 300
@@ -0,0 +1,77 @@
+import pytest
+import numpy as np
+from unittest.mock import MagicMock, patch
+from app.models import model_loader
+from app.models.model import build_cnn_model
+from app.models.model_loader import InferenceFunction, get_inference_fn, get_model, get_weights_fingerprint
+
+@pytest.fixture(scope="module")
+def model():
+    return build_cnn_model()
+
+@pytest.fixture
+def sample_batch():
+    return np.random.rand(3, 224, 224, 3).astype(np.float32)
+
+class TestInferenceFunction:
+    def test_matches_model_predict(self, model, sample_batch):
+        inference_fn = InferenceFunction(model, batch_buckets=(1, 4))
+        expected = model.predict(sample_batch, verbose=0)
+        result = inference_fn(sample_batch)
+
+        assert result.shape == (3, 4)
+        np.testing.assert_allclose(result, expected, rtol=1e-4, atol=1e-5)
+
+    def test_single_image(self, model, sample_batch):
+        inference_fn = InferenceFunction(model, batch_buckets=(1, 4))
+        result = inference_fn(sample_batch[0])
+        assert result.shape == (1, 4)
+
+    def test_bucket_size(self, model):
+        inference_fn = InferenceFunction(model, batch_buckets=(8, 1, 4))
+        assert inference_fn.bucket_size(1) == 1
+        assert inference_fn.bucket_size(3) == 4
+        assert inference_fn.bucket_size(5) == 8
+        assert inference_fn.bucket_size(20) == 8
+
+    def test_batch_larger_than_max_bucket(self, model, sample_batch):
+        # Батч больше максимального бакета обрабатывается частями
+        inference_fn = InferenceFunction(model, batch_buckets=(1, 2))
+        result = inference_fn(sample_batch)
+        assert result.shape == (3, 4)
+
+    def test_get_inference_fn_cached_per_model(self, model):
+        with patch('app.models.model_loader.get_model', return_value=model):
+            inference_fn = get_inference_fn()
+            assert inference_fn is get_inference_fn()
+            assert inference_fn.model is model
+
+class TestWeightsFingerprint:
+    @pytest.fixture
+    def weights(self, tmp_path):
+        path = tmp_path / "weights.h5"
+        path.write_bytes(b"weights-v1")
+        with patch.object(model_loader.settings, 'MODEL_PATH', path), \
+                patch.object(model_loader, '_weights_fingerprint', None), \
+                patch.object(model_loader, '_model', None):
+            yield path
+
+    def test_not_reread_after_file_replaced(self, weights):
+        fingerprint = get_weights_fingerprint()
+        weights.write_bytes(b"weights-v2")
+        assert get_weights_fingerprint() == fingerprint
+
+    def test_taken_when_model_loads(self, weights):
+        before = get_weights_fingerprint()
+        weights.write_bytes(b"weights-v2")
+        with patch('app.models.model_loader.build_cnn_model', return_value=MagicMock()):
+            get_model()
+        # Отпечаток соответствует весам, загруженным в память
+        loaded = get_weights_fingerprint()
+        assert loaded != before
+        weights.write_bytes(b"weights-v3")
+        assert get_weights_fingerprint() == loaded
+
+    def test_missing_file(self, weights):
+        weights.unlink()
+        assert get_weights_fingerprint() == "unknown"
@@ -0,0 +1,81 @@
+import pytest
+import io
+import numpy as np
+from PIL import Image
+from app.models.ImageProcessor import ImageProcessor
+from app.services.near_duplicate import NearDuplicateIndex
+
+class FakeRedis:
+    """Имитация множеств Redis"""
+
+    def __init__(self):
+        self.sets = {}
+
+    async def sadd(self, key, member):
+        self.sets.setdefault(key, set()).add(member.encode())
+
+    async def expire(self, key, seconds):
+        return True
+
+    async def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+class FakeCache:
+    def __init__(self, redis):
+        self.redis = redis
+
+def mri_like(shift=0):
+    yy, xx = np.mgrid[:256, :256]
+    texture = ((np.sin(xx / 17) + np.cos(yy / 23)) * 60 + 120).astype(np.uint8)
+    brain = np.where(((yy - 128) ** 2 + (xx - 128) ** 2) < 100 ** 2, texture, 0).astype(np.uint8)
+    return Image.fromarray(np.stack([np.roll(brain, shift, axis=1)] * 3, axis=-1))
+
+def reencode(img, quality):
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+@pytest.fixture
+def index():
+    return NearDuplicateIndex(FakeCache(FakeRedis()), algorithm='phash', threshold=6, expire=60)
+
+class TestPerceptualHash:
+    @pytest.mark.parametrize("algorithm", ['phash', 'dhash'])
+    def test_robust_to_jpeg_reencoding(self, algorithm):
+        original = ImageProcessor.perceptual_hash(ImageProcessor.preprocess(reencode(mri_like(), 95)), algorithm)
+        recompressed = ImageProcessor.perceptual_hash(ImageProcessor.preprocess(reencode(mri_like(), 50)), algorithm)
+        different = ImageProcessor.perceptual_hash(ImageProcessor.preprocess(mri_like(shift=40)), algorithm)
+
+        assert 0 <= original < 2 ** 64
+        assert bin(original ^ recompressed).count("1") <= 6
+        assert bin(original ^ different).count("1") > 6
+
+    def test_unknown_algorithm(self):
+        with pytest.raises(ValueError):
+            ImageProcessor.perceptual_hash(np.zeros((1, 224, 224, 3), dtype=np.float32), 'ahash')
+
+class TestNearDuplicateIndex:
+    def test_band_bounds_cover_all_bits(self):
+        bounds = NearDuplicateIndex.band_bounds(7)
+        assert len(bounds) == 7
+        assert sum(width for _, width in bounds) == 64
+        assert bounds[-1][0] + bounds[-1][1] == 64
+
+    @pytest.mark.asyncio
+    async def test_find_within_threshold(self, index):
+        phash = 0x0123456789ABCDEF
+        await index.add(phash, "a-1")
+        # 6 бит отличаются в разных полосах - все равно находится
+        near = phash ^ (1 | 1 << 11 | 1 << 22 | 1 << 33 | 1 << 44 | 1 << 55)
+        far = phash ^ 0xFF
+
+        assert await index.find(phash) == [(0, "a-1")]
+        assert await index.find(near) == [(6, "a-1")]
+        assert await index.find(far) == []
+        assert await index.find(phash, exclude="a-1") == []
+
+    @pytest.mark.asyncio
+    async def test_without_redis(self):
+        index = NearDuplicateIndex(FakeCache(None), threshold=4)
+        await index.add(1, "a-1")
+        assert await index.find(1) == []
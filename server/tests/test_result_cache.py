@@ -0,0 +1,166 @@
+import asyncio
+import pytest
+import json
+from unittest.mock import AsyncMock, patch
+from app.core.exceptions import CacheError
+from app.services import cache_codec
+from app.services.result_cache import LocalLRUCache, ResultCache
+
+class FakeRedis:
+    """Имитация бинарного клиента Redis поверх словаря"""
+
+    def __init__(self):
+        self.store = {}
+        self.get = AsyncMock(side_effect=lambda key: self.store.get(key))
+        self.set = AsyncMock(side_effect=lambda key, value, ex=None: self.store.__setitem__(key, value))
+        self.delete = AsyncMock(side_effect=lambda key: self.store.pop(key, None))
+        self.publish = AsyncMock()
+
+class FakePubSub:
+    """Подписка, которая отдает сообщения из списка и затем завершается ошибкой (fail=True) или ждет"""
+
+    def __init__(self, messages, fail):
+        self.messages = messages
+        self.fail = fail
+        self.subscribe = AsyncMock()
+        self.unsubscribe = AsyncMock()
+        self.reset = AsyncMock()
+
+    async def listen(self):
+        for message in self.messages:
+            yield message
+        if self.fail:
+            raise ConnectionError("connection lost")
+        await asyncio.Event().wait()
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+class TestLocalLRUCache:
+    def test_get_set(self):
+        cache = LocalLRUCache(max_bytes=100, ttl=60)
+        cache.set("a", {"x": 1}, 10)
+        assert cache.get("a") == {"x": 1}
+        assert cache.get("b") is None
+        assert cache.size == 10
+
+    def test_evicts_least_recently_used_by_size(self):
+        cache = LocalLRUCache(max_bytes=25, ttl=60)
+        cache.set("a", 1, 10)
+        cache.set("b", 2, 10)
+        cache.get("a")
+        cache.set("c", 3, 10)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.size == 20
+        assert cache.evictions == 1
+
+    def test_oversized_entry_is_skipped(self):
+        cache = LocalLRUCache(max_bytes=10, ttl=60)
+        cache.set("a", 1, 11)
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_ttl_expiry(self):
+        cache = LocalLRUCache(max_bytes=100, ttl=5)
+        with patch('app.services.result_cache.time.monotonic', return_value=100.0):
+            cache.set("a", 1, 1)
+        with patch('app.services.result_cache.time.monotonic', return_value=106.0):
+            assert cache.get("a") is None
+        assert cache.size == 0
+
+@pytest.mark.asyncio
+class TestResultCache:
+    async def test_miss(self, redis):
+        cache = ResultCache(LocalLRUCache(max_bytes=1000, ttl=60), redis=redis)
+        assert await cache.get("mri:1") is None
+
+    async def test_redis_hit_fills_local(self, redis):
+        redis.store["mri:1"] = cache_codec.encode({"class_id": 2})
+        cache = ResultCache(LocalLRUCache(max_bytes=1000, ttl=60), redis=redis)
+
+        assert await cache.get("mri:1") == {"class_id": 2}
+        assert await cache.get("mri:1") == {"class_id": 2}
+        # Второе чтение обслуживается локальным уровнем
+        redis.get.assert_awaited_once()
+
+    async def test_local_hit_returns_fresh_copy(self, redis):
+        cache = ResultCache(LocalLRUCache(max_bytes=1000, ttl=60), redis=redis)
+        await cache.set("mri:1", {"findings": ["a"]})
+
+        value = await cache.get("mri:1")
+        value["findings"].append("b")
+        # Каждое попадание декодируется заново: изменение копии не портит кэш
+        assert await cache.get("mri:1") == {"findings": ["a"]}
+        redis.get.assert_not_awaited()
+
+    async def test_set_writes_through_and_publishes(self, redis):
+        cache = ResultCache(LocalLRUCache(max_bytes=1000, ttl=60), expire=60, redis=redis)
+        await cache.set("mri:1", {"class_id": 1})
+
+        assert cache_codec.decode(redis.store["mri:1"]) == {"class_id": 1}
+        assert redis.set.call_args.kwargs["ex"] == 60
+        # Локальный уровень хранит закодированные байты и учитывает их размер
+        assert cache.local.get("mri:1") == redis.store["mri:1"]
+        assert cache.local.size == len(redis.store["mri:1"])
+        redis.publish.assert_awaited_once_with(
+            ResultCache.INVALIDATION_CHANNEL, f"{cache.worker_id}:mri:1"
+        )
+
+    async def test_invalidation_from_other_worker(self, redis):
+        cache = ResultCache(LocalLRUCache(max_bytes=1000, ttl=60), redis=redis)
+        await cache.set("mri:1", {"class_id": 1})
+
+        # Собственное сообщение не сбрасывает запись
+        cache.handle_invalidation(f"{cache.worker_id}:mri:1")
+        assert cache.local.get("mri:1") is not None
+
+        cache.handle_invalidation("other-worker:mri:1")
+        assert cache.local.get("mri:1") is None
+
+    async def test_invalidate(self, redis):
+        cache = ResultCache(LocalLRUCache(max_bytes=1000, ttl=60), redis=redis)
+        await cache.set("mri:1", {"class_id": 1})
+        await cache.invalidate("mri:1")
+
+        assert await cache.get("mri:1") is None
+        assert "mri:1" not in redis.store
+
+    async def test_reads_legacy_json_entries(self, redis):
+        redis.store["mri:1"] = json.dumps({"class_id": 2}).encode()
+        cache = ResultCache(LocalLRUCache(max_bytes=1000, ttl=60), redis=redis)
+        assert await cache.get("mri:1") == {"class_id": 2}
+
+    async def test_not_initialized(self):
+        cache = ResultCache(LocalLRUCache(max_bytes=1000, ttl=60))
+        with pytest.raises(CacheError):
+            await cache.get("mri:1")
+
+    async def test_listener_resubscribes_and_bypasses_local_until_then(self, redis):
+        cache = ResultCache(LocalLRUCache(max_bytes=1000, ttl=60), redis=redis)
+        cache.RESUBSCRIBE_DELAY = 0.05
+        await cache.set("mri:1", {"class_id": 1})
+        first = FakePubSub([{"type": "message", "data": b"other:mri:2"}], fail=True)
+        second = FakePubSub([], fail=False)
+        subscriptions = iter([first, second])
+        redis.pubsub = lambda: next(subscriptions)
+
+        await cache.start_listener(redis)
+        await asyncio.sleep(0.01)
+        # Подписка потеряна: локальный уровень очищен и не используется
+        assert cache.local_enabled is False and len(cache.local) == 0
+        await cache.get("mri:1")
+        assert len(cache.local) == 0
+        assert redis.get.await_count == 1
+
+        await asyncio.sleep(0.1)
+        assert cache.local_enabled is True
+        second.subscribe.assert_awaited_once_with(ResultCache.INVALIDATION_CHANNEL)
+        first.reset.assert_awaited_once()
+        await cache.get("mri:1")
+        assert cache.local.get("mri:1") is not None
+
+        await cache.stop_listener()
+        second.unsubscribe.assert_awaited_once()
@@ -0,0 +1,112 @@
+import threading
+import pytest
+import pytest_asyncio
+import numpy as np
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from unittest.mock import AsyncMock, patch
+from app.api.endpoints import router, result_cache_key
+from app.services.content_hash import content_digest
+
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+DIGEST = content_digest(b"mri scan")
+ANALYSIS = {
+    "classification": {
+        "class_name": "NonDemented", "confidence": 0.9, "class_id": 2,
+        "probabilities": {"MildDemented": 0.05, "ModerateDemented": 0.02,
+                          "NonDemented": 0.9, "VeryMildDemented": 0.03}
+    },
+    "interpretation": {"findings": [], "recommendations": [], "severity": "moderate"},
+    "processing_time": 1.0,
+    "model_version": "1.0.0"
+}
+
+@pytest_asyncio.fixture
+async def client():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+@pytest.fixture
+def store():
+    store = {}
+    with patch('app.api.endpoints.result_cache.get', AsyncMock(side_effect=lambda key: store.get(key))), \
+            patch('app.api.endpoints.stage_cache.get_array', AsyncMock(return_value=None)) as mock_stage:
+        store["stage"] = mock_stage
+        yield store
+
+@pytest.mark.asyncio
+class TestResultsEndpoint:
+    async def test_miss(self, client, store):
+        response = await client.get(f"/api/results/{DIGEST}")
+        assert response.status_code == 404
+        assert (await client.head(f"/api/results/{DIGEST}")).status_code == 404
+
+    async def test_invalid_digest(self, client, store):
+        assert (await client.get("/api/results/not-a-digest")).status_code == 422
+
+    async def test_hit_with_etag(self, client, store):
+        store[result_cache_key(DIGEST)] = ANALYSIS
+        response = await client.get(f"/api/results/{DIGEST}")
+        assert response.status_code == 200
+        assert response.json() == ANALYSIS
+        etag = response.headers["etag"]
+
+        head = await client.head(f"/api/results/{DIGEST}")
+        assert head.status_code == 200
+        assert head.content == b""
+        for header in ("etag", "content-length", "content-type", "cache-control"):
+            assert head.headers[header] == response.headers[header]
+
+        cached = await client.get(f"/api/results/{DIGEST}", headers={"If-None-Match": f'"other", W/{etag}'})
+        assert cached.status_code == 304
+        assert cached.content == b""
+
+    async def test_etag_changes_with_recomputed_result(self, client, store):
+        store[result_cache_key(DIGEST)] = ANALYSIS
+        etag = (await client.get(f"/api/results/{DIGEST}")).headers["etag"]
+
+        # Тот же ключ после повторного анализа (истек TTL) - другое тело и ETag
+        store[result_cache_key(DIGEST)] = {**ANALYSIS, "processing_time": 2.0}
+        response = await client.get(f"/api/results/{DIGEST}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert response.json()["processing_time"] == 2.0
+
+    async def test_evicted_artifacts_checked_off_event_loop(self, client, store):
+        store[result_cache_key(DIGEST)] = {**ANALYSIS, "interpretation": {
+            **ANALYSIS["interpretation"], "additional_info": {"heatmap_url": "/api/artifacts/heatmap-" + "0" * 32}}}
+        threads = []
+
+        def missing(value):
+            threads.append(threading.get_ident())
+            return True
+
+        with patch('app.api.endpoints.artifact_store.missing', side_effect=missing):
+            response = await client.get(f"/api/results/{DIGEST}")
+        # Изображение вытеснено: результат не отдается, диск проверяется не в event loop
+        assert response.status_code == 404
+        assert threads and threading.get_ident() not in threads
+
+    async def test_classification_only_entry_is_not_analysis(self, client, store):
+        store[result_cache_key(DIGEST)] = ANALYSIS["classification"]
+        assert (await client.get(f"/api/results/{DIGEST}")).status_code == 404
+        response = await client.get(f"/api/results/{DIGEST}", params={"view": "classification"})
+        assert response.json() == ANALYSIS["classification"]
+
+    async def test_classification_from_full_analysis(self, client, store):
+        store[result_cache_key(DIGEST)] = ANALYSIS
+        response = await client.get(f"/api/results/{DIGEST}", params={"view": "classification"})
+        assert response.json() == ANALYSIS["classification"]
+
+    async def test_classification_from_stage_cache(self, client, store):
+        store["stage"].return_value = np.array([[0.1, 0.2, 0.6, 0.1]])
+        response = await client.get(f"/api/results/{DIGEST}", params={"view": "classification"})
+        assert response.status_code == 200
+        assert response.json()["class_name"] == "NonDemented"
+
+    async def test_attribution_selects_entry(self, client, store):
+        store[result_cache_key(DIGEST)] = ANALYSIS
+        response = await client.get(f"/api/results/{DIGEST}", params={"attribution": "smoothgrad"})
+        assert response.status_code == 404
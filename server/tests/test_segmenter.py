@@ -0,0 +1,62 @@
+import pytest
+import numpy as np
+from unittest.mock import patch
+from app.models.Segmenter import Segmenter
+from app.models.LIMExplainer import LIMExplainer
+
+@pytest.fixture
+def sample_image():
+    return np.random.RandomState(0).rand(224, 224, 3)
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    Segmenter.clear_cache()
+    yield
+    Segmenter.clear_cache()
+
+class TestSegmenter:
+    @pytest.mark.parametrize("algorithm", ["quickshift", "slic", "felzenszwalb", "grid"])
+    def test_segments_contiguous(self, algorithm, sample_image):
+        segments = Segmenter(algorithm)(sample_image)
+
+        assert segments.shape == (224, 224)
+        labels = np.unique(segments)
+        # Метки сегментов - индексы признаков LIME без пропусков
+        np.testing.assert_array_equal(labels, np.arange(len(labels)))
+
+    def test_grid(self, sample_image):
+        segments = Segmenter('grid', grid_size=4)(sample_image)
+        assert len(np.unique(segments)) == 16
+        assert segments[0, 0] == 0
+        assert segments[-1, -1] == 15
+
+    def test_unknown_algorithm(self):
+        with pytest.raises(ValueError):
+            Segmenter('watershed')
+
+    def test_cache_hit(self, sample_image):
+        segmenter = Segmenter('slic')
+        with patch.object(Segmenter, '_segment', wraps=segmenter._segment) as mock_segment:
+            first = segmenter(sample_image)
+            second = segmenter(sample_image.copy())
+            assert mock_segment.call_count == 1
+        np.testing.assert_array_equal(first, second)
+
+    def test_cache_key_depends_on_params(self, sample_image):
+        assert Segmenter('slic').cache_key(sample_image) != Segmenter('slic', n_segments=100).cache_key(sample_image)
+        assert Segmenter('slic').cache_key(sample_image) != Segmenter('slic').cache_key(sample_image * 0.5)
+
+    def test_cache_bounded(self, sample_image):
+        segmenter = Segmenter('grid', cache_size=2)
+        for i in range(4):
+            segmenter(sample_image + i)
+        assert len(Segmenter._cache) == 2
+
+    def test_lime_explainer_segmenter(self, sample_image):
+        class MockModel:
+            def predict(self, x):
+                return np.tile([0.25, 0.25, 0.25, 0.25], (len(x), 1))
+
+        explainer = LIMExplainer(MockModel(), num_samples=50, segmenter='grid')
+        explanation = explainer.explain(sample_image)
+        assert explanation.segments.max() == 63
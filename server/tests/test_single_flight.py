@@ -0,0 +1,115 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.services.single_flight import SingleFlight
+
+class FakeRedis:
+    """Минимальная имитация SET NX / EXISTS / EVAL для lease"""
+
+    def __init__(self):
+        self.store = {}
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+    async def exists(self, key):
+        return int(key in self.store)
+
+    async def eval(self, script, numkeys, key, token):
+        if self.store.get(key) == token:
+            del self.store[key]
+            return 1
+        return 0
+
+@pytest.fixture
+def no_redis():
+    with patch('fastapi_cache.FastAPICache.get_backend', side_effect=AssertionError("not initialized")):
+        yield
+
+@pytest.fixture
+def redis():
+    redis = FakeRedis()
+    backend = MagicMock()
+    backend.redis = redis
+    with patch('fastapi_cache.FastAPICache.get_backend', return_value=backend):
+        yield redis
+
+@pytest.mark.asyncio
+class TestSingleFlight:
+    async def test_concurrent_calls_share_one_computation(self, no_redis):
+        flight = SingleFlight()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return {"result": calls}
+
+        results = await asyncio.gather(*[
+            flight.do("mri:1", compute, AsyncMock(return_value=None)) for _ in range(5)
+        ])
+        assert calls == 1
+        assert all(result == {"result": 1} for result in results)
+        assert flight._inflight == {}
+
+    async def test_error_propagates_to_all_waiters(self, no_redis):
+        flight = SingleFlight()
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise ValueError("LIME error")
+
+        results = await asyncio.gather(*[
+            flight.do("mri:1", compute, AsyncMock(return_value=None)) for _ in range(3)
+        ], return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert flight._inflight == {}
+
+    async def test_cancelled_leader_does_not_cancel_followers(self, no_redis):
+        flight = SingleFlight()
+
+        async def compute():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.ensure_future(flight.do("mri:1", compute, AsyncMock(return_value=None)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("mri:1", compute, AsyncMock(return_value=None)))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "done"
+
+    async def test_leader_takes_and_releases_lease(self, redis):
+        flight = SingleFlight(lease_ttl=5)
+        compute = AsyncMock(return_value="result")
+
+        assert await flight.do("mri:1", compute, AsyncMock(return_value=None)) == "result"
+        compute.assert_awaited_once()
+        assert redis.store == {}
+
+    async def test_follower_waits_for_other_worker(self, redis):
+        # Lease держит другой воркер; результат появляется в кэше через несколько опросов
+        redis.store["mri:lease:mri:1"] = "other-worker"
+        flight = SingleFlight(lease_ttl=5, poll_interval=0.01)
+        compute = AsyncMock(return_value="local")
+        fetch = AsyncMock(side_effect=[None, None, "remote"])
+
+        assert await flight.do("mri:1", compute, fetch) == "remote"
+        compute.assert_not_awaited()
+
+    async def test_follower_computes_when_leader_gives_up(self, redis):
+        redis.store["mri:lease:mri:1"] = "other-worker"
+        flight = SingleFlight(lease_ttl=5, poll_interval=0.01)
+
+        async def fetch():
+            # Лидер упал: lease снят, результата нет
+            redis.store.pop("mri:lease:mri:1", None)
+            return None
+
+        compute = AsyncMock(return_value="local")
+        assert await flight.do("mri:1", compute, fetch) == "local"
+        compute.assert_awaited_once()
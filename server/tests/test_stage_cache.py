@@ -0,0 +1,55 @@
+import pytest
+import numpy as np
+from unittest.mock import AsyncMock, MagicMock
+from PIL import Image
+from app.models.ImageProcessor import ImageProcessor
+from app.services.stage_cache import StageCache
+
+@pytest.fixture
+def cache():
+    # Имитация ResultCache поверх словаря
+    store = {}
+    cache = MagicMock()
+    cache.get = AsyncMock(side_effect=lambda key: store.get(key))
+    cache.set = AsyncMock(side_effect=lambda key, value: store.__setitem__(key, value))
+    cache.store = store
+    return cache
+
+class TestStageCache:
+    def test_key_includes_namespace_and_sorted_params(self, cache):
+        stage_cache = StageCache(cache, namespace="v2")
+        assert stage_cache.key("probabilities", "abc-10") == "mri:v2:stage:probabilities:abc-10"
+        assert (stage_cache.key("lime", "abc-10", segmenter="slic", num_samples=1000)
+                == "mri:v2:stage:lime:abc-10:num_samples=1000,segmenter=slic")
+
+    def test_array_roundtrip(self):
+        array = np.random.rand(1, 4).astype(np.float32)
+        decoded = StageCache.decode_array(StageCache.encode_array(array))
+        assert decoded.dtype == np.float32
+        np.testing.assert_array_equal(decoded, array)
+
+    def test_tensor_roundtrip_is_lossless(self):
+        rng = np.random.default_rng(0)
+        img = Image.fromarray(rng.integers(0, 256, (300, 300, 3), dtype=np.uint8))
+        img_array = ImageProcessor.preprocess(img)
+        np.testing.assert_array_equal(StageCache.decode_tensor(StageCache.encode_tensor(img_array)), img_array)
+
+    @pytest.mark.asyncio
+    async def test_get_set(self, cache):
+        stage_cache = StageCache(cache, namespace="v1")
+        assert await stage_cache.get_array("probabilities", "abc-10") is None
+
+        await stage_cache.set_array("probabilities", "abc-10", np.array([[0.1, 0.2, 0.3, 0.4]]))
+        np.testing.assert_array_equal(
+            await stage_cache.get_array("probabilities", "abc-10"), [[0.1, 0.2, 0.3, 0.4]]
+        )
+        # Другая версия модели - другое пространство имен
+        assert await StageCache(cache, namespace="v2").get("probabilities", "abc-10") is None
+
+    @pytest.mark.asyncio
+    async def test_cache_errors_are_misses(self, cache):
+        cache.get.side_effect = Exception("Redis down")
+        cache.set.side_effect = Exception("Redis down")
+        stage_cache = StageCache(cache)
+        assert await stage_cache.get("probabilities", "abc-10") is None
+        await stage_cache.set("probabilities", "abc-10", {"x": 1})